@@ -2,8 +2,18 @@
 # -*- coding: utf-8 -*-
 """
 カロリーとPFCの計算ロジック
+計算式は共有の nutrition_core（sekiguchi_bot・line_bot と同じ実装）を使い、
+ここではこのアプリの引数・丸め方に合わせる
 """
 
+import os
+import sys
+
+# リポジトリ直下の nutrition_core をインポートできるようにする
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+import nutrition_core
+
 
 def calculate_bmr(gender, weight, height, age):
     """
@@ -18,14 +28,7 @@ def calculate_bmr(gender, weight, height, age):
     Returns:
         float: 基礎代謝量（kcal/日）
     """
-    if gender == "男性":
-        # 男性: (13.397×体重kg)+(4.799×身長cm)-(5.677×年齢)+88.362
-        bmr = (13.397 * weight) + (4.799 * height) - (5.677 * age) + 88.362
-    else:  # 女性
-        # 女性: (9.247×体重kg)+(3.098×身長cm)-(4.330×年齢)+447.593
-        bmr = (9.247 * weight) + (3.098 * height) - (4.330 * age) + 447.593
-
-    return bmr
+    return nutrition_core.calculate_bmr(gender, weight, height, age)
 
 
 def calculate_tdee(bmr, activity_coefficient=1.4):
@@ -39,7 +42,7 @@ def calculate_tdee(bmr, activity_coefficient=1.4):
     Returns:
         float: 総消費カロリー（kcal/日）
     """
-    return bmr * activity_coefficient
+    return nutrition_core.calculate_tdee(bmr, activity_coefficient)
 
 
 def calculate_target_calories(tdee, reduction_rate):
@@ -53,21 +56,10 @@ def calculate_target_calories(tdee, reduction_rate):
     Returns:
         float: 目標カロリー（kcal/日）
     """
-    # 月の減量ペースを1日あたりに換算
-    # 例: 月2% → 1日あたり約0.0007%の減量
-    # 7200kcal = 体重1kg相当のカロリー赤字
-    # 目標カロリー = TDEE - (TDEEの一定割合)
-    
     # シンプルに、TDEEから一定のカロリーを引く
     # 月2%の場合: TDEEの約15%減
     # 月4%の場合: TDEEの約25%減
-    
-    if reduction_rate == 0.02:  # ライトモード
-        calorie_reduction_rate = 0.15
-    else:  # ハードモード (0.04)
-        calorie_reduction_rate = 0.25
-    
-    target_calories = tdee * (1 - calorie_reduction_rate)
+    target_calories = nutrition_core.ratio_target_calories(tdee, reduction_rate)
     return round(target_calories, 2)
 
 
@@ -84,13 +76,9 @@ def calculate_pfc_targets(target_calories, protein_ratio=0.30, fat_ratio=0.20, c
     Returns:
         dict: {protein, fat, carbs} グラム数
     """
-    # タンパク質: 4kcal/g
-    # 脂質: 9kcal/g
-    # 炭水化物: 4kcal/g
-
-    protein_grams = (target_calories * protein_ratio) / 4
-    fat_grams = (target_calories * fat_ratio) / 9
-    carbs_grams = (target_calories * carb_ratio) / 4
+    protein_grams, fat_grams, carbs_grams = nutrition_core.pfc_grams(
+        target_calories, (protein_ratio, fat_ratio, carb_ratio)
+    )
 
     return {
         'protein': round(protein_grams, 1),
@@ -125,14 +113,9 @@ def calculate_pfc_percentage(protein_grams, fat_grams, carbs_grams):
     Returns:
         dict: {protein_percent, fat_percent, carb_percent}
     """
-    total_calories = (protein_grams * 4) + (fat_grams * 9) + (carbs_grams * 4)
-
-    if total_calories == 0:
-        return {'protein_percent': 0, 'fat_percent': 0, 'carb_percent': 0}
-
-    protein_percent = (protein_grams * 4 / total_calories) * 100
-    fat_percent = (fat_grams * 9 / total_calories) * 100
-    carb_percent = (carbs_grams * 4 / total_calories) * 100
+    protein_percent, fat_percent, carb_percent = nutrition_core.pfc_percentage(
+        protein_grams, fat_grams, carbs_grams
+    )
 
     return {
         'protein_percent': round(protein_percent),
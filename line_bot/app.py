@@ -6,7 +6,8 @@
 
 import os
 import sys
-from flask import Flask, request, abort
+import atexit
+from flask import Flask, request, abort, send_from_directory, jsonify
 from linebot import LineBotApi, WebhookHandler
 from linebot.exceptions import InvalidSignatureError
 from linebot.models import (
@@ -26,6 +27,13 @@ from database import Database
 from message_handler import MessageHandler
 from rich_menu import RichMenuManager
 from reminder import ReminderService
+from webhook_queue import WebhookQueue, SQLiteQueueBackend
+from chart_cache import ChartCache
+from line_transport import PooledHttpClient
+from outbound_scheduler import OutboundScheduler
+from event_dedup import EventDeduplicator
+from session_store import ConversationStateStore, RedisStateBackend
+from sekiguchi_bot.chart_renderer import ChartRenderService
 
 app = Flask(__name__)
 
@@ -37,20 +45,71 @@ if not LINE_CHANNEL_ACCESS_TOKEN or not LINE_CHANNEL_SECRET:
     print("エラー: 環境変数 LINE_CHANNEL_ACCESS_TOKEN と LINE_CHANNEL_SECRET を設定してください")
     sys.exit(1)
 
-line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
+# LINE APIへの通信は接続を使い回し、429/5xxはリトライする（設定は LINE_HTTP_* 環境変数）
+line_bot_api = LineBotApi(
+    LINE_CHANNEL_ACCESS_TOKEN,
+    timeout=float(os.getenv('LINE_HTTP_TIMEOUT', 10)),
+    http_client=PooledHttpClient
+)
 handler = WebhookHandler(LINE_CHANNEL_SECRET)
 
 # データベース初期化
 db = Database()
 
+# 再送されたWebhookイベント（同じ webhookEventId）は処理しない
+event_dedup = EventDeduplicator(
+    db,
+    max_entries=int(os.getenv('EVENT_DEDUP_MAX_ENTRIES', 10000)),
+    retention_seconds=float(os.getenv('EVENT_DEDUP_RETENTION_DAYS', 3)) * 24 * 60 * 60
+)
+
+# グラフ画像キャッシュ（PUBLIC_BASE_URL を設定するとグラフ画像を送信）
+PUBLIC_BASE_URL = os.getenv('PUBLIC_BASE_URL')
+chart_cache = ChartCache(
+    directory=os.getenv('CHART_CACHE_DIR', 'chart_cache'),
+    max_bytes=int(os.getenv('CHART_CACHE_MAX_MB', 200)) * 1024 * 1024,
+    base_url=f"{PUBLIC_BASE_URL.rstrip('/')}/charts" if PUBLIC_BASE_URL else None
+)
+chart_renderer = ChartRenderService()
+
+# LINE APIの送信スケジューラー（返信を優先し、リマインダー一斉配信はレートの残りで送る）
+outbound_scheduler = OutboundScheduler(
+    workers=int(os.getenv('OUTBOUND_WORKERS', 4)),
+    interactive_workers=int(os.getenv('OUTBOUND_INTERACTIVE_WORKERS', 2)),
+    bulk_queue_size=int(os.getenv('OUTBOUND_BULK_QUEUE_SIZE', 100))
+)
+
+# 会話状態ストア（会話状態はメモリに持ち、データベースへはまとめて書き戻す）
+# STATE_REDIS_URL を指定するとRedis互換サーバーに保持する（複数プロセスで共有）
+STATE_REDIS_URL = os.getenv('STATE_REDIS_URL')
+state_store = ConversationStateStore(
+    db,
+    ttl_seconds=float(os.getenv('STATE_TTL_SECONDS', 30 * 60)),
+    flush_interval=float(os.getenv('STATE_FLUSH_INTERVAL', 2.0)),
+    backend=RedisStateBackend(STATE_REDIS_URL) if STATE_REDIS_URL else None
+)
+
 # メッセージハンドラー初期化
-message_handler = MessageHandler(db, line_bot_api)
+message_handler = MessageHandler(db, line_bot_api, chart_cache, chart_renderer, outbound_scheduler,
+                                 state_store)
 
 # リッチメニュー初期化
 rich_menu_manager = RichMenuManager(line_bot_api)
 
 # リマインダーサービス初期化
-reminder_service = ReminderService(db, line_bot_api)
+reminder_service = ReminderService(db, line_bot_api, outbound_scheduler=outbound_scheduler)
+
+# Webhook受信キュー（LINEには即座に200を返し、処理はワーカーで行う）
+# WEBHOOK_QUEUE_DB を指定すると、未処理のWebhookを再起動後も引き継ぐ
+WEBHOOK_QUEUE_DB = os.getenv('WEBHOOK_QUEUE_DB')
+webhook_queue = WebhookQueue(
+    process_func=handler.handle,
+    maxsize=int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000)),
+    workers=int(os.getenv('WEBHOOK_WORKERS', 4)),
+    backend=SQLiteQueueBackend(WEBHOOK_QUEUE_DB) if WEBHOOK_QUEUE_DB else None
+)
+# キューが満杯のときに空きを待つ秒数（待っても空かなければ503を返す）
+WEBHOOK_QUEUE_PUT_TIMEOUT = float(os.getenv('WEBHOOK_QUEUE_PUT_TIMEOUT', 0.5))
 
 # スケジューラー設定（毎日10時にリマインダー送信）
 scheduler = BackgroundScheduler(timezone=pytz.timezone('Asia/Tokyo'))
@@ -61,6 +120,45 @@ scheduler.add_job(
     name='毎日10時のリマインダー',
     replace_existing=True
 )
+
+
+def run_nightly_risk_sweep():
+    """全ユーザーの挫折リスクを一括判定してログに出す"""
+    # NumPyは起動時間を延ばすので、夜間バッチの実行時に読み込む
+    from risk_sweep import RiskSweep
+
+    started = datetime.datetime.now()
+    table = RiskSweep(db).run()
+    elapsed = (datetime.datetime.now() - started).total_seconds()
+    high_count = sum(1 for row in table if row['risk_level'] == 'high')
+    print(f"[{started}] 挫折リスク判定: 要注意{len(table)}人（高リスク{high_count}人）, {elapsed:.1f}秒")
+
+
+# 毎日3時に挫折リスクを一括判定
+scheduler.add_job(
+    func=run_nightly_risk_sweep,
+    trigger=CronTrigger(hour=3, minute=0),
+    id='nightly_risk_sweep',
+    name='毎日3時の挫折リスク判定',
+    replace_existing=True
+)
+
+# 毎日3時30分に保持期間を過ぎた処理済みイベントIDを削除
+scheduler.add_job(
+    func=event_dedup.prune,
+    trigger=CronTrigger(hour=3, minute=30),
+    id='prune_webhook_events',
+    name='毎日3時30分の処理済みイベント削除',
+    replace_existing=True
+)
+
+# バックグラウンド処理を開始
+# グラフ描画プロセスは、起動中に __main__ を差し替えるので他のスレッドを動かす前に起動する
+chart_renderer.start()
+outbound_scheduler.start()
+state_store.start()
+atexit.register(state_store.stop)
+webhook_queue.start()
 scheduler.start()
 
 
@@ -72,15 +170,23 @@ def callback():
 
     app.logger.info("Request body: " + body)
 
+    # 署名だけ同期で検証し、処理はキューに任せる
     try:
-        handler.handle(body, signature)
+        handler.parser.parse(body, signature)
     except InvalidSignatureError:
         abort(400)
 
+    if not webhook_queue.submit(body, signature, timeout=WEBHOOK_QUEUE_PUT_TIMEOUT):
+        # ここで処理すると同じユーザーの先行イベントを処理中のワーカーと順番が入れ替わるので、
+        # 503を返してLINEに再送してもらう
+        app.logger.warning("Webhook queue is full, asking LINE to redeliver")
+        abort(503)
+
     return 'OK'
 
 
 @handler.add(MessageEvent, message=TextMessage)
+@event_dedup.once
 def handle_message(event):
     """テキストメッセージを受信したときの処理"""
     user_id = event.source.user_id
@@ -90,12 +196,28 @@ def handle_message(event):
     message_handler.handle_text_message(user_id, text, event)
 
 
+@app.route("/charts/<path:filename>")
+def chart_image(filename):
+    """キャッシュしたグラフ画像を配信（ファイル名はデータのハッシュなので長期キャッシュ可）"""
+    return send_from_directory(chart_cache.directory, filename,
+                               mimetype='image/png', max_age=365 * 24 * 60 * 60)
+
+
 @app.route("/")
 def index():
     """ヘルスチェック用エンドポイント"""
     return "卒業型ダイエットメンター LINE Bot is running!"
 
 
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    """LINE APIの呼び出し回数・リトライ・レイテンシ（APIごと）と送信スケジューラーの状態"""
+    return jsonify({
+        'line_api': line_bot_api.http_client.metrics.snapshot(),
+        'outbound': outbound_scheduler.stats(),
+    })
+
+
 @app.route("/setup_rich_menu", methods=['GET'])
 def setup_rich_menu():
     """リッチメニューをセットアップ（初回のみ実行）"""
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+グラフ画像キャッシュ
+ユーザーID・グラフ種類・元データのハッシュをファイル名にしてPNGを保存し、
+データが変わっていなければ描画せずに同じURLを返す
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+class ChartCache:
+    """
+    容量上限つきのディスク上のグラフ画像キャッシュ
+
+    保存済みの画像と合計サイズは、起動時にディレクトリを1回読み込んでメモリ上の索引で管理する
+    （使われた順に並べ、容量を超えたら古いものから削除）。保存・削除のたびにディレクトリを読み直さない。
+    """
+
+    def __init__(self, directory='chart_cache', max_bytes=200 * 1024 * 1024, base_url=None):
+        """
+        初期化
+
+        Args:
+            directory (str): 画像を保存するディレクトリ
+            max_bytes (int): 保存する画像の合計サイズの上限（超えたら古いものから削除）
+            base_url (str, optional): 画像を公開するURL（例: https://example.com/charts）
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        # {ファイル名: サイズ}（使われた順、先頭が最も古い）と合計サイズ
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.png'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self._total_bytes += size
+
+    @staticmethod
+    def _user_prefix(user_id: str) -> str:
+        # LINEのユーザーIDをURLに出さないようハッシュ化する
+        return hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:16]
+
+    def filename_for(self, user_id: str, chart_type: str, data) -> str:
+        """
+        キャッシュのファイル名を求める（データが同じなら常に同じ名前）
+
+        Args:
+            user_id (str): ユーザーID
+            chart_type (str): グラフの種類（例: 'weight'）
+            data: グラフの元データ（JSONに変換できる値）
+
+        Returns:
+            str: ファイル名
+        """
+        fingerprint = hashlib.sha256(
+            json.dumps([user_id, chart_type, data], sort_keys=True, ensure_ascii=False).encode('utf-8')
+        ).hexdigest()[:32]
+        return f"{self._user_prefix(user_id)}_{chart_type}_{fingerprint}.png"
+
+    def url_for(self, filename: str) -> str:
+        """ファイル名から公開URLを作る（base_url 未設定の場合はNone）"""
+        if not self.base_url:
+            return None
+        return f"{self.base_url}/{filename}"
+
+    def get(self, user_id: str, chart_type: str, data):
+        """
+        キャッシュ済みの画像のファイル名を取得
+
+        Returns:
+            str or None: ファイル名（キャッシュにない場合はNone）
+        """
+        filename = self.filename_for(user_id, chart_type, data)
+        with self._lock:
+            if filename not in self._entries:
+                return None
+            self._entries.move_to_end(filename)
+        # 再起動後も使われた順を引き継げるよう、更新時刻を使用時刻として扱う
+        try:
+            os.utime(os.path.join(self.directory, filename))
+        except FileNotFoundError:
+            self._forget(filename)
+            return None
+        return filename
+
+    def put(self, user_id: str, chart_type: str, data, png_bytes: bytes) -> str:
+        """
+        画像を保存し、容量上限を超えていれば古いものから削除
+
+        Returns:
+            str: ファイル名
+        """
+        filename = self.filename_for(user_id, chart_type, data)
+        path = os.path.join(self.directory, filename)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(png_bytes)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total_bytes += len(png_bytes) - self._entries.pop(filename, 0)
+            self._entries[filename] = len(png_bytes)
+            evicted = self._evict()
+
+        for name in evicted:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        return filename
+
+    def _forget(self, filename: str):
+        """索引から画像を外す（ファイルが外部で削除されていた場合）"""
+        with self._lock:
+            size = self._entries.pop(filename, None)
+            if size is not None:
+                self._total_bytes -= size
+
+    def _evict(self):
+        """容量上限を超えた分を古いものから索引から外し、削除するファイル名を返す（ロック内で呼ぶ）"""
+        evicted = []
+        # 最後に保存した1件は残す
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            evicted.append(name)
+        return evicted
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+会話フロー（状態機械）
+登録・日々の記録の各ステップ（入力の検証・保存先・次の状態・メッセージ）を1つの表で定義し、
+起動時に状態名→ステップの辞書にコンパイルして、1回の辞書引きで処理する
+
+負荷試験用に、LINEやデータベースを使わずに大量の会話を再生するモードがある:
+    python conversation_flow.py --replay 10000
+"""
+
+import argparse
+import random
+import time
+from collections import namedtuple
+
+
+# 状態遷移の結果
+#   accepted: 入力を受け付けたか（Falseなら状態はそのままでエラーメッセージを返す）
+#   next_state: 次の状態
+#   user_updates: ユーザー情報の更新内容
+#   record_updates: 今日の記録の更新内容
+#   replies: 送信するメッセージ [(テキスト, クイックリプライのラベル), ...]
+#   action: 遷移後に呼び出し側で行う処理の名前（例: 'complete_registration'）
+Transition = namedtuple('Transition', 'accepted next_state user_updates record_updates replies action')
+
+
+class _FormatValues(dict):
+    """テンプレートに存在しない値は空文字にする"""
+
+    def __missing__(self, key):
+        return ''
+
+
+# ===== 入力の検証・変換 =====
+# いずれも (入力テキスト, 現在の値) を受け取り、変換した値を返す。不正な入力は ValueError
+
+def parse_text(text, values):
+    text = text.strip()
+    if not text:
+        raise ValueError
+    return text
+
+
+def parse_int_range(low, high):
+    def parse(text, values):
+        value = int(text.strip())
+        if not low <= value <= high:
+            raise ValueError
+        return value
+    return parse
+
+
+def parse_float_range(low, high):
+    def parse(text, values):
+        value = float(text.strip())
+        if not low < value < high:
+            raise ValueError
+        return value
+    return parse
+
+
+def parse_target_weight(text, values):
+    value = float(text.strip())
+    current_weight = values.get('current_weight') or 0
+    if not 0 < value < current_weight:
+        raise ValueError
+    return value
+
+
+# ===== フロー定義 =====
+# state: 状態名
+# prompt: この状態に入ったときに送るメッセージ（{name} などユーザー情報で埋める）
+# choices: 選択肢 {ラベル: 保存する値の辞書}（クイックリプライに表示）
+# parse / field: 自由入力の検証関数と保存先の項目名
+# target: 保存先（'user' または 'record'）
+# also: 同じ値を保存する他のユーザー項目
+# next: 次の状態
+# error: 入力が不正な場合のメッセージ
+# action: 次の状態に遷移した後に呼び出し側で行う処理
+
+REGISTRATION_FLOW = [
+    {
+        'state': 'register_name',
+        'prompt': '【お名前】何とお呼びすればよいですか？',
+        'parse': parse_text, 'field': 'name', 'target': 'user',
+        'next': 'register_gender',
+        'error': '⚠️ お名前を入力してください',
+    },
+    {
+        'state': 'register_gender',
+        'prompt': '{name}さん、よろしくお願いします！\n\n【性別】性別を教えてください',
+        'choices': {
+            '男性': {'gender': '男性'},
+            '女性': {'gender': '女性'},
+        },
+        'next': 'register_age',
+        'error': '⚠️ 「男性」または「女性」を選んでください',
+    },
+    {
+        'state': 'register_age',
+        'prompt': '【年齢】年齢を教えてください\n（数字のみ入力してください。例: 35）',
+        'parse': parse_int_range(1, 119), 'field': 'age', 'target': 'user',
+        'next': 'register_height',
+        'error': '⚠️ 正しい年齢を数字で入力してください（例: 35）',
+    },
+    {
+        'state': 'register_height',
+        'prompt': '【身長】身長は何cmですか？\n（数字のみ入力してください。例: 170）',
+        'parse': parse_float_range(0, 250), 'field': 'height', 'target': 'user',
+        'next': 'register_activity',
+        'error': '⚠️ 正しい身長を数字で入力してください（例: 170）',
+    },
+    {
+        'state': 'register_activity',
+        'prompt': ('【活動レベル】普段の活動レベルを選択してください\n\n'
+                   '低い：座り仕事中心\n'
+                   'やや低い：日常生活+週1回程度運動\n'
+                   '中程度：週3回トレーニング\n'
+                   '高い：週4~5回トレーニング\n'
+                   '非常に高い：肉体労働+週5回以上トレーニング'),
+        'choices': {
+            '低い': {'activity_level': '低い', 'activity_coefficient': 1.2},
+            'やや低い': {'activity_level': 'やや低い', 'activity_coefficient': 1.375},
+            '中程度': {'activity_level': '中程度', 'activity_coefficient': 1.55},
+            '高い': {'activity_level': '高い', 'activity_coefficient': 1.725},
+            '非常に高い': {'activity_level': '非常に高い', 'activity_coefficient': 1.9},
+        },
+        'next': 'register_mode',
+        'error': '⚠️ 活動レベルを選択してください',
+    },
+    {
+        'state': 'register_mode',
+        'prompt': ('【ダイエットモード】どのペースで進めますか？\n\n'
+                   'ライトモード：月に体重の2%ペース（無理なく続けたい方に）\n'
+                   'ハードモード：月に体重の4%ペース（しっかり結果を出したい方に）'),
+        'choices': {
+            'ライトモード': {'diet_mode': 'ライトモード', 'reduction_rate': 0.02},
+            'ハードモード': {'diet_mode': 'ハードモード', 'reduction_rate': 0.04},
+        },
+        'next': 'register_current_weight',
+        'error': '⚠️ 「ライトモード」または「ハードモード」を選んでください',
+    },
+    {
+        'state': 'register_current_weight',
+        'prompt': '【現在の体重】現在の体重は何kgですか？\n（数字のみ入力してください。例: 75.5）',
+        'parse': parse_float_range(0, 500), 'field': 'current_weight', 'target': 'user',
+        'also': ('initial_weight',),
+        'next': 'register_target_weight',
+        'error': '⚠️ 正しい体重を数字で入力してください（例: 75.5）',
+    },
+    {
+        'state': 'register_target_weight',
+        'prompt': '【目標体重】目標体重は何kgですか？',
+        'parse': parse_target_weight, 'field': 'target_weight', 'target': 'user',
+        'next': 'register_plan',
+        'error': '⚠️ 目標体重は現在の体重より軽い数字で入力してください（ダイエット専用です）',
+    },
+    {
+        'state': 'register_plan',
+        'prompt': '【プラン】990円プラン（ライトモード・ハードモードどちらも利用可、いつでも解約可能）でよろしいですか？',
+        'choices': {
+            '990円プラン': {'plan_name': '990円プラン'},
+        },
+        'next': 'active',
+        'error': '⚠️ 「990円プラン」を選んでください',
+        'action': 'complete_registration',
+    },
+]
+
+DAILY_INPUT_FLOW = [
+    {
+        'state': 'daily_weight',
+        'prompt': ('📅 {current_day}日目 / {duration_days}日\n\n'
+                   '{name}さん、今日の記録を始めましょう！\n\n'
+                   '【体重】今日の体重は何kgですか？\n（数字のみ入力してください。例: 75.5）'),
+        'parse': parse_float_range(0, 500), 'field': 'weight', 'target': 'record',
+        'also': ('current_weight',),
+        'next': 'daily_exercise',
+        'error': '⚠️ 数字で入力してください（例: 75.5）',
+    },
+    {
+        'state': 'daily_exercise',
+        'prompt': 'ありがとうございます！\n\n【運動】今日やった運動を教えてください\n（例: 30分ジョギング、筋トレ、なし）',
+        'parse': parse_text, 'field': 'exercise', 'target': 'record',
+        'next': 'daily_meal',
+        'error': '⚠️ 運動の内容を入力してください（なければ「なし」）',
+    },
+    {
+        'state': 'daily_meal',
+        'prompt': '【食事】今日食べたものを教えてください\n（例: 朝 納豆ごはん、昼 サラダチキン、夜 焼き魚定食）',
+        'parse': parse_text, 'field': 'meal', 'target': 'record',
+        'next': 'active',
+        'error': '⚠️ 食事の内容を入力してください',
+        'action': 'complete_daily_input',
+    },
+]
+
+# 遷移先が 'active' のときに送るメッセージ（フロー外の状態なので表に持たない）
+FLOW_EXIT_PROMPTS = {
+    'complete_registration': '🎉 登録が完了しました！\n\n明日から毎日の記録を一緒に続けていきましょう。',
+    'complete_daily_input': '✅ 今日の記録が完了しました！\n\nお疲れさまでした。明日も一緒に頑張りましょう！',
+}
+
+
+class _CompiledStep:
+    """コンパイル済みのステップ"""
+
+    __slots__ = ('state', 'prompt', 'prompt_is_template', 'quick_replies', 'choices',
+                 'parse', 'field', 'target', 'also', 'next_state', 'error_reply', 'action')
+
+
+class ConversationFlow:
+    """表で定義した会話フローを処理する状態機械"""
+
+    def __init__(self, *flows):
+        """
+        フロー定義をコンパイル
+
+        Args:
+            *flows (list[dict]): フロー定義（REGISTRATION_FLOW など）
+
+        Raises:
+            ValueError: 状態名の重複、存在しない遷移先、保存方法の指定漏れがある場合
+        """
+        self._steps = {}
+        definitions = [definition for flow in flows for definition in flow]
+
+        for definition in definitions:
+            state = definition['state']
+            if state in self._steps:
+                raise ValueError(f"状態 {state} が重複しています")
+
+            step = _CompiledStep()
+            step.state = state
+            step.prompt = definition['prompt']
+            step.prompt_is_template = '{' in step.prompt
+            step.choices = {label.strip(): dict(values) for label, values in definition.get('choices', {}).items()}
+            step.quick_replies = tuple(step.choices.keys())
+            step.parse = definition.get('parse')
+            step.field = definition.get('field')
+            step.target = definition.get('target', 'user')
+            step.also = tuple(definition.get('also', ()))
+            step.next_state = definition['next']
+            step.error_reply = (definition['error'], step.quick_replies)
+            step.action = definition.get('action')
+
+            if not step.choices and (step.parse is None or step.field is None):
+                raise ValueError(f"状態 {state} に choices か parse/field を指定してください")
+            self._steps[state] = step
+
+        known_states = set(self._steps) | {'active'}
+        for step in self._steps.values():
+            if step.next_state not in known_states:
+                raise ValueError(f"状態 {step.state} の遷移先 {step.next_state} が定義されていません")
+
+    @property
+    def states(self):
+        """フローが扱う状態名"""
+        return frozenset(self._steps)
+
+    def handles(self, state) -> bool:
+        """この状態をフローで処理するかどうか"""
+        return state in self._steps
+
+    def prompt(self, state, values=None):
+        """
+        状態に入ったときに送るメッセージ
+
+        Args:
+            state (str): 状態名
+            values (dict, optional): テンプレートに埋めるユーザー情報
+
+        Returns:
+            tuple: (テキスト, クイックリプライのラベル)
+        """
+        step = self._steps[state]
+        text = step.prompt
+        if step.prompt_is_template:
+            text = text.format_map(_FormatValues(values or {}))
+        return text, step.quick_replies
+
+    def advance(self, state, text, values=None) -> Transition:
+        """
+        入力を処理して次の状態に進める
+
+        Args:
+            state (str): 現在の状態
+            text (str): ユーザーの入力
+            values (dict, optional): 現在のユーザー情報（検証・テンプレートに使用）
+
+        Returns:
+            Transition: 遷移の結果
+        """
+        step = self._steps[state]
+        values = values or {}
+
+        if step.choices:
+            stored = step.choices.get(text.strip())
+            if stored is None:
+                return Transition(False, state, {}, {}, [step.error_reply], None)
+            stored = dict(stored)
+        else:
+            try:
+                value = step.parse(text, values)
+            except ValueError:
+                return Transition(False, state, {}, {}, [step.error_reply], None)
+            stored = {step.field: value}
+
+        user_updates = {}
+        record_updates = {}
+        if step.target == 'record':
+            record_updates.update(stored)
+        else:
+            user_updates.update(stored)
+        for field in step.also:
+            user_updates[field] = next(iter(stored.values()))
+        user_updates['conversation_state'] = step.next_state
+
+        next_step = self._steps.get(step.next_state)
+        if next_step is not None:
+            merged = dict(values)
+            merged.update(user_updates)
+            replies = [self.prompt(step.next_state, merged)]
+        else:
+            exit_prompt = FLOW_EXIT_PROMPTS.get(step.action)
+            replies = [(exit_prompt, ())] if exit_prompt else []
+
+        return Transition(True, step.next_state, user_updates, record_updates, replies, step.action)
+
+
+def build_default_flow():
+    """登録と日々の記録のフローをコンパイル"""
+    return ConversationFlow(REGISTRATION_FLOW, DAILY_INPUT_FLOW)
+
+
+# ===== 負荷試験用の会話再生 =====
+
+# 各状態での正しい入力の例
+SYNTHETIC_ANSWERS = {
+    'register_name': lambda rng: rng.choice(['たろう', 'はなこ', 'Ken', 'みどり']),
+    'register_gender': lambda rng: rng.choice(['男性', '女性']),
+    'register_age': lambda rng: str(rng.randint(18, 70)),
+    'register_height': lambda rng: f"{rng.uniform(150, 190):.1f}",
+    'register_activity': lambda rng: rng.choice(['低い', 'やや低い', '中程度', '高い', '非常に高い']),
+    'register_mode': lambda rng: rng.choice(['ライトモード', 'ハードモード']),
+    'register_current_weight': lambda rng: f"{rng.uniform(60, 110):.1f}",
+    'register_target_weight': lambda rng: f"{rng.uniform(45, 59):.1f}",
+    'register_plan': lambda rng: '990円プラン',
+    'daily_weight': lambda rng: f"{rng.uniform(55, 100):.1f}",
+    'daily_exercise': lambda rng: rng.choice(['30分ジョギング', '筋トレ', 'なし']),
+    'daily_meal': lambda rng: rng.choice(['納豆ごはん', 'サラダチキンと玄米', '焼き魚定食']),
+}
+
+
+def generate_conversations(count, error_rate=0.1, seed=0):
+    """
+    合成した会話を作る（登録→日々の記録を最後まで進める入力列）
+
+    Args:
+        count (int): 会話の数
+        error_rate (float): 不正な入力を混ぜる割合
+        seed (int): 乱数のシード
+
+    Returns:
+        list[tuple]: [(開始状態, [入力, ...]), ...]
+    """
+    rng = random.Random(seed)
+    order = [step['state'] for step in REGISTRATION_FLOW + DAILY_INPUT_FLOW]
+    conversations = []
+    for _ in range(count):
+        texts = []
+        for state in order:
+            if rng.random() < error_rate:
+                # 空白だけの入力はどの状態でも不正
+                texts.append(' ')
+            texts.append(SYNTHETIC_ANSWERS[state](rng))
+        conversations.append((order[0], texts))
+    return conversations
+
+
+def replay(flow, conversations):
+    """
+    会話をメモリ上で再生する（LINE・データベースは使わない）
+
+    'active' に戻った会話は、次の入力から日々の記録のフローを始める。
+
+    Args:
+        flow (ConversationFlow): 会話フロー
+        conversations (list[tuple]): generate_conversations() の返り値
+
+    Returns:
+        dict: conversations, messages, accepted, rejected, completed, elapsed, messages_per_second
+    """
+    accepted = 0
+    rejected = 0
+    completed = 0
+    messages = 0
+    start = time.perf_counter()
+
+    for start_state, texts in conversations:
+        state = start_state
+        values = {}
+        for text in texts:
+            if state == 'active':
+                state = 'daily_weight'
+            messages += 1
+            transition = flow.advance(state, text, values)
+            if not transition.accepted:
+                rejected += 1
+                continue
+            accepted += 1
+            values.update(transition.user_updates)
+            state = transition.next_state
+        if state == 'active':
+            completed += 1
+
+    elapsed = time.perf_counter() - start
+    return {
+        'conversations': len(conversations),
+        'messages': messages,
+        'accepted': accepted,
+        'rejected': rejected,
+        'completed': completed,
+        'elapsed': elapsed,
+        'messages_per_second': messages / elapsed if elapsed > 0 else float(messages),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='会話フローの負荷試験（合成会話の再生）')
+    parser.add_argument('--replay', type=int, default=10000, help='再生する会話の数')
+    parser.add_argument('--error-rate', type=float, default=0.1, help='不正な入力を混ぜる割合')
+    args = parser.parse_args()
+
+    flow = build_default_flow()
+    conversations = generate_conversations(args.replay, args.error_rate)
+    report = replay(flow, conversations)
+
+    print(f"📊 会話{report['conversations']}件・メッセージ{report['messages']}件を"
+          f"{report['elapsed']:.2f}秒で再生（{report['messages_per_second']:.0f}件/秒）")
+    print(f"   受付{report['accepted']}件 / 再入力{report['rejected']}件 / 完了{report['completed']}件")
+    if report['completed'] != report['conversations']:
+        print("⚠️ 最後まで進まなかった会話があります")
+        raise SystemExit(1)
+    print("✅ すべての会話が最後まで進みました")
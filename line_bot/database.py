@@ -6,23 +6,234 @@
 
 import sqlite3
 import json
+import threading
 from datetime import datetime, date
 from typing import Optional, Dict, List
 
 
+# 読み込みクエリ（check_query_plans() で実行計画を検証する対象）
+QUERIES = {
+    'get_user': 'SELECT * FROM users WHERE user_id = ?',
+    'get_user_stats': 'SELECT * FROM user_stats WHERE user_id = ?',
+    'stats_totals': '''
+        SELECT
+            COUNT(*) AS record_count,
+            COUNT(weight) AS weight_count,
+            MIN(date) AS start_date,
+            MAX(date) AS latest_date,
+            MIN(weight) AS min_weight,
+            MAX(weight) AS max_weight
+        FROM daily_records
+        WHERE user_id = ?
+    ''',
+    'stats_weight_range': '''
+        SELECT MIN(weight), MAX(weight) FROM daily_records
+        WHERE user_id = ?
+    ''',
+    'stats_start_weight': '''
+        SELECT date, weight FROM daily_records
+        WHERE user_id = ? AND weight IS NOT NULL
+        ORDER BY date ASC
+        LIMIT 1
+    ''',
+    'stats_latest_weight': '''
+        SELECT date, weight FROM daily_records
+        WHERE user_id = ? AND weight IS NOT NULL
+        ORDER BY date DESC
+        LIMIT 1
+    ''',
+    'stats_windows': '''
+        SELECT
+            COALESCE(SUM(CASE WHEN date > date(?, '-7 days') THEN weight END), 0),
+            COUNT(CASE WHEN date > date(?, '-7 days') THEN weight END),
+            COALESCE(SUM(CASE WHEN date > date(?, '-7 days') THEN calories END), 0),
+            COALESCE(SUM(CASE WHEN date > date(?, '-7 days') THEN protein END), 0),
+            COALESCE(SUM(weight), 0),
+            COUNT(weight),
+            COALESCE(SUM(calories), 0),
+            COALESCE(SUM(protein), 0)
+        FROM daily_records
+        WHERE user_id = ? AND date > date(?, '-30 days')
+    ''',
+    'stats_record_dates': '''
+        SELECT date FROM daily_records
+        WHERE user_id = ?
+        ORDER BY date DESC
+    ''',
+    'get_daily_record': '''
+        SELECT weight FROM daily_records
+        WHERE user_id = ? AND date = ?
+    ''',
+    'get_daily_records': '''
+        SELECT * FROM daily_records
+        WHERE user_id = ?
+        ORDER BY date DESC
+        LIMIT ?
+    ''',
+    'get_today_record': '''
+        SELECT * FROM daily_records
+        WHERE user_id = ? AND date = ?
+    ''',
+    'get_users_without_today_record': '''
+        SELECT u.user_id
+        FROM users u
+        LEFT JOIN daily_records dr
+            ON u.user_id = dr.user_id AND dr.date = ?
+        WHERE u.conversation_state = 'active'
+            AND dr.id IS NULL
+    ''',
+    'get_reminder_targets': '''
+        SELECT u.user_id, u.name
+        FROM users u
+        LEFT JOIN daily_records dr
+            ON u.user_id = dr.user_id AND dr.date = ?
+        WHERE u.conversation_state = 'active'
+            AND dr.id IS NULL
+    ''',
+    'get_webhook_event': 'SELECT * FROM webhook_events WHERE event_id = ?',
+    'get_weight_history': '''
+        SELECT weight FROM daily_records
+        WHERE user_id = ? AND weight IS NOT NULL
+        ORDER BY date ASC
+    ''',
+}
+
+
+def _backfill_user_stats(database, cursor):
+    """記録があるすべてのユーザーの集計行を作成（マイグレーションで1回だけ実行）"""
+    cursor.execute('SELECT DISTINCT user_id FROM daily_records')
+    for row in cursor.fetchall():
+        database._rebuild_user_stats(cursor, row['user_id'])
+
+
+# スキーマのマイグレーション（PRAGMA user_version で適用済みバージョンを管理）
+# 追加するときは末尾にバージョン番号を1つ増やして追記すること
+# SQL文のかわりに関数 func(database, cursor) を書くと、データの移行を同じトランザクションで実行する
+MIGRATIONS = [
+    (1, [
+        # リマインダー対象の検索（conversation_state = 'active'）を索引だけで完結させる
+        'CREATE INDEX IF NOT EXISTS idx_users_state ON users (conversation_state, user_id, name)',
+        # 体重履歴・集計の読み込みを索引だけで完結させる
+        'CREATE INDEX IF NOT EXISTS idx_daily_records_user_date_metrics '
+        'ON daily_records (user_id, date, weight, calories, protein)',
+        'CREATE INDEX IF NOT EXISTS idx_feedbacks_user_id ON feedbacks (user_id)',
+    ]),
+    (2, [
+        # 処理済みWebhookイベント（LINEの再送を二重に処理しないため）
+        '''CREATE TABLE IF NOT EXISTS webhook_events (
+            event_id TEXT PRIMARY KEY,
+            processed_at REAL NOT NULL
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_webhook_events_processed_at ON webhook_events (processed_at)',
+    ]),
+    (3, [
+        # 処理中（'processing'）と処理済み（'done'）を区別する（既存の行は処理済み）
+        "ALTER TABLE webhook_events ADD COLUMN status TEXT NOT NULL DEFAULT 'done'",
+    ]),
+    (4, [
+        # ユーザーごとの集計（記録の追加時に差分で更新する）
+        # 直近7日/30日の集計は今日が基準なので保存せず、読み込み時に計算する
+        'DROP TABLE IF EXISTS user_stats',
+        '''CREATE TABLE user_stats (
+            user_id TEXT PRIMARY KEY,
+            record_count INTEGER DEFAULT 0,
+            weight_count INTEGER DEFAULT 0,
+            start_date TEXT,
+            latest_date TEXT,
+            start_weight REAL,
+            start_weight_date TEXT,
+            latest_weight REAL,
+            latest_weight_date TEXT,
+            min_weight REAL,
+            max_weight REAL,
+            current_streak INTEGER DEFAULT 0,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )''',
+    ]),
+    (5, [
+        # 集計行を保存するたびに1つ増やす番号（グラフ画像キャッシュのキーに使う）
+        'ALTER TABLE user_stats ADD COLUMN version INTEGER NOT NULL DEFAULT 0',
+        # 既存の記録から集計を作成（_save_user_stats が version を書き込むのでこの列の追加後に行う）
+        _backfill_user_stats,
+    ]),
+    (6, [
+        # 処理中のイベントを登録したプロセス（停止したプロセスの分だけを引き継ぐため）
+        'ALTER TABLE webhook_events ADD COLUMN owner TEXT',
+    ]),
+]
+
+
+# 読み込み時に今日を基準に計算する集計（stats_windows の列順）
+WINDOW_KEYS = (
+    'weight_sum_7d', 'weight_count_7d', 'calories_sum_7d', 'protein_sum_7d',
+    'weight_sum_30d', 'weight_count_30d', 'calories_sum_30d', 'protein_sum_30d',
+)
+
+
+def _shift_date(iso_date: str, days: int) -> str:
+    """ISO形式の日付を days 日ずらす"""
+    return date.fromordinal(date.fromisoformat(iso_date).toordinal() + days).isoformat()
+
+
 class Database:
     """ユーザーデータを管理するデータベースクラス"""
 
+    # スレッドごとの接続でキャッシュするプリペアドステートメント数
+    STATEMENT_CACHE_SIZE = 128
+
     def __init__(self, db_path='diet_mentor.db'):
         self.db_path = db_path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self.init_database()
 
     def get_connection(self):
-        """データベース接続を取得"""
-        conn = sqlite3.connect(self.db_path)
+        """
+        データベース接続を取得
+
+        接続はスレッドごとにプールして使い回す（毎回の接続確立とfsyncを避ける）。
+        呼び出し側で close() しないこと。
+
+        Returns:
+            sqlite3.Connection: 現在のスレッド専用の接続
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open_connection()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _open_connection(self):
+        """WALモードで新しい接続を開く"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=30,
+            cached_statements=self.STATEMENT_CACHE_SIZE
+        )
         conn.row_factory = sqlite3.Row
+        # WAL: 読み込みが書き込みをブロックしない
+        # synchronous=NORMAL: WALではコミットごとのfsyncが不要
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
         return conn
 
+    def close(self):
+        """プール中のすべての接続を閉じる（シャットダウン用）"""
+        with self._connections_lock:
+            connections = self._connections
+            self._connections = []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                # 別スレッドで作られた接続は閉じられない場合がある
+                pass
+        self._local = threading.local()
+
     def init_database(self):
         """データベーステーブルを初期化"""
         conn = self.get_connection()
@@ -92,63 +303,110 @@ class Database:
             )
         ''')
 
+        self._apply_migrations(cursor)
+
         conn.commit()
-        conn.close()
         print("✅ データベース初期化完了")
 
+    def _apply_migrations(self, cursor):
+        """未適用のマイグレーションを順番に適用"""
+        cursor.execute('PRAGMA user_version')
+        current_version = cursor.fetchone()[0]
+
+        for version, statements in MIGRATIONS:
+            if version <= current_version:
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement(self, cursor)
+                else:
+                    cursor.execute(statement)
+            # PRAGMA はパラメータを使えないため整数をそのまま埋め込む
+            cursor.execute(f'PRAGMA user_version = {int(version)}')
+            print(f"✅ マイグレーション適用: v{version}")
+
+    def check_query_plans(self) -> List[str]:
+        """
+        QUERIES の各クエリの実行計画を確認し、テーブルの全件走査を検出する
+
+        Returns:
+            list[str]: 問題のあるクエリ名と実行計画（問題がなければ空リスト）
+        """
+        conn = self.get_connection()
+        problems = []
+
+        for name, sql in QUERIES.items():
+            params = [None] * sql.count('?')
+            plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+            for row in plan:
+                detail = row['detail']
+                # SCAN CONSTANT ROW は FROM のない SELECT なので問題なし
+                if detail.startswith('SCAN') and detail != 'SCAN CONSTANT ROW':
+                    problems.append(f"{name}: {detail}")
+
+        return problems
+
     def create_user(self, user_id: str, profile: Dict) -> bool:
         """新規ユーザーを作成"""
         conn = self.get_connection()
         cursor = conn.cursor()
 
         try:
-            cursor.execute('''
-                INSERT INTO users (
-                    user_id, name, gender, age, height, activity_level,
-                    activity_coefficient, diet_mode, reduction_rate,
-                    current_weight, initial_weight, target_weight,
-                    target_calories, target_protein, target_fat, target_carbs,
-                    bmr, tdee, plan_name, duration_days, start_date,
-                    conversation_state
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'active')
-            ''', (
-                user_id,
-                profile.get('name'),
-                profile.get('gender'),
-                profile.get('age'),
-                profile.get('height'),
-                profile.get('activity_name'),
-                profile.get('activity_coefficient'),
-                profile.get('diet_mode'),
-                profile.get('reduction_rate'),
-                profile.get('current_weight'),
-                profile.get('initial_weight'),
-                profile.get('target_weight'),
-                profile.get('target_calories'),
-                profile.get('target_protein'),
-                profile.get('target_fat'),
-                profile.get('target_carbs'),
-                profile.get('bmr'),
-                profile.get('tdee'),
-                profile.get('plan_name'),
-                profile.get('duration_days'),
-                date.today().isoformat()
-            ))
+            self._insert_user(cursor, user_id, profile)
             conn.commit()
             return True
         except sqlite3.IntegrityError:
+            conn.rollback()
             return False
-        finally:
-            conn.close()
+
+    @staticmethod
+    def _insert_user(cursor, user_id: str, profile: Dict):
+        """
+        ユーザー行を追加（呼び出し側のトランザクション内で実行）
+
+        会話状態は profile の conversation_state（省略時は 'active'）
+        """
+        cursor.execute('''
+            INSERT INTO users (
+                user_id, name, gender, age, height, activity_level,
+                activity_coefficient, diet_mode, reduction_rate,
+                current_weight, initial_weight, target_weight,
+                target_calories, target_protein, target_fat, target_carbs,
+                bmr, tdee, plan_name, duration_days, start_date,
+                conversation_state
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            user_id,
+            profile.get('name'),
+            profile.get('gender'),
+            profile.get('age'),
+            profile.get('height'),
+            profile.get('activity_name'),
+            profile.get('activity_coefficient'),
+            profile.get('diet_mode'),
+            profile.get('reduction_rate'),
+            profile.get('current_weight'),
+            profile.get('initial_weight'),
+            profile.get('target_weight'),
+            profile.get('target_calories'),
+            profile.get('target_protein'),
+            profile.get('target_fat'),
+            profile.get('target_carbs'),
+            profile.get('bmr'),
+            profile.get('tdee'),
+            profile.get('plan_name'),
+            profile.get('duration_days'),
+            date.today().isoformat(),
+            profile.get('conversation_state') or 'active'
+        ))
 
     def get_user(self, user_id: str) -> Optional[Dict]:
         """ユーザー情報を取得"""
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
+        cursor.execute(QUERIES['get_user'], (user_id,))
         row = cursor.fetchone()
-        conn.close()
 
         if row:
             return dict(row)
@@ -159,22 +417,117 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
 
+        try:
+            self._update_user(cursor, user_id, updates)
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠️ ユーザー更新エラー: {e}")
+            return False
+
+    @staticmethod
+    def _update_user(cursor, user_id: str, updates: Dict):
+        """ユーザー行を更新（呼び出し側のトランザクション内で実行）"""
         set_clause = ', '.join([f"{key} = ?" for key in updates.keys()])
         values = list(updates.values()) + [user_id]
 
+        cursor.execute(f'''
+            UPDATE users
+            SET {set_clause}, updated_at = CURRENT_TIMESTAMP
+            WHERE user_id = ?
+        ''', values)
+
+    def update_conversation_states(self, states: Dict[str, str]) -> bool:
+        """
+        複数ユーザーの会話状態をまとめて更新（セッション状態の書き戻し用）
+
+        会話状態だけの変更なので updated_at は更新しない。
+
+        Args:
+            states (dict): {user_id: conversation_state}
+
+        Returns:
+            bool: 成功したかどうか
+        """
+        if not states:
+            return True
+        conn = self.get_connection()
+
         try:
-            cursor.execute(f'''
-                UPDATE users
-                SET {set_clause}, updated_at = CURRENT_TIMESTAMP
-                WHERE user_id = ?
-            ''', values)
+            conn.executemany(
+                'UPDATE users SET conversation_state = ? WHERE user_id = ?',
+                [(state, user_id) for user_id, state in states.items()]
+            )
             conn.commit()
             return True
         except Exception as e:
-            print(f"⚠️ ユーザー更新エラー: {e}")
+            conn.rollback()
+            print(f"⚠️ 会話状態の書き戻しエラー: {e}")
             return False
-        finally:
-            conn.close()
+
+    def update_user_targets(self, rows) -> int:
+        """
+        複数ユーザーのBMR・TDEE・目標カロリー・PFCをまとめて更新（一括再計算用）
+
+        Args:
+            rows (iterable): (bmr, tdee, target_calories, target_protein, target_fat, target_carbs, user_id)
+                のタプル。ジェネレーターでもよい（リストにせず順に書き込む）
+
+        Returns:
+            int: 更新した件数
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.executemany('''
+                UPDATE users SET
+                    bmr = ?, tdee = ?, target_calories = ?,
+                    target_protein = ?, target_fat = ?, target_carbs = ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = ?
+            ''', rows)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠️ 目標の一括更新エラー: {e}")
+            return 0
+        return cursor.rowcount
+
+    def upsert_user_profiles(self, columns: List[str], rows) -> int:
+        """
+        複数ユーザーのプロフィールをまとめて登録・更新（インポート用）
+
+        新しいユーザーは登録済み（'active'）として追加し、既存ユーザーは指定した項目だけ上書きする。
+
+        Args:
+            columns (list[str]): user_id 以外の項目名（users テーブルの列名）
+            rows (iterable): (user_id, 各項目の値...) のタプル。ジェネレーターでもよい
+
+        Returns:
+            int: 登録・更新した件数
+        """
+        conn = self.get_connection()
+        # 列名はパラメータにできないため、呼び出し側で検証済みの名前を埋め込む
+        column_list = ', '.join(columns)
+        placeholders = ', '.join('?' for _ in columns)
+        assignments = ', '.join(f'{column} = excluded.{column}' for column in columns)
+        if 'start_date' not in columns:
+            column_list += ', start_date'
+            placeholders += ", date('now', 'localtime')"
+        try:
+            cursor = conn.executemany(f'''
+                INSERT INTO users (user_id, {column_list}, conversation_state)
+                VALUES (?, {placeholders}, 'active')
+                ON CONFLICT (user_id) DO UPDATE SET
+                    {assignments},
+                    updated_at = CURRENT_TIMESTAMP
+            ''', rows)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠️ プロフィールの一括登録エラー: {e}")
+            return 0
+        return cursor.rowcount
 
     def add_daily_record(self, user_id: str, record: Dict) -> bool:
         """日々の記録を追加"""
@@ -182,45 +535,261 @@ class Database:
         cursor = conn.cursor()
 
         try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO daily_records (
-                    user_id, date, day_number, weight, exercise, meal,
-                    calories, protein, fat, carbs
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                user_id,
-                record.get('date', date.today().isoformat()),
-                record.get('day_number'),
-                record.get('weight'),
-                record.get('exercise'),
-                record.get('meal'),
-                record.get('calories'),
-                record.get('protein'),
-                record.get('fat'),
-                record.get('carbs')
-            ))
+            self._add_record_with_stats(cursor, user_id, record)
             conn.commit()
             return True
         except Exception as e:
+            conn.rollback()
             print(f"⚠️ 記録追加エラー: {e}")
             return False
+
+    @staticmethod
+    def _upsert_daily_record(cursor, user_id: str, record: Dict):
+        """日々の記録を追加・置き換え（呼び出し側のトランザクション内で実行）"""
+        cursor.execute('''
+            INSERT OR REPLACE INTO daily_records (
+                user_id, date, day_number, weight, exercise, meal,
+                calories, protein, fat, carbs
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            user_id,
+            record.get('date', date.today().isoformat()),
+            record.get('day_number'),
+            record.get('weight'),
+            record.get('exercise'),
+            record.get('meal'),
+            record.get('calories'),
+            record.get('protein'),
+            record.get('fat'),
+            record.get('carbs')
+        ))
+
+    def load_user_context(self, user_id: str, history_limit: int = 7) -> Dict:
+        """
+        1つのイベントの処理に必要なユーザー情報を1回の読み込みトランザクションで取得
+
+        Args:
+            user_id (str): ユーザーID
+            history_limit (int): 取得する直近の記録数
+
+        Returns:
+            dict: user（なければNone）, stats（なければNone）, records（新しい順）
+        """
+        conn = self.get_connection()
+
+        # 3つのクエリを同じスナップショットで読む
+        conn.execute('BEGIN')
+        try:
+            user = conn.execute(QUERIES['get_user'], (user_id,)).fetchone()
+            stats = conn.execute(QUERIES['get_user_stats'], (user_id,)).fetchone()
+            if stats:
+                stats = self._with_date_windows(conn, dict(stats))
+            records = conn.execute(QUERIES['get_daily_records'], (user_id, history_limit)).fetchall()
         finally:
-            conn.close()
+            conn.commit()
+
+        return {
+            'user': dict(user) if user else None,
+            'stats': stats or None,
+            'records': [dict(row) for row in records],
+        }
+
+    def apply_changes(self, user_id: str, new_user: Optional[Dict] = None,
+                      user_updates: Optional[Dict] = None,
+                      records: Optional[List[Dict]] = None) -> bool:
+        """
+        1つのイベントでの書き込みをまとめて1回のコミットで反映
+
+        Args:
+            user_id (str): ユーザーID
+            new_user (dict, optional): 新規作成するユーザーのプロフィール（既に存在する場合は無視）
+            user_updates (dict, optional): ユーザー情報の更新内容
+            records (list[dict], optional): 追加・置き換えする日々の記録
+
+        Returns:
+            bool: 成功したかどうか（失敗した場合はすべて取り消す）
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            if new_user is not None:
+                try:
+                    self._insert_user(cursor, user_id, new_user)
+                except sqlite3.IntegrityError:
+                    # create_user と同じく、既存ユーザーなら作成しない（文単位で取り消される）
+                    pass
+            if user_updates:
+                self._update_user(cursor, user_id, user_updates)
+            for record in records or []:
+                self._add_record_with_stats(cursor, user_id, record)
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠️ 変更の反映エラー: {e}")
+            return False
+
+    def _add_record_with_stats(self, cursor, user_id: str, record: Dict):
+        """記録を追加・置き換えし、集計行を差分で更新（呼び出し側のトランザクション内で実行）"""
+        record_date = record.get('date', date.today().isoformat())
+        cursor.execute(QUERIES['get_daily_record'], (user_id, record_date))
+        previous = cursor.fetchone()
+        self._upsert_daily_record(cursor, user_id, dict(record, date=record_date))
+        self._update_user_stats(cursor, user_id, record_date, record.get('weight'), previous)
+
+    def _update_user_stats(self, cursor, user_id: str, record_date: str,
+                           weight: Optional[float], previous):
+        """
+        1件の記録の追加・置き換えを集計行に差分で反映
+
+        置き換えで最小/最大・開始/最新の体重が消えた場合だけ、その項目を索引から読み直す。
+
+        Args:
+            record_date (str): 記録の日付
+            weight (float or None): 新しい体重
+            previous (sqlite3.Row or None): 置き換え前の記録（新規の場合None）
+        """
+        cursor.execute(QUERIES['get_user_stats'], (user_id,))
+        row = cursor.fetchone()
+        if row is None:
+            self._rebuild_user_stats(cursor, user_id)
+            return
+        stats = dict(row)
+        old_weight = previous['weight'] if previous is not None else None
+
+        if previous is None:
+            stats['record_count'] += 1
+            streak_start = _shift_date(stats['latest_date'], 1 - stats['current_streak'])
+            if record_date > stats['latest_date']:
+                # 最新記録日の翌日なら連続記録が伸び、間が空いていれば1からやり直し
+                follows = record_date == _shift_date(stats['latest_date'], 1)
+                stats['current_streak'] = stats['current_streak'] + 1 if follows else 1
+                stats['latest_date'] = record_date
+            elif record_date == _shift_date(streak_start, -1):
+                # 連続記録の前日を埋めると、その前の連続記録とつながる可能性がある
+                stats['current_streak'] = self._count_streak(cursor, user_id, stats['latest_date'])
+            stats['start_date'] = min(stats['start_date'], record_date)
+
+        stats['weight_count'] += (weight is not None) - (old_weight is not None)
+
+        if old_weight is not None and old_weight != weight:
+            if old_weight in (stats['min_weight'], stats['max_weight']):
+                cursor.execute(QUERIES['stats_weight_range'], (user_id,))
+                stats['min_weight'], stats['max_weight'] = cursor.fetchone()
+            if weight is None and record_date == stats['start_weight_date']:
+                cursor.execute(QUERIES['stats_start_weight'], (user_id,))
+                found = cursor.fetchone()
+                stats['start_weight_date'], stats['start_weight'] = found if found else (None, None)
+            if weight is None and record_date == stats['latest_weight_date']:
+                cursor.execute(QUERIES['stats_latest_weight'], (user_id,))
+                found = cursor.fetchone()
+                stats['latest_weight_date'], stats['latest_weight'] = found if found else (None, None)
+
+        if weight is not None:
+            if stats['min_weight'] is None or weight < stats['min_weight']:
+                stats['min_weight'] = weight
+            if stats['max_weight'] is None or weight > stats['max_weight']:
+                stats['max_weight'] = weight
+            if stats['start_weight_date'] is None or record_date <= stats['start_weight_date']:
+                stats['start_weight_date'], stats['start_weight'] = record_date, weight
+            if stats['latest_weight_date'] is None or record_date >= stats['latest_weight_date']:
+                stats['latest_weight_date'], stats['latest_weight'] = record_date, weight
+
+        self._save_user_stats(cursor, stats)
+
+    def _rebuild_user_stats(self, cursor, user_id: str):
+        """ユーザーの集計行を記録全体から作り直す（呼び出し側のトランザクション内で実行）"""
+        cursor.execute(QUERIES['stats_totals'], (user_id,))
+        stats = dict(cursor.fetchone(), user_id=user_id)
+
+        cursor.execute(QUERIES['stats_start_weight'], (user_id,))
+        found = cursor.fetchone()
+        stats['start_weight_date'], stats['start_weight'] = found if found else (None, None)
+        cursor.execute(QUERIES['stats_latest_weight'], (user_id,))
+        found = cursor.fetchone()
+        stats['latest_weight_date'], stats['latest_weight'] = found if found else (None, None)
+
+        stats['current_streak'] = (
+            self._count_streak(cursor, user_id, stats['latest_date']) if stats['latest_date'] else 0
+        )
+        self._save_user_stats(cursor, stats)
+
+    @staticmethod
+    def _count_streak(cursor, user_id: str, latest_date: str) -> int:
+        """最新記録日から途切れずに続いている日数を数える"""
+        cursor.execute(QUERIES['stats_record_dates'], (user_id,))
+        streak = 0
+        expected = latest_date
+        for row in cursor.fetchall():
+            if row['date'] != expected:
+                break
+            streak += 1
+            expected = _shift_date(expected, -1)
+        return streak
+
+    @staticmethod
+    def _save_user_stats(cursor, stats: Dict):
+        """集計行を保存（記録が変わったことがわかるよう version を1つ増やす）"""
+        cursor.execute('''
+            INSERT OR REPLACE INTO user_stats (
+                user_id, record_count, weight_count, start_date, latest_date,
+                start_weight, start_weight_date, latest_weight, latest_weight_date,
+                min_weight, max_weight, current_streak, version, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (
+            stats['user_id'], stats['record_count'], stats['weight_count'],
+            stats['start_date'], stats['latest_date'],
+            stats['start_weight'], stats['start_weight_date'],
+            stats['latest_weight'], stats['latest_weight_date'],
+            stats['min_weight'], stats['max_weight'], stats['current_streak'],
+            (stats.get('version') or 0) + 1
+        ))
+
+    @staticmethod
+    def _with_date_windows(conn, stats: Dict) -> Dict:
+        """
+        集計行に今日を基準にした項目を加える
+
+        直近7日/30日の合計は索引の範囲読み込みで計算し、
+        最新記録日が昨日より前なら連続記録は途切れているので0にする。
+        """
+        today = date.today().isoformat()
+        row = conn.execute(
+            QUERIES['stats_windows'], (today, today, today, today, stats['user_id'], today)
+        ).fetchone()
+        stats.update(zip(WINDOW_KEYS, row))
+        if not stats['latest_date'] or stats['latest_date'] < _shift_date(today, -1):
+            stats['current_streak'] = 0
+        return stats
+
+    def get_user_stats(self, user_id: str) -> Optional[Dict]:
+        """
+        ユーザーの集計（最新体重・開始体重・最小/最大・直近7日/30日の合計・連続記録日数）を取得
+
+        直近7日/30日と連続記録日数は今日を基準にした値。
+
+        Returns:
+            dict or None: 集計行（記録がない場合はNone）
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(QUERIES['get_user_stats'], (user_id,))
+        row = cursor.fetchone()
+
+        if row:
+            return self._with_date_windows(conn, dict(row))
+        return None
 
     def get_daily_records(self, user_id: str, limit: int = 30) -> List[Dict]:
         """日々の記録を取得"""
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        cursor.execute('''
-            SELECT * FROM daily_records
-            WHERE user_id = ?
-            ORDER BY date DESC
-            LIMIT ?
-        ''', (user_id, limit))
+        cursor.execute(QUERIES['get_daily_records'], (user_id, limit))
 
         rows = cursor.fetchall()
-        conn.close()
 
         return [dict(row) for row in rows]
 
@@ -230,13 +799,9 @@ class Database:
         cursor = conn.cursor()
 
         today = date.today().isoformat()
-        cursor.execute('''
-            SELECT * FROM daily_records
-            WHERE user_id = ? AND date = ?
-        ''', (user_id, today))
+        cursor.execute(QUERIES['get_today_record'], (user_id, today))
 
         row = cursor.fetchone()
-        conn.close()
 
         if row:
             return dict(row)
@@ -248,20 +813,29 @@ class Database:
         cursor = conn.cursor()
 
         today = date.today().isoformat()
-        cursor.execute('''
-            SELECT u.user_id
-            FROM users u
-            LEFT JOIN daily_records dr
-                ON u.user_id = dr.user_id AND dr.date = ?
-            WHERE u.conversation_state = 'active'
-                AND dr.id IS NULL
-        ''', (today,))
+        cursor.execute(QUERIES['get_users_without_today_record'], (today,))
 
         rows = cursor.fetchall()
-        conn.close()
 
         return [row['user_id'] for row in rows]
 
+    def get_reminder_targets(self) -> List[Dict]:
+        """
+        今日の記録がないユーザーのIDと名前を1回のクエリで取得（リマインダー一斉配信用）
+
+        Returns:
+            list[dict]: [{user_id, name}, ...]
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        today = date.today().isoformat()
+        cursor.execute(QUERIES['get_reminder_targets'], (today,))
+
+        rows = cursor.fetchall()
+
+        return [dict(row) for row in rows]
+
     def save_feedback(self, user_id: str, feedback: Dict) -> bool:
         """卒業時のフィードバックを保存"""
         conn = self.get_connection()
@@ -281,23 +855,146 @@ class Database:
             conn.commit()
             return True
         except Exception as e:
+            conn.rollback()
             print(f"⚠️ フィードバック保存エラー: {e}")
             return False
-        finally:
-            conn.close()
+
+    def claim_webhook_event(self, event_id: str, claimed_at: float, owner: str) -> bool:
+        """
+        Webhookイベントを処理中として登録
+
+        Args:
+            event_id (str): webhookEventId
+            claimed_at (float): 登録時刻（UNIX時間）
+            owner (str): 処理するプロセスの識別子
+
+        Returns:
+            bool: 登録できた場合True（既に登録済みの場合False）
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                "INSERT OR IGNORE INTO webhook_events (event_id, processed_at, status, owner) "
+                "VALUES (?, ?, 'processing', ?)",
+                (event_id, claimed_at, owner)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return cursor.rowcount == 1
+
+    def get_webhook_event(self, event_id: str) -> Optional[Dict]:
+        """
+        登録済みのWebhookイベントを取得
+
+        Returns:
+            dict or None: event_id, processed_at, status, owner（未登録の場合None）
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(QUERIES['get_webhook_event'], (event_id,))
+        row = cursor.fetchone()
+
+        if row:
+            return dict(row)
+        return None
+
+    def take_over_webhook_event(self, event_id: str, previous_owner: Optional[str],
+                                owner: str, claimed_at: float) -> bool:
+        """
+        処理中のまま残っているWebhookイベントを引き継ぐ
+
+        previous_owner が処理中のままの場合だけ引き継ぐので、複数のプロセスが同時に引き継ごうとしても
+        引き継げるのは1つだけ。
+
+        Args:
+            event_id (str): webhookEventId
+            previous_owner (str or None): get_webhook_event() で確認した処理中のプロセス
+            owner (str): 引き継ぐプロセスの識別子
+            claimed_at (float): 登録時刻（UNIX時間）
+
+        Returns:
+            bool: 引き継げた場合True
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                "UPDATE webhook_events SET owner = ?, processed_at = ? "
+                "WHERE event_id = ? AND status = 'processing' AND owner IS ?",
+                (owner, claimed_at, event_id, previous_owner)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return cursor.rowcount == 1
+
+    def finish_webhook_event(self, event_id: str, processed_at: float):
+        """
+        処理中のWebhookイベントを処理済みにする
+
+        Args:
+            event_id (str): webhookEventId
+            processed_at (float): 処理が終わった時刻（UNIX時間）
+        """
+        conn = self.get_connection()
+        try:
+            conn.execute(
+                "UPDATE webhook_events SET status = 'done', processed_at = ? WHERE event_id = ?",
+                (processed_at, event_id)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def prune_webhook_events(self, before: float) -> int:
+        """
+        古い処理済み・処理中のWebhookイベントを削除
+
+        Args:
+            before (float): この時刻（UNIX時間）より前に登録したものを削除
+
+        Returns:
+            int: 削除した件数
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('DELETE FROM webhook_events WHERE processed_at < ?', (before,))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠️ 処理済みイベントの削除エラー: {e}")
+            return 0
+        return cursor.rowcount
 
     def get_weight_history(self, user_id: str) -> List[float]:
         """体重履歴を取得（グラフ生成用）"""
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        cursor.execute('''
-            SELECT weight FROM daily_records
-            WHERE user_id = ? AND weight IS NOT NULL
-            ORDER BY date ASC
-        ''', (user_id,))
+        cursor.execute(QUERIES['get_weight_history'], (user_id,))
 
         rows = cursor.fetchall()
-        conn.close()
 
         return [row['weight'] for row in rows]
+
+
+if __name__ == "__main__":
+    # 実行計画のチェック: python database.py [DBパス]
+    import sys
+
+    database = Database(sys.argv[1] if len(sys.argv) > 1 else ':memory:')
+    problems = database.check_query_plans()
+    if problems:
+        print("⚠️ 全件走査しているクエリがあります:")
+        for problem in problems:
+            print(f"  - {problem}")
+        sys.exit(1)
+    print(f"✅ {len(QUERIES)}件のクエリはすべて索引を使っています")
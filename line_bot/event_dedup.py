@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Webhookイベントの重複排除
+LINEが再送したイベント（同じ webhookEventId）を二重に処理しないよう、
+直近のIDをメモリ（LRU）に、処理中・処理済みのIDをSQLiteに保持する
+"""
+
+import functools
+import inspect
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+def _process_alive(pid: int) -> bool:
+    """同じホストのプロセスが動いているかどうか"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # 別ユーザーのプロセスとして存在する
+        return True
+    return True
+
+
+class EventDeduplicator:
+    """webhookEventId による重複排除"""
+
+    def __init__(self, database, max_entries=10000, retention_seconds=3 * 24 * 60 * 60,
+                 lease_seconds=15 * 60):
+        """
+        初期化
+
+        Args:
+            database: Databaseインスタンス（webhook_events テーブルに保存）
+            max_entries (int): メモリに保持するIDの最大数
+            retention_seconds (float): SQLiteに保持する期間（prune() で削除）
+            lease_seconds (float): 処理中の登録を、登録したプロセスが動いているか確認できなくても
+                引き継いでよくなるまでの秒数（別ホストのプロセスや、止まったまま戻らない処理の分）
+        """
+        self.db = database
+        # 処理中の登録に記録する識別子（ホスト名:プロセスID:起動ごとの乱数）
+        self.hostname = socket.gethostname()
+        self.owner = f"{self.hostname}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+        self.lease_seconds = lease_seconds
+        self.max_entries = max_entries
+        self.retention_seconds = retention_seconds
+        self.duplicates = 0
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, event_id):
+        self._recent[event_id] = True
+        self._recent.move_to_end(event_id)
+        while len(self._recent) > self.max_entries:
+            self._recent.popitem(last=False)
+
+    def claim(self, event_id) -> bool:
+        """
+        イベントを処理してよいか確認し、処理中として登録
+
+        処理が終わったら finish() で処理済みにする。処理中のまま残っている登録は、
+        登録したプロセスが停止している場合だけ引き継ぐ（_owner_gone()）。
+        動いているプロセスが処理中のイベントをLINEが再送しても、二重には処理しない。
+
+        Args:
+            event_id (str): webhookEventId（Noneの場合は常に処理する）
+
+        Returns:
+            bool: 初めてのイベント（または停止したプロセスが処理しきれなかったイベント）ならTrue、
+                再送・処理中ならFalse
+        """
+        if not event_id:
+            return True
+
+        with self._lock:
+            if event_id in self._recent:
+                self._recent.move_to_end(event_id)
+                self.duplicates += 1
+                return False
+
+        # 複数のワーカーが同時に同じイベントを受けても、登録できるのは1つだけ
+        now = time.time()
+        claimed = self.db.claim_webhook_event(event_id, now, self.owner)
+        if not claimed:
+            row = self.db.get_webhook_event(event_id)
+            if row and row['status'] == 'processing' and self._owner_gone(row['owner'], row['processed_at'], now):
+                claimed = self.db.take_over_webhook_event(event_id, row['owner'], self.owner, now)
+                if claimed:
+                    print(f"♻️ 停止したプロセスの処理中イベントを引き継ぎ: {event_id}")
+
+        with self._lock:
+            self._remember(event_id)
+            if not claimed:
+                self.duplicates += 1
+        return claimed
+
+    def _owner_gone(self, owner, claimed_at, now) -> bool:
+        """
+        処理中の登録をしたプロセスが停止しているかどうか
+
+        同じホストのプロセスはプロセスIDで確認する。同じプロセスIDでも起動ごとの乱数が違えば、
+        前に同じIDを使っていたプロセス（コンテナの再起動など）なので停止している。
+        別ホストのプロセスや識別子のない登録は確認できないので、lease_seconds を過ぎたら停止とみなす。
+        """
+        if owner == self.owner:
+            return False
+        if now - claimed_at > self.lease_seconds:
+            return True
+
+        parts = (owner or '').rsplit(':', 2)
+        if len(parts) != 3 or parts[0] != self.hostname or not parts[1].isdigit():
+            return False
+        pid = int(parts[1])
+        if pid == os.getpid():
+            return True
+        return not _process_alive(pid)
+
+    def finish(self, event_id):
+        """
+        処理中のイベントを処理済みにする
+
+        Args:
+            event_id (str): claim() で登録したwebhookEventId（Noneの場合は何もしない）
+        """
+        if event_id:
+            self.db.finish_webhook_event(event_id, time.time())
+
+    def once(self, func):
+        """
+        イベントハンドラーを再送時に実行しないようにするデコレーター
+
+        line-bot-sdk は関数の引数の数を見て func(event) か func(event, destination) で呼ぶため、
+        ラッパーも元の関数と同じ引数の数にする（可変長引数にすると destination まで渡される）。
+
+        ハンドラーが戻ってから処理済みにする。例外で終わった場合も処理済みにする
+        （返信の一部を送っている可能性があり、Webhookキューも失敗したものは再試行しない）。
+        ハンドラーの途中でプロセスが停止した場合は処理中のまま残り、
+        WEBHOOK_QUEUE_DB から再投入されたときに、登録したプロセスの停止を確認して処理し直される。
+
+        例:
+            @handler.add(MessageEvent, message=TextMessage)
+            @event_dedup.once
+            def handle_message(event):
+                ...
+        """
+        def should_run(event):
+            event_id = getattr(event, 'webhook_event_id', None)
+            if self.claim(event_id):
+                return True
+            print(f"📭 再送イベントをスキップ: {event_id}")
+            return False
+
+        def run(event, *args):
+            if not should_run(event):
+                return None
+            try:
+                return func(event, *args)
+            finally:
+                self.finish(getattr(event, 'webhook_event_id', None))
+
+        if len(inspect.getfullargspec(func).args) >= 2:
+            @functools.wraps(func)
+            def wrapper(event, destination):
+                return run(event, destination)
+        else:
+            @functools.wraps(func)
+            def wrapper(event):
+                return run(event)
+        return wrapper
+
+    def prune(self) -> int:
+        """
+        保持期間を過ぎたイベントをSQLiteから削除
+
+        Returns:
+            int: 削除した件数
+        """
+        return self.db.prune_webhook_events(time.time() - self.retention_seconds)
+
+
+if __name__ == '__main__':
+    # 実際の WebhookHandler.handle で呼び出して確認: python event_dedup.py
+    import base64
+    import hashlib
+    import hmac
+    import json
+    import sys
+
+    from linebot import WebhookHandler
+    from linebot.models import MessageEvent, TextMessage
+
+    from database import Database
+
+    secret = 'dedup-check-secret'
+    handler = WebhookHandler(secret)
+    dedup = EventDeduplicator(Database(':memory:'))
+    received = []
+
+    @handler.add(MessageEvent, message=TextMessage)
+    @dedup.once
+    def handle_message(event):
+        received.append(event.message.text)
+
+    def deliver(event_id, text):
+        body = json.dumps({
+            'destination': 'Udestination',
+            'events': [{
+                'type': 'message', 'mode': 'active', 'timestamp': 1700000000000,
+                'webhookEventId': event_id, 'deliveryContext': {'isRedelivery': False},
+                'source': {'type': 'user', 'userId': 'Ucheck'},
+                'replyToken': 'reply-token',
+                'message': {'type': 'text', 'id': event_id, 'text': text},
+            }],
+        })
+        signature = base64.b64encode(
+            hmac.new(secret.encode(), body.encode(), hashlib.sha256).digest()
+        ).decode()
+        handler.handle(body, signature)
+
+    deliver('01CHECK0000000000000000001', 'こんにちは')
+    deliver('01CHECK0000000000000000001', 'こんにちは')
+    deliver('01CHECK0000000000000000002', '今日の記録')
+
+    if received != ['こんにちは', '今日の記録']:
+        print(f"⚠️ ハンドラーの呼び出しが想定と違います: {received}")
+        sys.exit(1)
+    print("✅ WebhookHandler からの呼び出しと再送のスキップを確認しました")
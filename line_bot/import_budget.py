@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+起動時のimport時間チェック
+`python -X importtime` でapp.py が起動時に読み込むモジュールを読み込み、
+合計時間が予算内か、重いライブラリを起動時に読み込んでいないかを確認する
+
+使い方:
+    python import_budget.py              # 予算は環境変数 IMPORT_TIME_BUDGET_MS（既定 1500ms）
+    python import_budget.py --budget 800
+"""
+
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# app.py が親ディレクトリをパスに追加して sekiguchi_bot を読み込むのと同じようにする
+ROOT_DIR = os.path.dirname(BOT_DIR)
+
+# 初回利用時まで読み込まないはずのモジュール
+LAZY_MODULES = [
+    'matplotlib',
+    'google.generativeai',
+    'PIL',
+    'numpy',
+    'sekiguchi_bot.main',
+]
+
+
+def startup_modules(app_path=None):
+    """
+    app.py がモジュールの最上位で読み込むモジュールの一覧を取得
+
+    app.py はLINEの認証情報がないと起動できないので、ソースから import 文を読み取り、
+    その依存を直接読み込んで測る（app.py に import を追加すれば自動的に測定対象になる）。
+
+    Args:
+        app_path (str, optional): app.py のパス
+
+    Returns:
+        list[str]: モジュール名（app.py での出現順）
+    """
+    app_path = app_path or os.path.join(BOT_DIR, 'app.py')
+    with open(app_path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=app_path)
+
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            names = [node.module]
+        else:
+            continue
+        modules.extend(name for name in names if name not in modules)
+    return modules
+
+
+def measure_imports(modules, cwd=None):
+    """
+    別プロセスで -X importtime を実行し、モジュールごとの累積時間を取得
+
+    Args:
+        modules (list[str]): 読み込むモジュール名
+        cwd (str, optional): 実行ディレクトリ（省略時はこのファイルのディレクトリ）
+
+    Returns:
+        dict: {モジュール名: 累積時間(マイクロ秒)}
+    """
+    cwd = cwd or BOT_DIR
+    code = f"import sys; sys.path.append({ROOT_DIR!r}); import {', '.join(modules)}"
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=cwd, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"モジュールの読み込みに失敗しました:\n{result.stderr}")
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        # 形式: "import time:  self [us] | cumulative | imported package"
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        timings[parts[2].strip()] = int(parts[1].strip())
+    return timings
+
+
+def check_budget(budget_ms):
+    """
+    import時間と遅延読み込みを確認
+
+    Args:
+        budget_ms (float): 起動モジュールの読み込み時間の上限（ミリ秒）
+
+    Returns:
+        list[str]: 問題の一覧（なければ空）
+    """
+    modules = startup_modules()
+    timings = measure_imports(modules)
+    problems = []
+
+    # 先に読み込まれたモジュールの依存は後のモジュールの累積時間に含まれないので、合計しても重複しない
+    total_ms = sum(timings.get(module, 0) for module in modules) / 1000
+    print(f"📊 起動モジュールの読み込み時間: {total_ms:.1f}ms（予算 {budget_ms:.0f}ms）")
+    for module in modules:
+        print(f"   {module}: {timings.get(module, 0) / 1000:.1f}ms")
+
+    if total_ms > budget_ms:
+        problems.append(f"読み込み時間が予算を超えています: {total_ms:.1f}ms > {budget_ms:.0f}ms")
+
+    for module in LAZY_MODULES:
+        if module in timings:
+            problems.append(f"{module} が起動時に読み込まれています（{timings[module] / 1000:.1f}ms）")
+
+    return problems
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='起動時のimport時間チェック')
+    parser.add_argument('--budget', type=float,
+                        default=float(os.getenv('IMPORT_TIME_BUDGET_MS', 1500)),
+                        help='読み込み時間の上限（ミリ秒）')
+    args = parser.parse_args()
+
+    problems = check_budget(args.budget)
+    if problems:
+        for problem in problems:
+            print(f"⚠️ {problem}")
+        sys.exit(1)
+    print("✅ import時間は予算内です")
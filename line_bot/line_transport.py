@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LINE Messaging API 用のHTTP通信層
+LineBotApi の http_client として使い、接続の再利用（keep-alive・コネクションプール）、
+429/5xx のリトライ（Retry-After を優先、なければジッターつき指数バックオフ）、
+APIごとのレイテンシ計測を行う。httpx と h2 が入っていればHTTP/2で通信する
+"""
+
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from linebot.http_client import HttpClient, HttpResponse, RequestsHttpResponse
+
+
+# リトライする HTTP ステータス
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# X-Line-Retry-Key で重複送信を防げる送信API（リトライ時も同じキーを使う）
+RETRY_KEY_PATHS = (
+    '/v2/bot/message/push',
+    '/v2/bot/message/multicast',
+    '/v2/bot/message/narrowcast',
+    '/v2/bot/message/broadcast',
+)
+
+# レイテンシの分位点を計算するために保持する直近の件数（APIごと）
+LATENCY_SAMPLES = 500
+
+# URL中のユーザーID・リッチメニューIDなどをまとめて集計するためのパターン
+_ID_SEGMENT = re.compile(r'/(U[0-9a-f]{32}|C[0-9a-f]{32}|R[0-9a-f]{32}|richmenu-[0-9a-f]+|[0-9a-f-]{20,})')
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+    return value.lower() not in ('0', 'false', 'no', 'off')
+
+
+def _http2_available():
+    """httpx と h2 が使えるかどうか"""
+    try:
+        import httpx  # noqa: F401
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class _HttpxResponse(HttpResponse):
+    """httpx のレスポンスを LineBotApi から使える形にしたもの"""
+
+    def __init__(self, response):
+        self.response = response
+
+    @property
+    def status_code(self):
+        return self.response.status_code
+
+    @property
+    def headers(self):
+        return self.response.headers
+
+    @property
+    def text(self):
+        return self.response.text
+
+    @property
+    def content(self):
+        return self.response.content
+
+    @property
+    def json(self):
+        return self.response.json()
+
+    def iter_content(self, chunk_size=1024, decode_unicode=False):
+        if decode_unicode:
+            return self.response.iter_text(chunk_size=chunk_size)
+        return self.response.iter_bytes(chunk_size=chunk_size)
+
+
+class LatencyMetrics:
+    """APIごとの呼び出し回数・エラー・リトライ・レイテンシの集計（複数スレッドで共有）"""
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self._lock = threading.Lock()
+        self._samples = samples
+        self._stats = defaultdict(self._new_entry)
+
+    def _new_entry(self):
+        return {
+            'calls': 0, 'errors': 0, 'retries': 0,
+            'total_ms': 0.0, 'max_ms': 0.0,
+            'recent_ms': deque(maxlen=self._samples),
+        }
+
+    @staticmethod
+    def endpoint_name(method, url):
+        """メソッドとURLから集計用の名前を作る（IDは {id} にまとめる）"""
+        path = url.split('://', 1)[-1]
+        path = path[path.find('/'):] if '/' in path else '/'
+        path = path.split('?', 1)[0]
+        return f"{method} {_ID_SEGMENT.sub('/{id}', path)}"
+
+    def record(self, endpoint, elapsed_ms, error=False):
+        with self._lock:
+            entry = self._stats[endpoint]
+            entry['calls'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['recent_ms'].append(elapsed_ms)
+            if error:
+                entry['errors'] += 1
+
+    def record_retry(self, endpoint):
+        with self._lock:
+            self._stats[endpoint]['retries'] += 1
+
+    def snapshot(self):
+        """
+        集計結果を取得
+
+        Returns:
+            dict: {API名: {calls, errors, retries, avg_ms, p50_ms, p95_ms, max_ms}}
+        """
+        with self._lock:
+            result = {}
+            for endpoint, entry in self._stats.items():
+                recent = sorted(entry['recent_ms'])
+                result[endpoint] = {
+                    'calls': entry['calls'],
+                    'errors': entry['errors'],
+                    'retries': entry['retries'],
+                    'avg_ms': round(entry['total_ms'] / entry['calls'], 1) if entry['calls'] else 0.0,
+                    'p50_ms': round(recent[len(recent) // 2], 1) if recent else 0.0,
+                    'p95_ms': round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 1) if recent else 0.0,
+                    'max_ms': round(entry['max_ms'], 1),
+                }
+            return result
+
+
+class PooledHttpClient(HttpClient):
+    """
+    接続を使い回す LineBotApi 用の HttpClient
+
+    使い方:
+        line_bot_api = LineBotApi(token, http_client=PooledHttpClient)
+        line_bot_api.http_client.metrics.snapshot()
+
+    設定は環境変数で行う（LineBotApi がクラスを受け取って生成するため）:
+        LINE_HTTP_POOL_SIZE: 同時に保持する接続数（既定 20）
+        LINE_HTTP_MAX_RETRIES: 429/5xx・接続エラー時の最大リトライ回数（既定 2）
+        LINE_HTTP_BACKOFF: リトライの基本待ち時間（秒、既定 0.5）
+        LINE_HTTP_MAX_WAIT: 1回のリトライで待つ最大秒数（既定 30）
+        LINE_HTTP2: HTTP/2 を使うか（既定: httpx と h2 があれば使う、0で無効）
+    """
+
+    def __init__(self, timeout=HttpClient.DEFAULT_TIMEOUT, pool_size=None, max_retries=None,
+                 backoff=None, max_wait=None, http2=None):
+        super(PooledHttpClient, self).__init__(timeout)
+        self.pool_size = pool_size or int(os.getenv('LINE_HTTP_POOL_SIZE', 20))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('LINE_HTTP_MAX_RETRIES', 2))
+        self.backoff = backoff if backoff is not None else float(os.getenv('LINE_HTTP_BACKOFF', 0.5))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv('LINE_HTTP_MAX_WAIT', 30))
+        if http2 is None:
+            http2 = _env_bool('LINE_HTTP2', True)
+        self.http2 = http2 and _http2_available()
+        self.metrics = LatencyMetrics()
+
+        if self.http2:
+            import httpx
+            self._client = httpx.Client(
+                http2=True,
+                limits=httpx.Limits(max_connections=self.pool_size,
+                                    max_keepalive_connections=self.pool_size)
+            )
+        else:
+            self._client = requests.Session()
+            # リトライはこのクラスで行うので urllib3 のリトライは無効にする
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+            self._client.mount('https://', adapter)
+            self._client.mount('http://', adapter)
+
+        print(f"✅ LINE API通信: {'HTTP/2' if self.http2 else 'HTTP/1.1'}, 接続プール{self.pool_size}")
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        return self._request('GET', url, headers=headers, params=params, stream=stream, timeout=timeout)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        return self._request('POST', url, headers=headers, data=data, timeout=timeout)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        return self._request('DELETE', url, headers=headers, data=data, timeout=timeout)
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        return self._request('PUT', url, headers=headers, data=data, timeout=timeout)
+
+    def close(self):
+        """接続プールを閉じる"""
+        self._client.close()
+
+    def _request(self, method, url, headers=None, params=None, data=None, stream=False, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        # LineBotApi のヘッダー辞書は全スレッドで共有されているのでコピーして使う
+        headers = dict(headers or {})
+
+        # 送信APIはリトライしても重複しないようリトライキーをつける
+        retry_safe = method in ('GET', 'PUT', 'DELETE')
+        if method == 'POST' and url.split('?', 1)[0].endswith(RETRY_KEY_PATHS):
+            headers.setdefault('X-Line-Retry-Key', str(uuid.uuid4()))
+            retry_safe = True
+
+        endpoint = LatencyMetrics.endpoint_name(method, url)
+
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                response = self._send(method, url, headers, params, data, stream, timeout)
+            except Exception as e:
+                self.metrics.record(endpoint, (time.perf_counter() - started) * 1000, error=True)
+                # 接続エラー・タイムアウトは、重複しても問題ないリクエストだけリトライ
+                if not retry_safe or attempt >= self.max_retries or not self._is_network_error(e):
+                    raise
+                self.metrics.record_retry(endpoint)
+                time.sleep(self._backoff_wait(attempt))
+                continue
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            status = response.status_code
+            self.metrics.record(endpoint, elapsed_ms, error=status >= 400)
+
+            if status not in RETRY_STATUSES or attempt >= self.max_retries:
+                return response
+            # 5xx は処理済みの可能性があるので、重複しても問題ないリクエストだけリトライ
+            if status != 429 and not retry_safe:
+                return response
+
+            wait = self._retry_after(response.headers)
+            if wait is None:
+                wait = self._backoff_wait(attempt)
+            print(f"⚠️ LINE API {endpoint} が{status}を返したため{wait:.1f}秒後にリトライします")
+            if stream:
+                # 読み込んでいないレスポンスの接続をプールに戻す
+                response.response.close()
+            self.metrics.record_retry(endpoint)
+            time.sleep(min(wait, self.max_wait))
+
+        return response
+
+    def _send(self, method, url, headers, params, data, stream, timeout):
+        if self.http2:
+            timeout = self._httpx_timeout(timeout)
+            if stream:
+                request = self._client.build_request(method, url, headers=headers, params=params,
+                                                     content=data, timeout=timeout)
+                return _HttpxResponse(self._client.send(request, stream=True))
+            return _HttpxResponse(self._client.request(method, url, headers=headers, params=params,
+                                                       content=data, timeout=timeout))
+        return RequestsHttpResponse(self._client.request(
+            method, url, headers=headers, params=params, data=data, stream=stream, timeout=timeout
+        ))
+
+    @staticmethod
+    def _httpx_timeout(timeout):
+        import httpx
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return httpx.Timeout(read, connect=connect)
+        return httpx.Timeout(timeout)
+
+    def _is_network_error(self, error):
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        if self.http2:
+            import httpx
+            return isinstance(error, httpx.TransportError)
+        return False
+
+    def _backoff_wait(self, attempt):
+        """ジッターつき指数バックオフ（フルジッター）"""
+        return random.uniform(0, min(self.max_wait, self.backoff * (2 ** attempt)))
+
+    @staticmethod
+    def _retry_after(headers):
+        """Retry-After ヘッダー（秒数またはHTTP日付）から待ち時間を求める"""
+        value = headers.get('Retry-After') if headers else None
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(retry_at.timestamp() - time.time(), 0.0)
@@ -13,21 +13,68 @@ from linebot.models import (
     MessageAction, FlexSendMessage, ImageSendMessage
 )
 import random
+import importlib
+from functools import lru_cache
 
-# 親ディレクトリのモジュールをインポート
+from conversation_flow import build_default_flow
+from response_collector import ResponseCollector
+from user_context import UserContext
+
+# 親ディレクトリのモジュールをインポートできるようにする
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from sekiguchi_bot.main import (
-    calculate_bmr, calculate_target_calories_and_pfc,
-    generate_stagnation_advice, create_nutrition_graphs
-)
+
+from nutrition_core import calculate_target_calories_and_pfc
+
+
+def _sekiguchi_main():
+    """
+    sekiguchi_bot.main を初回利用時に読み込む
+
+    グラフ描画や画像解析の依存も一緒に読み込まれるため、
+    起動直後のWebhook応答を遅らせないよう import 時には読み込まない。
+    """
+    return importlib.import_module('sekiguchi_bot.main')
+
+
+# 登録・日々の記録の会話フロー（起動時に1回だけコンパイル）
+CONVERSATION_FLOW = build_default_flow()
+
+# 会話フローのメッセージに埋める値の既定値
+PROMPT_DEFAULTS = {'name': 'あなた', 'current_day': 1, 'duration_days': 90}
+
+WELCOME_MESSAGE = """🎓 卒業型ダイエットメンターへようこそ！
+
+世界で証明されたダイエット理論を、あなた専属のAIメンターが完全再現。"最後のダイエットパートナー"
+
+まずはプロフィール登録から始めましょう。
+
+"""
+
+# 書き込みに失敗したときの返信（作成済みの返信の代わりに送る）
+SAVE_ERROR_MESSAGE = "申し訳ありません、入力内容を保存できませんでした。\n\nお手数ですが、もう一度送ってください。"
+
+
+@lru_cache(maxsize=None)
+def _quick_reply(labels):
+    """クイックリプライを作成（同じ選択肢は使い回す）"""
+    if not labels:
+        return None
+    return QuickReply(items=[
+        QuickReplyButton(action=MessageAction(label=label, text=label)) for label in labels
+    ])
 
 
 class MessageHandler:
     """メッセージ処理クラス"""
 
-    def __init__(self, database, line_bot_api):
+    def __init__(self, database, line_bot_api, chart_cache=None, chart_renderer=None,
+                 outbound_scheduler=None, state_store=None):
         self.db = database
         self.line_bot_api = line_bot_api
+        self.chart_cache = chart_cache
+        self.chart_renderer = chart_renderer
+        self.outbound_scheduler = outbound_scheduler
+        self.state_store = state_store
 
     def handle_text_message(self, user_id: str, text: str, event):
         """
@@ -38,18 +85,44 @@ class MessageHandler:
             text (str): メッセージテキスト
             event: LINEイベントオブジェクト
         """
-        # ユーザー情報を取得
-        user = self.db.get_user(user_id)
+        # ユーザー・集計・直近の記録をまとめて読み込み、返信はイベントの最後にまとめて送る
+        responses = ResponseCollector(
+            self.line_bot_api, user_id,
+            reply_token=getattr(event, 'reply_token', None),
+            event_timestamp=getattr(event, 'timestamp', None),
+            scheduler=self.outbound_scheduler
+        )
+        ctx = UserContext(self.db, user_id, responses=responses, state_store=self.state_store)
+
+        self.dispatch_text_message(ctx, text)
+
+        # イベント中の書き込みを1回のコミットで反映してから返信する
+        if not ctx.commit():
+            # 保存できなかった内容を「記録しました」と返さないよう、作成済みの返信は送らない
+            print(f"⚠️ 書き込みに失敗したため返信を破棄: {user_id}")
+            responses.discard()
+            responses.add(TextSendMessage(text=SAVE_ERROR_MESSAGE))
+        responses.flush()
+
+    def dispatch_text_message(self, ctx: UserContext, text: str):
+        """
+        会話状態に応じてテキストメッセージを振り分ける
+
+        Args:
+            ctx (UserContext): イベント単位のユーザー情報
+            text (str): メッセージテキスト
+        """
+        user = ctx.user
 
         # リッチメニューからのアクション
         if text in ["📝 今日の記録", "📊 グラフを見る", "👤 プロフィール",
                     "💡 アドバイスがほしい", "🎯 目標確認", "❓ ヘルプ"]:
-            self.handle_rich_menu_action(user_id, text, user)
+            self.handle_rich_menu_action(ctx, text)
             return
 
         # 新規ユーザー
         if not user:
-            self.start_registration(user_id)
+            self.start_registration(ctx)
             return
 
         # 会話状態に応じて処理
@@ -57,193 +130,188 @@ class MessageHandler:
 
         if state == 'active':
             # アクティブユーザー：日々の入力
-            self.handle_active_user_message(user_id, text, user)
-        elif state.startswith('register_'):
-            # 登録プロセス中
-            self.handle_registration(user_id, text, user, state)
-        elif state.startswith('daily_'):
-            # 日々の記録中
-            self.handle_daily_input(user_id, text, user, state)
+            self.handle_active_user_message(ctx, text)
+        elif CONVERSATION_FLOW.handles(state):
+            # 登録・日々の記録の途中
+            self.handle_flow_input(ctx, text, state)
         else:
             # その他
-            self.send_help_message(user_id)
+            self.send_help_message(ctx)
 
-    def handle_rich_menu_action(self, user_id: str, text: str, user: dict):
+    def handle_rich_menu_action(self, ctx: UserContext, text: str):
         """リッチメニューからのアクション処理"""
+        user = ctx.user
 
         if text == "📝 今日の記録":
             if not user:
-                self.start_registration(user_id)
+                self.start_registration(ctx)
             else:
-                self.start_daily_input(user_id, user)
+                self.start_daily_input(ctx)
 
         elif text == "📊 グラフを見る":
-            self.send_weight_graph(user_id, user)
+            self.send_weight_graph(ctx)
 
         elif text == "👤 プロフィール":
-            self.send_profile_info(user_id, user)
+            self.send_profile_info(ctx)
 
         elif text == "💡 アドバイスがほしい":
-            self.send_advice(user_id, user)
+            self.send_advice(ctx)
 
         elif text == "🎯 目標確認":
-            self.send_goal_info(user_id, user)
+            self.send_goal_info(ctx)
 
         elif text == "❓ ヘルプ":
-            self.send_help_message(user_id)
+            self.send_help_message(ctx)
 
-    def start_registration(self, user_id: str):
-        """新規登録を開始"""
-        welcome_message = """🎓 卒業型ダイエットメンターへようこそ！
+    @staticmethod
+    def _flow_values(user: dict) -> dict:
+        """会話フローの検証・メッセージに使うユーザー情報"""
+        values = dict(PROMPT_DEFAULTS)
+        values.update({key: value for key, value in (user or {}).items() if value is not None})
+        return values
 
-世界で証明されたダイエット理論を、あなた専属のAIメンターが完全再現。"最後のダイエットパートナー"
+    @staticmethod
+    def _add_flow_replies(ctx: UserContext, replies):
+        for text, labels in replies:
+            ctx.responses.add(TextSendMessage(text=text, quick_reply=_quick_reply(labels)))
 
-まずはプロフィール登録から始めましょう。
+    def start_registration(self, ctx: UserContext):
+        """新規登録を開始"""
+        prompt, labels = CONVERSATION_FLOW.prompt('register_name')
+        ctx.responses.add(TextSendMessage(text=WELCOME_MESSAGE + prompt, quick_reply=_quick_reply(labels)))
 
-【お名前】何とお呼びすればよいですか？"""
+        # 仮のユーザーレコードを作成し、名前の入力待ちにする
+        ctx.create_user({'name': None})
+        ctx.update_user({'conversation_state': 'register_name'})
 
-        self.line_bot_api.reply_message(
-            event.reply_token if hasattr(self, 'event') else None,
-            TextSendMessage(text=welcome_message)
-        )
+    def start_daily_input(self, ctx: UserContext):
+        """日々の記録入力を開始"""
+        self._add_flow_replies(ctx, [CONVERSATION_FLOW.prompt('daily_weight', self._flow_values(ctx.user))])
 
-        # 会話状態を更新（仮のユーザーレコード作成）
-        self.db.create_user(user_id, {
-            'name': None,
-            'conversation_state': 'register_name'
+        # 会話状態を更新
+        ctx.update_user({
+            'conversation_state': 'daily_weight'
         })
 
-    def handle_registration(self, user_id: str, text: str, user: dict, state: str):
+    def handle_flow_input(self, ctx: UserContext, text: str, state: str):
         """
-        登録プロセスを処理
+        登録・日々の記録の入力を処理（各ステップの定義は conversation_flow.py）
 
-        状態遷移:
-        register_name -> register_gender -> register_age -> register_height
-        -> register_activity -> register_mode -> register_current_weight
-        -> register_target_weight -> register_plan -> complete
+        Args:
+            ctx (UserContext): イベント単位のユーザー情報
+            text (str): メッセージテキスト
+            state (str): 現在の会話状態
         """
-        # 実装は長くなるため、簡略化版
-        # 実際には各ステップで入力を検証し、次のステップへ進む
-
-        if state == 'register_name':
-            # 名前を保存
-            self.db.update_user(user_id, {
-                'name': text,
-                'conversation_state': 'register_gender'
-            })
-            reply = f"{text}さん、よろしくお願いします！\n\n【性別】性別を教えてください"
-
-            quick_reply = QuickReply(items=[
-                QuickReplyButton(action=MessageAction(label="男性", text="男性")),
-                QuickReplyButton(action=MessageAction(label="女性", text="女性")),
-            ])
-
-            self.line_bot_api.push_message(
-                user_id,
-                TextSendMessage(text=reply, quick_reply=quick_reply)
-            )
-
-        # ... 他の登録ステップも同様に実装 ...
-        # (完全な実装は非常に長くなるため、ここでは概要のみ)
-
-    def start_daily_input(self, user_id: str, user: dict):
-        """日々の記録入力を開始"""
-        name = user.get('name', 'あなた')
-        day = user.get('current_day', 1)
-        max_days = user.get('duration_days', 90)
-
-        message = f"""📅 {day}日目 / {max_days}日
-
-{name}さん、今日の記録を始めましょう！
-
-【体重】今日の体重は何kgですか？
-（数字のみ入力してください。例: 75.5）"""
-
-        self.line_bot_api.push_message(
-            user_id,
-            TextSendMessage(text=message)
-        )
+        transition = CONVERSATION_FLOW.advance(state, text, self._flow_values(ctx.user))
+
+        if transition.accepted:
+            if transition.record_updates:
+                # 今日の記録に項目を追加していく（INSERT OR REPLACE なので既存の項目も引き継ぐ）
+                record = dict(ctx.today_record or {})
+                record.update(transition.record_updates)
+                record['date'] = date.today().isoformat()
+                if record.get('day_number') is None:
+                    record['day_number'] = ctx.user.get('current_day') or 1
+                ctx.add_daily_record(record)
+            ctx.update_user(transition.user_updates)
+
+        self._add_flow_replies(ctx, transition.replies)
+
+        if transition.action == 'complete_registration':
+            self.complete_registration(ctx)
+
+    def complete_registration(self, ctx: UserContext):
+        """登録完了時に目標カロリーとPFCを計算して保存し、目標を送信"""
+        try:
+            targets = calculate_target_calories_and_pfc(ctx.user)
+        except Exception as e:
+            print(f"⚠️ 目標カロリーの計算エラー: {e}")
+            return
 
-        # 会話状態を更新
-        self.db.update_user(user_id, {
-            'conversation_state': 'daily_weight'
+        ctx.update_user({
+            'bmr': targets['bmr'],
+            'tdee': targets['tdee'],
+            'target_calories': targets['target_calories'],
+            'target_protein': targets['protein'],
+            'target_fat': targets['fat'],
+            'target_carbs': targets['carbs'],
+            'start_date': date.today().isoformat(),
+            'current_day': 1,
         })
+        self.send_goal_info(ctx)
 
-    def handle_daily_input(self, user_id: str, text: str, user: dict, state: str):
-        """日々の記録入力を処理"""
-
-        if state == 'daily_weight':
-            # 体重を保存
-            try:
-                weight = float(text)
-                # 一時保存（セッション管理が必要）
-                # 簡略化のため、直接DBに保存
-                today = date.today().isoformat()
-                self.db.add_daily_record(user_id, {
-                    'date': today,
-                    'day_number': user.get('current_day', 1),
-                    'weight': weight
-                })
-
-                # 次のステップへ
-                self.db.update_user(user_id, {
-                    'current_weight': weight,
-                    'conversation_state': 'daily_exercise'
-                })
-
-                reply = "ありがとうございます！\n\n【運動】今日やった運動を教えてください\n（例: 30分ジョギング、筋トレ、なし）"
-                self.line_bot_api.push_message(
-                    user_id,
-                    TextSendMessage(text=reply)
-                )
-            except ValueError:
-                self.line_bot_api.push_message(
-                    user_id,
-                    TextSendMessage(text="⚠️ 数字で入力してください（例: 75.5）")
-                )
-
-        # ... 他の入力ステップも同様に実装 ...
-
-    def handle_active_user_message(self, user_id: str, text: str, user: dict):
+    def handle_active_user_message(self, ctx: UserContext, text: str):
         """アクティブユーザーのメッセージ処理"""
+        user = ctx.user
 
         if text in ["後で記録します", "スキップ"]:
             name = user.get('name', 'あなた')
             reply = f"{name}さん、了解しました！\n\n記録したくなったら、いつでもメニューから「今日の記録」をタップしてくださいね。"
-            self.line_bot_api.push_message(
-                user_id,
-                TextSendMessage(text=reply)
-            )
+            ctx.responses.add(TextSendMessage(text=reply))
         else:
             # デフォルト：今日の記録を開始
-            self.start_daily_input(user_id, user)
+            self.start_daily_input(ctx)
 
-    def send_weight_graph(self, user_id: str, user: dict):
+    def send_weight_graph(self, ctx: UserContext):
         """体重グラフを送信"""
-        if not user:
+        if not ctx.user:
             return
 
-        weight_history = self.db.get_weight_history(user_id)
+        # 集計テーブルの1行（イベント開始時に読み込み済み）だけで済ませる
+        stats = ctx.stats
 
-        if len(weight_history) < 2:
+        if not stats or stats['weight_count'] < 2:
             message = "まだグラフを表示するのに十分なデータがありません。\n\n2日以上記録をつけるとグラフが表示されます。"
-            self.line_bot_api.push_message(
-                user_id,
-                TextSendMessage(text=message)
-            )
+            ctx.responses.add(TextSendMessage(text=message))
             return
 
-        # グラフ生成（sekiguchi_bot の関数を利用）
-        # ここでは簡略化
-        message = f"📊 体重の推移\n\n開始: {weight_history[0]}kg\n現在: {weight_history[-1]}kg\n変化: {weight_history[0] - weight_history[-1]:.1f}kg"
+        start_weight = stats['start_weight']
+        latest_weight = stats['latest_weight']
+        message = f"📊 体重の推移\n\n開始: {start_weight}kg\n現在: {latest_weight}kg\n変化: {start_weight - latest_weight:.1f}kg"
+        messages = [TextSendMessage(text=message)]
 
-        self.line_bot_api.push_message(
-            user_id,
-            TextSendMessage(text=message)
-        )
+        image_url = self.get_weight_graph_url(ctx.user_id, stats)
+        if image_url:
+            messages.append(ImageSendMessage(
+                original_content_url=image_url,
+                preview_image_url=image_url
+            ))
+
+        ctx.responses.add(messages)
+
+    def get_weight_graph_url(self, user_id: str, stats: dict):
+        """
+        体重グラフ画像のURLを取得（データが変わっていなければ描画しない）
+
+        Args:
+            user_id (str): ユーザーID
+            stats (dict): get_user_stats() の集計行
 
-    def send_profile_info(self, user_id: str, user: dict):
+        Returns:
+            str or None: 画像URL（グラフ画像を送れない設定の場合はNone）
+        """
+        if not self.chart_cache or not self.chart_renderer or not self.chart_cache.base_url:
+            return None
+
+        # 記録が変わるたびに集計行の version が増えるので、履歴を読まずにキャッシュを確認できる
+        # （集計行を作り直すと version は1に戻るため、件数と期間もキーに含める）
+        data_window = [stats['version'], stats['weight_count'],
+                       stats['start_date'], stats['latest_date']]
+        filename = self.chart_cache.get(user_id, 'weight', data_window)
+        if filename is None:
+            try:
+                weight_history = self.db.get_weight_history(user_id)
+                png_bytes = self.chart_renderer.render_weight_chart(weight_history)
+            except Exception as e:
+                print(f"⚠️ グラフ描画エラー: {e}")
+                return None
+            filename = self.chart_cache.put(user_id, 'weight', data_window, png_bytes)
+
+        return self.chart_cache.url_for(filename)
+
+    def send_profile_info(self, ctx: UserContext):
         """プロフィール情報を送信"""
+        user = ctx.user
         if not user:
             return
 
@@ -268,26 +336,22 @@ class MessageHandler:
 
 💪 一緒に頑張りましょう！"""
 
-        self.line_bot_api.push_message(
-            user_id,
-            TextSendMessage(text=message)
-        )
+        ctx.responses.add(TextSendMessage(text=message))
 
-    def send_advice(self, user_id: str, user: dict):
+    def send_advice(self, ctx: UserContext):
         """アドバイスを送信"""
+        user = ctx.user
         if not user:
             return
 
         # 関口さん風のアドバイスを生成
-        advice = generate_stagnation_advice()
+        advice = _sekiguchi_main().generate_stagnation_advice()
 
-        self.line_bot_api.push_message(
-            user_id,
-            TextSendMessage(text=advice)
-        )
+        ctx.responses.add(TextSendMessage(text=advice))
 
-    def send_goal_info(self, user_id: str, user: dict):
+    def send_goal_info(self, ctx: UserContext):
         """目標情報を送信"""
+        user = ctx.user
         if not user:
             return
 
@@ -309,12 +373,9 @@ class MessageHandler:
 ±10%の範囲なら全く問題ありません。
 大切なのは完璧を目指すことではなく、続けることです。"""
 
-        self.line_bot_api.push_message(
-            user_id,
-            TextSendMessage(text=message)
-        )
+        ctx.responses.add(TextSendMessage(text=message))
 
-    def send_help_message(self, user_id: str):
+    def send_help_message(self, ctx: UserContext):
         """ヘルプメッセージを送信"""
         message = """❓ ヘルプ
 
@@ -345,7 +406,4 @@ class MessageHandler:
 【お問い合わせ】
 困ったことがあれば、いつでもメッセージを送ってください！"""
 
-        self.line_bot_api.push_message(
-            user_id,
-            TextSendMessage(text=message)
-        )
+        ctx.responses.add(TextSendMessage(text=message))
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LINE API送信スケジューラー
+APIごとのトークンバケットで送信レートを制御し、
+ユーザーへの返信（interactive）をリマインダー一斉配信（bulk）より先に送る
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+# 優先度レーン
+INTERACTIVE = 0
+BULK = 1
+
+# APIごとの既定レート（1秒あたりのリクエスト数）。環境変数 OUTBOUND_RATE_<API名> で変更できる
+DEFAULT_RATES = {
+    'reply': 100,
+    'push': 50,
+    'multicast': 20,
+    'default': 20,
+}
+
+
+class BulkQueueFull(Exception):
+    """bulkレーンが満杯で、指定時間内に空かなかった"""
+
+
+class TokenBucket:
+    """トークンバケット（複数スレッドで共有）"""
+
+    def __init__(self, rate, capacity=None):
+        """
+        初期化
+
+        Args:
+            rate (float): 1秒あたりに補充するトークン数
+            capacity (float, optional): 最大トークン数（省略時は rate、最低1）
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, reserve=0.0):
+        """
+        トークンを1つ取る
+
+        Args:
+            reserve (float): 取った後に残しておくトークン数（bulkが返信の分を使い切らないように）
+
+        Returns:
+            float: 取れた場合は0、取れない場合は取れるようになるまでの秒数
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens - 1 >= reserve:
+                self.tokens -= 1
+                return 0.0
+            return (reserve + 1 - self.tokens) / self.rate
+
+    def penalize(self, seconds):
+        """429を受けたときに、指定秒数ぶん送信を止める"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class OutboundScheduler:
+    """優先度レーンつきの送信スケジューラー"""
+
+    def __init__(self, rates=None, workers=4, interactive_workers=1,
+                 bulk_queue_size=100, bulk_reserve=0.2):
+        """
+        初期化
+
+        Args:
+            rates (dict, optional): {API名: 1秒あたりのリクエスト数}（省略時は DEFAULT_RATES と環境変数）
+            workers (int): 両方のレーンを処理するワーカー数
+            interactive_workers (int): 返信だけを処理するワーカー数（bulkの処理中でも返信を待たせない）
+            bulk_queue_size (int): bulkレーンに積めるジョブ数（満杯なら送信側を待たせる）
+            bulk_reserve (float): bulkが使わずに残すトークンの割合（0〜1）
+        """
+        if rates is None:
+            rates = {
+                endpoint: float(os.getenv(f'OUTBOUND_RATE_{endpoint.upper()}', rate))
+                for endpoint, rate in DEFAULT_RATES.items()
+            }
+        self.buckets = {endpoint: TokenBucket(rate) for endpoint, rate in rates.items()}
+        self.buckets.setdefault('default', TokenBucket(DEFAULT_RATES['default']))
+        self.workers = workers
+        self.interactive_workers = interactive_workers
+        self.bulk_reserve = bulk_reserve
+
+        self._lanes = {INTERACTIVE: deque(), BULK: deque()}
+        self._cond = threading.Condition()
+        self._bulk_slots = threading.BoundedSemaphore(bulk_queue_size)
+        self._threads = []
+        self._running = False
+
+        self._stats_lock = threading.Lock()
+        self.completed = {INTERACTIVE: 0, BULK: 0}
+        self.failed = {INTERACTIVE: 0, BULK: 0}
+        self._interactive_waits = deque(maxlen=500)
+
+    def start(self):
+        """ワーカーを起動"""
+        if self._running:
+            return
+        self._running = True
+        for i in range(self.interactive_workers):
+            self._start_thread(f"outbound-interactive-{i}", allow_bulk=False)
+        for i in range(self.workers):
+            self._start_thread(f"outbound-{i}", allow_bulk=True)
+        print(f"✅ 送信スケジューラー起動: ワーカー{self.workers}（返信専用{self.interactive_workers}）")
+
+    def _start_thread(self, name, allow_bulk):
+        thread = threading.Thread(target=self._worker, args=(allow_bulk,), name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """積まれているジョブを処理し終えたらワーカーを停止"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def bucket_for(self, endpoint):
+        return self.buckets.get(endpoint) or self.buckets['default']
+
+    def submit(self, endpoint, func, *args, priority=INTERACTIVE, timeout=None, **kwargs):
+        """
+        API呼び出しを積む
+
+        bulkレーンが満杯の場合は空くまで待つ（一斉配信の送信側を減速させる）。
+
+        Args:
+            endpoint (str): レート制御に使うAPI名（'reply', 'push', 'multicast' など）
+            func (callable): 呼び出す関数（例: line_bot_api.push_message）
+            *args, **kwargs: func に渡す引数
+            priority (int): INTERACTIVE または BULK
+            timeout (float, optional): bulkレーンが空くのを待つ最大秒数
+
+        Returns:
+            concurrent.futures.Future: func の返り値
+        """
+        if priority == BULK and not self._bulk_slots.acquire(timeout=timeout):
+            raise BulkQueueFull(f"bulkレーンが満杯です（{endpoint}）")
+
+        future = Future()
+        job = (endpoint, func, args, kwargs, future, priority, time.monotonic())
+        with self._cond:
+            self._lanes[priority].append(job)
+            self._cond.notify_all()
+        return future
+
+    def call(self, endpoint, func, *args, priority=INTERACTIVE, **kwargs):
+        """API呼び出しを積み、結果が出るまで待つ（例外はそのまま送出）"""
+        return self.submit(endpoint, func, *args, priority=priority, **kwargs).result()
+
+    def penalize(self, endpoint, seconds):
+        """429を受けたAPIの送信を指定秒数止める（両方のレーン）"""
+        self.bucket_for(endpoint).penalize(seconds)
+
+    def _pick(self, allow_bulk):
+        """
+        次に実行するジョブを選ぶ（self._cond を取得した状態で呼ぶ）
+
+        Returns:
+            tuple: (ジョブ, None) または (None, 次に確認するまでの秒数。何も積まれていなければNone)
+        """
+        retry_in = None
+
+        interactive = self._lanes[INTERACTIVE]
+        if interactive:
+            wait = self.bucket_for(interactive[0][0]).take()
+            if wait == 0:
+                return interactive.popleft(), None
+            retry_in = wait
+
+        bulk = self._lanes[BULK]
+        if allow_bulk and bulk:
+            bucket = self.bucket_for(bulk[0][0])
+            # bulkはトークンの一部を返信のために残す。取れなければ返信に譲って後回しにする
+            wait = bucket.take(reserve=bucket.capacity * self.bulk_reserve)
+            if wait == 0:
+                return bulk.popleft(), None
+            retry_in = wait if retry_in is None else min(retry_in, wait)
+
+        return None, retry_in
+
+    def _worker(self, allow_bulk):
+        while True:
+            with self._cond:
+                while True:
+                    job, retry_in = self._pick(allow_bulk)
+                    if job is not None:
+                        break
+                    if not self._running and not self._lanes[INTERACTIVE] and not (
+                            allow_bulk and self._lanes[BULK]):
+                        return
+                    self._cond.wait(timeout=retry_in)
+            self._run(job)
+
+    def _run(self, job):
+        endpoint, func, args, kwargs, future, priority, queued_at = job
+        if priority == BULK:
+            self._bulk_slots.release()
+        else:
+            with self._stats_lock:
+                self._interactive_waits.append(time.monotonic() - queued_at)
+
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            with self._stats_lock:
+                self.failed[priority] += 1
+            future.set_exception(e)
+        else:
+            with self._stats_lock:
+                self.completed[priority] += 1
+            future.set_result(result)
+
+    def stats(self):
+        """
+        スケジューラーの状態
+
+        Returns:
+            dict: 積まれている件数・処理件数・返信の待ち時間（秒、平均と最大）
+        """
+        with self._cond:
+            queued = {'interactive': len(self._lanes[INTERACTIVE]), 'bulk': len(self._lanes[BULK])}
+        with self._stats_lock:
+            waits = list(self._interactive_waits)
+            return {
+                'queued': queued,
+                'completed': {'interactive': self.completed[INTERACTIVE], 'bulk': self.completed[BULK]},
+                'failed': {'interactive': self.failed[INTERACTIVE], 'bulk': self.failed[BULK]},
+                'interactive_wait_avg': sum(waits) / len(waits) if waits else 0.0,
+                'interactive_wait_max': max(waits) if waits else 0.0,
+            }
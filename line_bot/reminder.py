@@ -9,38 +9,66 @@ from datetime import datetime
 from linebot.models import TextSendMessage, QuickReply, QuickReplyButton, MessageAction
 import random
 
+from reminder_dispatcher import ReminderDispatcher
+
+
+# リマインダーの文面（{name} にユーザー名を入れる）
+# 名前を入れた文面が同じになるのは同じ名前のユーザーだけなので、multicastにまとまるのは一部で、
+# ほとんどは1人1回のpushになる（送信は並列・レート制限つき）
+REMINDER_MESSAGES = [
+    "おはようございます、{name}さん！\n\n今朝の体重はいかがでしたか？😊",
+    "{name}さん、おはようございます！\n\n今日も一緒に頑張りましょう。\n今朝の体重を教えてください。",
+    "おはようございます！\n\n{name}さん、今朝の体重測定はお済みですか？\n記録をお待ちしています。",
+    "{name}さん、朝です！☀️\n\n今朝の体重を記録しましょう。\n継続が何より大切ですよ。",
+    "おはようございます、{name}さん！\n\n体重計に乗りましたか？\n今日も一歩前進しましょう！",
+    "{name}さん、新しい一日の始まりです！\n\n今朝の体重を記録して、\n良いスタートを切りましょう。",
+    "おはようございます！\n\n{name}さん、今日の体重測定の時間です。\nあなたならできます！",
+    "{name}さん、おはようございます！🌅\n\n毎日の記録が未来を作ります。\n今朝の体重を教えてくださいね。",
+]
+
 
 class ReminderService:
     """リマインダー送信サービス"""
 
-    def __init__(self, database, line_bot_api):
+    def __init__(self, database, line_bot_api, dispatcher=None, outbound_scheduler=None):
         self.db = database
         self.line_bot_api = line_bot_api
+        self.dispatcher = dispatcher or ReminderDispatcher(line_bot_api, scheduler=outbound_scheduler)
 
     def send_daily_reminders(self):
         """
         毎日10時に実行：今日の記録がないユーザーにリマインダーを送信
+
+        文面に名前が入るため、multicastにまとまるのは同じ名前のユーザーだけで、
+        ほとんどのユーザーには1人1回のpushになる。高速化は並列送信によるもの。
         """
         print(f"[{datetime.now()}] リマインダー送信開始...")
 
         # 今日の記録がないユーザーを取得
-        user_ids = self.db.get_users_without_today_record()
+        targets = self.db.get_reminder_targets()
 
-        if not user_ids:
+        if not targets:
             print("📭 リマインダー送信対象のユーザーなし")
             return
 
-        print(f"📬 リマインダー送信対象: {len(user_ids)}人")
+        print(f"📬 リマインダー送信対象: {len(targets)}人")
 
-        for user_id in user_ids:
-            try:
-                self.send_reminder_to_user(user_id)
-                print(f"✅ リマインダー送信完了: {user_id}")
-            except Exception as e:
-                print(f"⚠️ リマインダー送信エラー ({user_id}): {e}")
+        # 文面は配信ごとに1つ選ぶ。名前を入れた文面が同じユーザー（同じ名前）だけが最大500人ずつmulticastにまとまり、
+        # それ以外は1人ずつpushする
+        template = random.choice(REMINDER_MESSAGES)
+        messages_by_user = {
+            target['user_id']: self.build_reminder_message(target.get('name') or 'あなた', template)
+            for target in targets
+        }
+        report = self.dispatcher.dispatch(messages_by_user)
 
+        print(f"✅ 送信成功: {report['sent']}人 / ⚠️ 失敗: {report['failed']}人 "
+              f"（リクエスト{report['requests']}回、{report['elapsed']:.1f}秒、"
+              f"{report['throughput']:.1f}人/秒）")
         print(f"[{datetime.now()}] リマインダー送信完了")
 
+        return report
+
     def send_reminder_to_user(self, user_id: str):
         """
         個別ユーザーにリマインダーを送信
@@ -52,21 +80,23 @@ class ReminderService:
         if not user:
             return
 
-        name = user.get('name', 'あなた')
+        name = user.get('name') or 'あなた'
+        _, message = self.build_reminder_message(name)
 
-        # ランダムなリマインダーメッセージ
-        reminder_messages = [
-            f"おはようございます、{name}さん！\n\n今朝の体重はいかがでしたか？😊",
-            f"{name}さん、おはようございます！\n\n今日も一緒に頑張りましょう。\n今朝の体重を教えてください。",
-            f"おはようございます！\n\n{name}さん、今朝の体重測定はお済みですか？\n記録をお待ちしています。",
-            f"{name}さん、朝です！☀️\n\n今朝の体重を記録しましょう。\n継続が何より大切ですよ。",
-            f"おはようございます、{name}さん！\n\n体重計に乗りましたか？\n今日も一歩前進しましょう！",
-            f"{name}さん、新しい一日の始まりです！\n\n今朝の体重を記録して、\n良いスタートを切りましょう。",
-            f"おはようございます！\n\n{name}さん、今日の体重測定の時間です。\nあなたならできます！",
-            f"{name}さん、おはようございます！🌅\n\n毎日の記録が未来を作ります。\n今朝の体重を教えてくださいね。",
-        ]
+        self.line_bot_api.push_message(user_id, message)
 
-        message = random.choice(reminder_messages)
+    def build_reminder_message(self, name: str, template: str = None):
+        """
+        リマインダーメッセージを作成
+
+        Args:
+            name (str): ユーザー名
+            template (str, optional): REMINDER_MESSAGES の文面（省略時はランダムに1つ選ぶ）
+
+        Returns:
+            tuple: (文面, TextSendMessage)
+        """
+        message = (template or random.choice(REMINDER_MESSAGES)).format(name=name)
 
         # クイックリプライボタンを追加
         quick_reply = QuickReply(items=[
@@ -74,10 +104,7 @@ class ReminderService:
             QuickReplyButton(action=MessageAction(label="後で記録します", text="後で記録します")),
         ])
 
-        self.line_bot_api.push_message(
-            user_id,
-            TextSendMessage(text=message, quick_reply=quick_reply)
-        )
+        return message, TextSendMessage(text=message, quick_reply=quick_reply)
 
     def send_encouragement_reminder(self, user_id: str):
         """
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+リマインダー一斉配信エンジン
+同じ文面のユーザーをまとめてmulticastし、並列かつレート制限を守って送信する
+"""
+
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from linebot.exceptions import LineBotApiError
+
+from outbound_scheduler import BULK
+
+
+# LINE multicast APIの1リクエストあたりの最大宛先数
+MULTICAST_MAX_RECIPIENTS = 500
+
+# 同じリトライキーのリクエストがすでに受け付けられているときのステータス
+RETRY_KEY_ACCEPTED = 409
+
+
+class RatePacer:
+    """リクエスト間隔を一定以上に保つペーサー（複数スレッドで共有）"""
+
+    def __init__(self, requests_per_second=20):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """次のリクエストを送ってよい時刻まで待つ"""
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    def penalize(self, seconds):
+        """429を受けたときに全スレッドの送信を遅らせる"""
+        with self._lock:
+            self._next_time = max(self._next_time, time.monotonic() + seconds)
+
+
+class ReminderDispatcher:
+    """メッセージをまとめて並列配信するクラス"""
+
+    def __init__(self, line_bot_api, max_workers=8, requests_per_second=20,
+                 rate_limit_wait=1.0, scheduler=None):
+        """
+        初期化
+
+        Args:
+            line_bot_api: LineBotApiインスタンス
+            max_workers (int): 同時送信数
+            requests_per_second (int): 1秒あたりの最大リクエスト数（scheduler 指定時は使わない）
+            rate_limit_wait (float): 429で失敗したときに他のバッチの送信を遅らせる秒数
+            scheduler (OutboundScheduler, optional): 送信スケジューラー
+                指定するとbulkレーンで送信し、レートはスケジューラーのトークンバケットで制御する
+                （ユーザーへの返信が優先され、bulkレーンが満杯なら配信側が待つ）
+        """
+        self.line_bot_api = line_bot_api
+        self.scheduler = scheduler
+        self.max_workers = max_workers
+        self.pacer = RatePacer(requests_per_second)
+        self.rate_limit_wait = rate_limit_wait
+
+    def dispatch(self, messages_by_user):
+        """
+        ユーザーごとのメッセージを配信
+
+        同じ文面のユーザーはmulticast（最大500人）にまとめ、
+        1人だけの文面はpush_messageで送る。
+
+        Args:
+            messages_by_user (dict): {user_id: (text, message)}
+                text は文面のグループ化に使うキー、message はSendMessageオブジェクト
+
+        Returns:
+            dict: 配信レポート（sent, failed, requests, elapsed, throughput, failed_user_ids）
+        """
+        start = time.monotonic()
+
+        # 同じ文面ごとに宛先をまとめる
+        groups = defaultdict(list)
+        message_for_text = {}
+        for user_id, (text, message) in messages_by_user.items():
+            groups[text].append(user_id)
+            message_for_text[text] = message
+
+        batches = []
+        for text, user_ids in groups.items():
+            for i in range(0, len(user_ids), MULTICAST_MAX_RECIPIENTS):
+                batches.append((user_ids[i:i + MULTICAST_MAX_RECIPIENTS], message_for_text[text]))
+
+        sent = 0
+        failed_user_ids = []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._send_batch, user_ids, message): user_ids
+                for user_ids, message in batches
+            }
+            for future in as_completed(futures):
+                user_ids = futures[future]
+                try:
+                    future.result()
+                    sent += len(user_ids)
+                except Exception as e:
+                    failed_user_ids.extend(user_ids)
+                    print(f"⚠️ リマインダー送信エラー ({len(user_ids)}人): {e}")
+
+        elapsed = time.monotonic() - start
+        return {
+            "sent": sent,
+            "failed": len(failed_user_ids),
+            "requests": len(batches),
+            "elapsed": elapsed,
+            "throughput": sent / elapsed if elapsed > 0 else float(sent),
+            "failed_user_ids": failed_user_ids,
+        }
+
+    def _send_batch(self, user_ids, message):
+        """
+        1バッチを送信
+
+        429/5xxのリトライは通信層（PooledHttpClient）が同じリトライキーで行うので、ここではリトライせず
+        失敗として記録する。通信層のリトライ後にLINE側で処理済みだった場合は409が返るので、
+        送信済みとして扱い同じメッセージを2回届けない。
+        """
+        if len(user_ids) == 1:
+            endpoint, func, args = 'push', self.line_bot_api.push_message, (user_ids[0], message)
+        else:
+            endpoint, func, args = 'multicast', self.line_bot_api.multicast, (user_ids, message)
+
+        try:
+            if self.scheduler is None:
+                self.pacer.wait()
+                func(*args)
+            else:
+                self.scheduler.call(endpoint, func, *args, priority=BULK)
+        except LineBotApiError as e:
+            if e.status_code == RETRY_KEY_ACCEPTED:
+                return
+            if e.status_code == 429:
+                # 通信層のリトライでも429が続いたので、残りのバッチの送信を遅らせる
+                if self.scheduler is None:
+                    self.pacer.penalize(self.rate_limit_wait)
+                else:
+                    self.scheduler.penalize(endpoint, self.rate_limit_wait)
+            raise
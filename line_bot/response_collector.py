@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+イベント単位の返信まとめ
+1つのイベントで作ったメッセージをためておき、reply_message 1回でまとめて返信する。
+リプライトークンが期限切れ・使用済みの場合や5件を超えた分だけpushで送る
+"""
+
+import os
+import time
+
+from linebot.exceptions import LineBotApiError
+
+from outbound_scheduler import INTERACTIVE
+
+
+# 1回の reply_message / push_message で送れるメッセージ数の上限
+MAX_MESSAGES_PER_REQUEST = 5
+
+# リプライトークンを使う期限（イベント発生からの秒数）。過ぎていたら最初からpushで送る
+REPLY_TOKEN_TTL = float(os.getenv('REPLY_TOKEN_TTL', 50))
+
+
+def _is_reply_token_error(error: LineBotApiError) -> bool:
+    """リプライトークンが無効（期限切れ・使用済み）によるエラーかどうか"""
+    message = getattr(error.error, 'message', '') or ''
+    return error.status_code == 400 and 'reply token' in message.lower()
+
+
+class ResponseCollector:
+    """1つのイベントの返信メッセージをまとめて送るクラス"""
+
+    def __init__(self, line_bot_api, user_id: str, reply_token: str = None, event_timestamp: int = None,
+                 scheduler=None):
+        """
+        初期化
+
+        Args:
+            line_bot_api: LineBotApiインスタンス
+            user_id (str): 送信先のユーザーID（pushで送る場合に使用）
+            reply_token (str, optional): イベントのリプライトークン
+            event_timestamp (int, optional): イベント発生時刻（ミリ秒、event.timestamp）
+            scheduler (OutboundScheduler, optional): 送信スケジューラー（指定時は優先レーンで送る）
+        """
+        self.line_bot_api = line_bot_api
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.reply_token = reply_token
+        self.event_timestamp = event_timestamp
+        self.messages = []
+        self.reply_count = 0
+        self.push_count = 0
+
+    def add(self, messages):
+        """
+        送信するメッセージを追加
+
+        Args:
+            messages: SendMessage、またはそのリスト
+        """
+        if isinstance(messages, (list, tuple)):
+            self.messages.extend(messages)
+        else:
+            self.messages.append(messages)
+
+    def discard(self):
+        """ためたメッセージを送らずに破棄（リプライトークンは残す）"""
+        self.messages = []
+
+    def _reply_token_usable(self) -> bool:
+        if not self.reply_token:
+            return False
+        if self.event_timestamp is None:
+            return True
+        return time.time() - self.event_timestamp / 1000 < REPLY_TOKEN_TTL
+
+    def _call(self, endpoint, func, *args):
+        """APIを呼び出す（スケジューラーがあれば優先レーンに積んで結果を待つ）"""
+        if self.scheduler is None:
+            return func(*args)
+        return self.scheduler.call(endpoint, func, *args, priority=INTERACTIVE)
+
+    def flush(self) -> dict:
+        """
+        ためたメッセージを送信
+
+        先頭の5件は reply_message で送り、残りと返信できなかった分は push_message で送る。
+
+        Returns:
+            dict: replied（返信で送った件数）, pushed（pushで送った件数）, requests（API呼び出し回数）
+        """
+        messages = self.messages
+        self.messages = []
+        replied = 0
+        requests = 0
+
+        if messages and self._reply_token_usable():
+            batch = messages[:MAX_MESSAGES_PER_REQUEST]
+            try:
+                self._call('reply', self.line_bot_api.reply_message, self.reply_token, batch)
+                replied = len(batch)
+                messages = messages[MAX_MESSAGES_PER_REQUEST:]
+            except LineBotApiError as e:
+                if not _is_reply_token_error(e):
+                    raise
+                print(f"⚠️ リプライトークンが使えないためpushで送信します: {e.error.message}")
+            requests += 1
+            # リプライトークンは1回しか使えない
+            self.reply_token = None
+
+        pushed = 0
+        for start in range(0, len(messages), MAX_MESSAGES_PER_REQUEST):
+            batch = messages[start:start + MAX_MESSAGES_PER_REQUEST]
+            self._call('push', self.line_bot_api.push_message, self.user_id, batch)
+            pushed += len(batch)
+            requests += 1
+
+        self.reply_count += replied
+        self.push_count += pushed
+        return {"replied": replied, "pushed": pushed, "requests": requests}
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+挫折リスク一括判定
+全アクティブユーザーの直近N日分の記録を1回のクエリで読み込み、
+sekiguchi_bot の detect_dropout_risk と同じルールをNumPyでまとめて判定する
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+
+
+RISK_LEVELS = ("low", "medium", "high")
+
+# 判定のしきい値（sekiguchi_bot/main.py の detect_dropout_risk と同じ値）
+RECENT_RECORDS = 3             # カロリー超過・タンパク質不足を見る直近の記録数
+STAGNATION_WEIGHTS = 8         # 停滞判定に使う体重の数（初日含む）
+STAGNATION_THRESHOLD = 0.3     # 7日間の変化がこれ未満なら停滞（kg）
+WEIGHT_GAIN_THRESHOLD = 0.5    # 7日間でこれ以上増えたら増加傾向（kg）
+PROTEIN_DEFICIT_RATIO = 0.7    # 目標の70%未満でタンパク質不足
+MISSING_DAYS_THRESHOLD = 2     # 記録の抜けがこの日数以上で高リスク
+
+
+class RiskSweep:
+    """全ユーザーの挫折リスクを一括判定するクラス"""
+
+    def __init__(self, database, window_days=14):
+        """
+        初期化
+
+        Args:
+            database: Databaseインスタンス
+            window_days (int): 読み込む日数（停滞判定のため8日以上）
+        """
+        self.db = database
+        self.window_days = max(window_days, STAGNATION_WEIGHTS)
+
+    def load(self, today=None):
+        """
+        全アクティブユーザーの直近の記録を配列に読み込む
+
+        記録は新しいものが右端に来るよう右詰めで並べ、欠損はNaNにする。
+
+        Args:
+            today (date, optional): 基準日（省略時は今日）
+
+        Returns:
+            dict: user_ids, target_calories, target_protein, calories, protein,
+                  weights, record_counts, weight_counts, expected_days
+        """
+        today = today or date.today()
+        window_start = today - timedelta(days=self.window_days - 1)
+        conn = self.db.get_connection()
+
+        # 件数の取得と本体の読み込みを同じスナップショットで行う
+        conn.execute('BEGIN')
+        try:
+            return self._load(conn, today, window_start)
+        finally:
+            conn.commit()
+
+    def _load(self, conn, today, window_start):
+        user_count = conn.execute(
+            "SELECT COUNT(*) FROM users WHERE conversation_state = 'active'"
+        ).fetchone()[0]
+
+        n = self.window_days
+        user_ids = []
+        target_calories = np.full(user_count, np.nan)
+        target_protein = np.full(user_count, np.nan)
+        calories = np.full((user_count, n), np.nan)
+        protein = np.full((user_count, n), np.nan)
+        weights = np.full((user_count, n), np.nan)
+        record_counts = np.zeros(user_count, dtype=np.int64)
+        weight_counts = np.zeros(user_count, dtype=np.int64)
+        expected_days = np.zeros(user_count, dtype=np.int64)
+
+        # ユーザーID順・日付順に1行ずつ読み、ユーザーごとにまとめて配列へ書き込む
+        cursor = conn.execute('''
+            SELECT u.user_id, u.target_calories, u.target_protein, u.start_date,
+                   dr.date, dr.weight, dr.calories, dr.protein
+            FROM users u
+            LEFT JOIN daily_records dr
+                ON u.user_id = dr.user_id AND dr.date >= ? AND dr.date <= ?
+            WHERE u.conversation_state = 'active'
+            ORDER BY u.user_id, dr.date
+        ''', (window_start.isoformat(), today.isoformat()))
+
+        index = -1
+        current_user = None
+        rows = []
+        for row in cursor:
+            if row[0] != current_user:
+                if current_user is not None:
+                    self._fill(index, rows, calories, protein, weights, record_counts, weight_counts)
+                index += 1
+                current_user = row[0]
+                rows = []
+                user_ids.append(current_user)
+                target_calories[index] = row[1] if row[1] is not None else np.nan
+                target_protein[index] = row[2] if row[2] is not None else np.nan
+                expected_days[index] = self._expected_days(row[3], window_start, today)
+            if row[4] is not None:
+                rows.append(row[4:])
+        if current_user is not None:
+            self._fill(index, rows, calories, protein, weights, record_counts, weight_counts)
+
+        size = len(user_ids)
+        return {
+            "user_ids": user_ids,
+            "target_calories": target_calories[:size],
+            "target_protein": target_protein[:size],
+            "calories": calories[:size],
+            "protein": protein[:size],
+            "weights": weights[:size],
+            "record_counts": record_counts[:size],
+            "weight_counts": weight_counts[:size],
+            "expected_days": expected_days[:size],
+        }
+
+    @staticmethod
+    def _expected_days(start_date, window_start, today):
+        """期間内で記録があるべき日数（今日を除く、開始日以降）"""
+        first_day = window_start
+        if start_date:
+            first_day = max(first_day, date.fromisoformat(start_date))
+        return max((today - first_day).days, 0)
+
+    @staticmethod
+    def _fill(index, rows, calories, protein, weights, record_counts, weight_counts):
+        """1ユーザー分の記録を右詰めで書き込む"""
+        if not rows:
+            return
+        n = calories.shape[1]
+        count = len(rows)
+        values = np.array(
+            [(np.nan if r[2] is None else r[2],
+              np.nan if r[3] is None else r[3],
+              np.nan if r[1] is None else r[1]) for r in rows],
+            dtype=float
+        )
+        calories[index, n - count:] = values[:, 0]
+        protein[index, n - count:] = values[:, 1]
+        record_counts[index] = count
+
+        weight_values = values[:, 2][~np.isnan(values[:, 2])]
+        if len(weight_values):
+            weights[index, n - len(weight_values):] = weight_values
+        weight_counts[index] = len(weight_values)
+
+    def score(self, data):
+        """
+        読み込んだ配列から挫折リスクを判定する
+
+        Args:
+            data (dict): load() の返り値
+
+        Returns:
+            dict: user_ids, risk_level（0=low, 1=medium, 2=high）と各ルールの判定結果の配列
+        """
+        recent_calories = data["calories"][:, -RECENT_RECORDS:]
+        recent_protein = data["protein"][:, -RECENT_RECORDS:]
+        has_recent = data["record_counts"] >= RECENT_RECORDS
+
+        # 1. カロリー超過（直近3記録）。NaNとの比較はFalseなので記録なしは超過扱いしない
+        over_count = np.sum(recent_calories > data["target_calories"][:, None], axis=1)
+        over_count = np.where(has_recent, over_count, 0)
+        calorie_over_high = over_count == RECENT_RECORDS
+        calorie_over_medium = over_count == RECENT_RECORDS - 1
+
+        # 2. 停滞・増加（直近8回の体重の最初と最後）
+        weights = data["weights"]
+        has_weights = data["weight_counts"] >= STAGNATION_WEIGHTS
+        weight_change = weights[:, -STAGNATION_WEIGHTS] - weights[:, -1]
+        stagnation = has_weights & (np.abs(weight_change) < STAGNATION_THRESHOLD)
+        weight_gain = has_weights & ~stagnation & (weight_change < -WEIGHT_GAIN_THRESHOLD)
+
+        # 3. タンパク質不足（直近3記録のうち2回以上、目標の70%未満）
+        protein_limit = data["target_protein"][:, None] * PROTEIN_DEFICIT_RATIO
+        protein_issues = np.sum((recent_protein > 0) & (recent_protein < protein_limit), axis=1)
+        protein_deficit = has_recent & (protein_issues >= 2)
+
+        # 4. 記録の抜け
+        missing_days = np.maximum(data["expected_days"] - data["record_counts"], 0)
+        missing = missing_days >= MISSING_DAYS_THRESHOLD
+
+        # 高リスクのルールは無条件にhigh、中リスクのルールはlowのときだけmedium
+        # → 該当したルールのレベルの最大値と同じ
+        risk_level = np.zeros(len(data["user_ids"]), dtype=np.int8)
+        risk_level = np.where(calorie_over_medium | stagnation | protein_deficit, 1, risk_level)
+        risk_level = np.where(calorie_over_high | weight_gain | missing, 2, risk_level)
+
+        return {
+            "user_ids": data["user_ids"],
+            "risk_level": risk_level,
+            "calorie_over_count": over_count,
+            "stagnation": stagnation,
+            "weight_gain": weight_gain,
+            "protein_deficit": protein_deficit,
+            "missing_days": missing_days,
+        }
+
+    def run(self, today=None, min_level="medium"):
+        """
+        全ユーザーを判定し、指定レベル以上のユーザーを返す（夜間バッチ用）
+
+        Args:
+            today (date, optional): 基準日
+            min_level (str): 返す最低リスクレベル
+
+        Returns:
+            list[dict]: [{user_id, risk_level, calorie_over_count, stagnation,
+                          weight_gain, protein_deficit, missing_days}, ...]
+        """
+        result = self.score(self.load(today))
+        threshold = RISK_LEVELS.index(min_level)
+
+        table = []
+        for i in np.flatnonzero(result["risk_level"] >= threshold):
+            table.append({
+                "user_id": result["user_ids"][i],
+                "risk_level": RISK_LEVELS[result["risk_level"][i]],
+                "calorie_over_count": int(result["calorie_over_count"][i]),
+                "stagnation": bool(result["stagnation"][i]),
+                "weight_gain": bool(result["weight_gain"][i]),
+                "protein_deficit": bool(result["protein_deficit"][i]),
+                "missing_days": int(result["missing_days"][i]),
+            })
+        return table
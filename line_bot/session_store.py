@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+会話状態ストア
+会話状態（conversation_state）をメモリ（またはRedis互換サーバー）に保持し、
+データベースへは変更をためて定期的にまとめて書き戻す（write-behind）
+"""
+
+import threading
+import time
+
+
+class MemoryStateBackend:
+    """プロセス内の辞書に保持するバックエンド（有効期限つき）"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str):
+        """会話状態を取得（ない・期限切れの場合はNone）"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._entries[user_id]
+                return None
+            return entry[0]
+
+    def set(self, user_id: str, state: str, ttl_seconds: float):
+        """会話状態を保存"""
+        with self._lock:
+            self._entries[user_id] = (state, time.monotonic() + ttl_seconds)
+
+    def purge_expired(self):
+        """期限切れのエントリを削除"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [user_id for user_id, (_, expires_at) in self._entries.items() if expires_at < now]
+            for user_id in expired:
+                del self._entries[user_id]
+
+
+class RedisStateBackend:
+    """Redis互換サーバーに保持するバックエンド（複数プロセスで共有できる）"""
+
+    KEY_PREFIX = 'conversation_state:'
+
+    def __init__(self, url: str):
+        """
+        初期化
+
+        Args:
+            url (str): 接続先（例: redis://localhost:6379/0）
+        """
+        import redis
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, user_id: str):
+        return self._client.get(self.KEY_PREFIX + user_id)
+
+    def set(self, user_id: str, state: str, ttl_seconds: float):
+        self._client.set(self.KEY_PREFIX + user_id, state, ex=max(int(ttl_seconds), 1))
+
+    def purge_expired(self):
+        # 有効期限はサーバー側で処理される
+        pass
+
+
+class ConversationStateStore:
+    """会話状態のキャッシュと書き戻し"""
+
+    def __init__(self, database, ttl_seconds=30 * 60, flush_interval=2.0, backend=None):
+        """
+        初期化
+
+        Args:
+            database: Databaseインスタンス（書き戻し先）
+            ttl_seconds (float): 会話状態を保持する秒数（過ぎたらデータベースの値を使う）
+            flush_interval (float): データベースへ書き戻す間隔（秒）
+            backend: 保存先（省略時は MemoryStateBackend）
+        """
+        self.db = database
+        self.ttl_seconds = ttl_seconds
+        self.flush_interval = flush_interval
+        self.backend = backend or MemoryStateBackend()
+        self.flushed_count = 0
+        self.flush_batches = 0
+
+        self._dirty = {}
+        self._dirty_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """書き戻しスレッドを起動"""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name="state-flush", daemon=True)
+        self._thread.start()
+        print(f"✅ 会話状態ストア起動: {self.flush_interval}秒ごとに書き戻し")
+
+    def stop(self):
+        """書き戻しスレッドを停止し、残りを書き戻す"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def get(self, user_id: str):
+        """
+        会話状態を取得
+
+        Returns:
+            str or None: 会話状態（保持していない場合はNone。データベースの値を使う）
+        """
+        with self._dirty_lock:
+            state = self._dirty.get(user_id)
+        if state is not None:
+            return state
+        return self.backend.get(user_id)
+
+    def set(self, user_id: str, state: str):
+        """
+        会話状態を変更（データベースへは次の書き戻しで反映）
+
+        Args:
+            user_id (str): ユーザーID
+            state (str): 新しい会話状態
+        """
+        self.backend.set(user_id, state, self.ttl_seconds)
+        with self._dirty_lock:
+            self._dirty[user_id] = state
+
+    def flush(self) -> int:
+        """
+        ためている変更をデータベースにまとめて書き戻す
+
+        Returns:
+            int: 書き戻したユーザー数
+        """
+        with self._dirty_lock:
+            dirty = self._dirty
+            self._dirty = {}
+        if not dirty:
+            return 0
+
+        if not self.db.update_conversation_states(dirty):
+            # 失敗したら次回に再挑戦（その間に変わった状態は新しいほうを残す）
+            with self._dirty_lock:
+                for user_id, state in dirty.items():
+                    self._dirty.setdefault(user_id, state)
+            return 0
+
+        self.flushed_count += len(dirty)
+        self.flush_batches += 1
+        return len(dirty)
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+                self.backend.purge_expired()
+            except Exception as e:
+                print(f"⚠️ 会話状態の書き戻しエラー: {e}")
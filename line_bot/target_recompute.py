@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目標カロリー・PFCの一括再計算
+全ユーザー（またはCSV/JSONLのプロフィール）のBMR・TDEE・目標カロリー・PFCを
+NumPyでまとめて計算し、executemany で順に書き戻す
+
+計算式・係数を変えたときは、ユーザーごとのループを回さずに次のコマンドで全員分を更新できる:
+    python target_recompute.py --db diet_mentor.db
+    python target_recompute.py --db diet_mentor.db --import profiles.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from conversation_flow import REGISTRATION_FLOW
+
+# 親ディレクトリのモジュールをインポートできるようにする
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nutrition_core import MALE, arrays as nutrition_arrays
+
+
+# 計算に必要な項目と、計算結果を保存する項目
+INPUT_FIELDS = ('gender', 'age', 'height', 'current_weight', 'activity_coefficient', 'reduction_rate')
+TARGET_FIELDS = ('bmr', 'tdee', 'target_calories', 'target_protein', 'target_fat', 'target_carbs')
+
+# nutrition_core.arrays.targets() の返り値の項目 → users テーブルの列名
+_TARGET_COLUMNS = {
+    'bmr': 'bmr',
+    'tdee': 'tdee',
+    'target_calories': 'target_calories',
+    'protein': 'target_protein',
+    'fat': 'target_fat',
+    'carbs': 'target_carbs',
+}
+
+# インポートファイルから users テーブルに保存できる項目
+IMPORT_FIELDS = (
+    'name', 'gender', 'age', 'height', 'activity_level', 'activity_coefficient',
+    'diet_mode', 'reduction_rate', 'current_weight', 'initial_weight', 'target_weight',
+    'plan_name', 'duration_days', 'start_date', 'current_day',
+)
+
+# 係数の代わりに選択肢のラベルだけがある行の変換表（会話フローの選択肢と同じ値）
+_REGISTRATION_STEPS = {step['state']: step for step in REGISTRATION_FLOW}
+ACTIVITY_COEFFICIENTS = {
+    label: values['activity_coefficient']
+    for label, values in _REGISTRATION_STEPS['register_activity']['choices'].items()
+}
+REDUCTION_RATES = {
+    label: values['reduction_rate']
+    for label, values in _REGISTRATION_STEPS['register_mode']['choices'].items()
+}
+
+
+def compute_targets(is_male, weight, height, age, activity_coefficient, reduction_rate):
+    """
+    BMR・TDEE・目標カロリー・PFCを配列でまとめて計算（計算式は nutrition_core と共有）
+
+    Args:
+        is_male (np.ndarray): 男性ならTrue（女性はFalse）
+        weight (np.ndarray): 現在の体重（kg）
+        height (np.ndarray): 身長（cm）
+        age (np.ndarray): 年齢
+        activity_coefficient (np.ndarray): 活動レベル係数
+        reduction_rate (np.ndarray): 月の減量ペース（0.02 or 0.04）
+
+    Returns:
+        dict: TARGET_FIELDS の各項目の配列（PFCはグラム）
+    """
+    targets = nutrition_arrays.targets(is_male, weight, height, age, activity_coefficient, reduction_rate)
+    return {column: targets[key] for key, column in _TARGET_COLUMNS.items()}
+
+
+def _to_float(value):
+    """数値に変換（空欄・不正な値はNaN）"""
+    if value is None or value == '':
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def read_profiles(path):
+    """
+    プロフィールファイルを読み込む
+
+    拡張子が .jsonl / .ndjson なら1行1件のJSON、それ以外は見出し行つきのCSVとして読む。
+
+    Args:
+        path (str): ファイルパス
+
+    Returns:
+        list[dict]: プロフィール（user_id と IMPORT_FIELDS のうち存在する項目）
+    """
+    if path.endswith(('.jsonl', '.ndjson')):
+        with open(path, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.DictReader(f))
+
+    profiles = []
+    for row in rows:
+        profile = {'user_id': row.get('user_id')}
+        for field in IMPORT_FIELDS:
+            value = row.get(field)
+            if value is not None and value != '':
+                profile[field] = value
+        # 係数がなければ選択肢のラベルから補う
+        if 'activity_coefficient' not in profile and profile.get('activity_level') in ACTIVITY_COEFFICIENTS:
+            profile['activity_coefficient'] = ACTIVITY_COEFFICIENTS[profile['activity_level']]
+        if 'reduction_rate' not in profile and profile.get('diet_mode') in REDUCTION_RATES:
+            profile['reduction_rate'] = REDUCTION_RATES[profile['diet_mode']]
+        profiles.append(profile)
+    return profiles
+
+
+class TargetRecompute:
+    """目標カロリー・PFCを一括で再計算するクラス"""
+
+    def __init__(self, database):
+        """
+        初期化
+
+        Args:
+            database: Databaseインスタンス
+        """
+        self.db = database
+
+    def load(self):
+        """
+        全ユーザーの計算に必要な項目を配列に読み込む
+
+        Returns:
+            dict: user_ids と INPUT_FIELDS の各配列（gender は男性かどうかの真偽値、欠損はNaN）
+        """
+        conn = self.db.get_connection()
+        rows = conn.execute(f'''
+            SELECT user_id, {', '.join(INPUT_FIELDS)}
+            FROM users
+        ''').fetchall()
+        return self._columns(rows)
+
+    @staticmethod
+    def _columns(rows):
+        """(user_id, INPUT_FIELDS...) の行を列ごとの配列にする"""
+        count = len(rows)
+        columns = list(zip(*rows)) if rows else [()] * (len(INPUT_FIELDS) + 1)
+        data = {
+            'user_ids': list(columns[0]),
+            'gender': np.fromiter((gender == MALE for gender in columns[1]), dtype=bool, count=count),
+            # 性別が空欄のユーザーは計算対象外
+            'has_gender': np.fromiter((gender is not None for gender in columns[1]), dtype=bool, count=count),
+        }
+        for field, values in zip(INPUT_FIELDS[1:], columns[2:]):
+            data[field] = np.fromiter((_to_float(value) for value in values), dtype=float, count=count)
+        return data
+
+    @staticmethod
+    def compute(data):
+        """
+        読み込んだ配列から目標を計算する（必要な項目がそろっているユーザーだけ）
+
+        Args:
+            data (dict): load() の返り値
+
+        Returns:
+            dict: user_ids（計算したユーザー）, TARGET_FIELDS の各配列, skipped（項目不足の件数）
+        """
+        valid = data['has_gender'].copy()
+        for field in INPUT_FIELDS[1:]:
+            valid &= np.isfinite(data[field])
+
+        targets = compute_targets(
+            data['gender'][valid],
+            data['current_weight'][valid],
+            data['height'][valid],
+            data['age'][valid],
+            data['activity_coefficient'][valid],
+            data['reduction_rate'][valid],
+        )
+        targets['user_ids'] = [data['user_ids'][i] for i in np.flatnonzero(valid)]
+        targets['skipped'] = int(len(valid) - np.count_nonzero(valid))
+        return targets
+
+    @staticmethod
+    def _target_rows(targets):
+        """executemany に渡す行を順に作る（全件のリストは作らない）"""
+        columns = [targets[field].tolist() for field in TARGET_FIELDS]
+        return zip(*columns, targets['user_ids'])
+
+    def run(self, dry_run=False):
+        """
+        データベースの全ユーザーの目標を再計算して書き戻す
+
+        Args:
+            dry_run (bool): Trueなら計算だけ行い、書き戻さない
+
+        Returns:
+            dict: users（読み込んだ件数）, computed, updated, skipped, elapsed（秒）
+        """
+        start = time.perf_counter()
+        data = self.load()
+        targets = self.compute(data)
+        updated = 0 if dry_run else self.db.update_user_targets(self._target_rows(targets))
+        return {
+            'users': len(data['user_ids']),
+            'computed': len(targets['user_ids']),
+            'updated': updated,
+            'skipped': targets['skipped'],
+            'elapsed': time.perf_counter() - start,
+        }
+
+    def import_profiles(self, path, dry_run=False):
+        """
+        CSV/JSONLのプロフィールを登録・更新し、目標を計算して書き込む
+
+        計算に必要な項目がそろっていない行と user_id がない行は取り込まない。
+
+        Args:
+            path (str): プロフィールファイルのパス
+            dry_run (bool): Trueなら計算だけ行い、書き込まない
+
+        Returns:
+            dict: users（ファイルの件数）, computed, updated, skipped, elapsed（秒）
+        """
+        start = time.perf_counter()
+        profiles = [profile for profile in read_profiles(path) if profile.get('user_id')]
+        rows = [tuple(profile.get(field) for field in ('user_id',) + INPUT_FIELDS) for profile in profiles]
+        targets = self.compute(self._columns(rows))
+
+        updated = 0
+        if not dry_run and targets['user_ids']:
+            # ファイルに含まれる項目と計算結果を、計算できたユーザーの分だけ書き込む
+            computed = set(targets['user_ids'])
+            columns = [field for field in IMPORT_FIELDS if any(field in profile for profile in profiles)]
+            columns += TARGET_FIELDS
+            target_values = {
+                user_id: values
+                for user_id, *values in zip(targets['user_ids'], *(targets[f].tolist() for f in TARGET_FIELDS))
+            }
+            updated = self.db.upsert_user_profiles(columns, (
+                (profile['user_id'],)
+                + tuple(profile.get(field) for field in columns[:-len(TARGET_FIELDS)])
+                + tuple(target_values[profile['user_id']])
+                for profile in profiles if profile['user_id'] in computed
+            ))
+
+        return {
+            'users': len(profiles),
+            'computed': len(targets['user_ids']),
+            'updated': updated,
+            'skipped': targets['skipped'],
+            'elapsed': time.perf_counter() - start,
+        }
+
+
+if __name__ == '__main__':
+    from database import Database
+
+    parser = argparse.ArgumentParser(description='目標カロリー・PFCの一括再計算')
+    parser.add_argument('--db', default='diet_mentor.db', help='データベースのパス')
+    parser.add_argument('--import', dest='import_path',
+                        help='取り込むプロフィール（CSV、または .jsonl）')
+    parser.add_argument('--dry-run', action='store_true', help='計算だけ行い、書き込まない')
+    args = parser.parse_args()
+
+    recompute = TargetRecompute(Database(args.db))
+    if args.import_path:
+        report = recompute.import_profiles(args.import_path, dry_run=args.dry_run)
+    else:
+        report = recompute.run(dry_run=args.dry_run)
+
+    print(f"📊 {report['users']}件中{report['computed']}件を計算、{report['updated']}件を更新"
+          f"（{report['elapsed']:.2f}秒）")
+    if report['skipped']:
+        print(f"⚠️ 必要な項目がそろっていない{report['skipped']}件は対象外です")
+    print("✅ 目標の再計算が完了しました")
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+イベント単位のユーザー情報
+Webhookイベントの最初にユーザー・集計・直近の記録をまとめて読み込み、
+処理中の書き込みはためておいてイベントの最後に1回のコミットで反映する
+"""
+
+from datetime import date
+from typing import Dict, List, Optional
+
+
+# 読み込む直近の記録数（今日の記録と直近1週間の確認に使う）
+RECENT_RECORD_LIMIT = 7
+
+
+class UnitOfWork:
+    """1つのイベントでの書き込みをためておき、まとめてコミットするクラス"""
+
+    def __init__(self, database, user_id: str):
+        """
+        初期化
+
+        Args:
+            database: Databaseインスタンス
+            user_id (str): ユーザーID
+        """
+        self.db = database
+        self.user_id = user_id
+        self.new_user = None
+        self.user_updates = {}
+        self.records = []
+
+    def create_user(self, profile: Dict):
+        """ユーザーの新規作成を予約"""
+        self.new_user = dict(profile)
+
+    def update_user(self, updates: Dict):
+        """ユーザー情報の更新を予約（同じ項目は後の値で上書き）"""
+        self.user_updates.update(updates)
+
+    def add_daily_record(self, record: Dict):
+        """日々の記録の追加を予約"""
+        self.records.append(dict(record))
+
+    @property
+    def has_changes(self) -> bool:
+        """未反映の書き込みがあるかどうか"""
+        return self.new_user is not None or bool(self.user_updates) or bool(self.records)
+
+    def commit(self) -> bool:
+        """
+        予約した書き込みを1回のトランザクションで反映
+
+        Returns:
+            bool: 成功したかどうか（書き込みがない場合もTrue）
+        """
+        if not self.has_changes:
+            return True
+        success = self.db.apply_changes(
+            self.user_id,
+            new_user=self.new_user,
+            user_updates=self.user_updates,
+            records=self.records
+        )
+        self.clear()
+        return success
+
+    def clear(self):
+        """予約した書き込みを破棄"""
+        self.new_user = None
+        self.user_updates = {}
+        self.records = []
+
+
+class UserContext:
+    """1つのWebhookイベントの間だけ使うユーザー情報"""
+
+    def __init__(self, database, user_id: str, history_limit: int = RECENT_RECORD_LIMIT,
+                 responses=None, state_store=None):
+        """
+        ユーザー・集計・直近の記録を1回の読み込みトランザクションで取得
+
+        Args:
+            database: Databaseインスタンス
+            user_id (str): ユーザーID
+            history_limit (int): 読み込む直近の記録数
+            responses (ResponseCollector, optional): このイベントの返信をためるオブジェクト
+            state_store (ConversationStateStore, optional): 会話状態ストア
+                指定すると会話状態はストアから読み、変更はストア経由でまとめて書き戻す
+        """
+        loaded = database.load_user_context(user_id, history_limit)
+        self.user_id = user_id
+        self.state_store = state_store
+        self._pending_state = None
+        self.user: Optional[Dict] = loaded['user']
+        if self.user is not None and state_store is not None:
+            # 書き戻し前の新しい会話状態があればそちらを使う
+            state = state_store.get(user_id)
+            if state is not None:
+                self.user['conversation_state'] = state
+        self.stats: Optional[Dict] = loaded['stats']
+        self.recent_records: List[Dict] = loaded['records']
+        self.unit_of_work = UnitOfWork(database, user_id)
+        self.responses = responses
+
+    @property
+    def today_record(self) -> Optional[Dict]:
+        """今日の記録（なければNone）"""
+        today = date.today().isoformat()
+        for record in self.recent_records:
+            if record.get('date') == today:
+                return record
+        return None
+
+    def create_user(self, profile: Dict):
+        """ユーザーを新規作成（コミット時に反映）"""
+        self.unit_of_work.create_user(profile)
+        if self.user is None:
+            self.user = dict(profile, user_id=self.user_id)
+
+    def update_user(self, updates: Dict):
+        """ユーザー情報を更新（コミット時に反映、読み込み済みの情報にはすぐ反映）"""
+        if self.user is not None:
+            self.user.update(updates)
+
+        updates = dict(updates)
+        if self.state_store is not None and 'conversation_state' in updates:
+            # 会話状態はストアに保存し、データベースへはまとめて書き戻す
+            self._pending_state = updates.pop('conversation_state')
+            if self.unit_of_work.new_user is not None:
+                # 作成するユーザー行には最初から会話状態を入れる（書き戻しまで 'active' に見えないように）
+                self.unit_of_work.new_user['conversation_state'] = self._pending_state
+        if updates:
+            self.unit_of_work.update_user(updates)
+
+    def add_daily_record(self, record: Dict):
+        """日々の記録を追加（コミット時に反映、読み込み済みの記録にはすぐ反映）"""
+        record = dict(record)
+        record.setdefault('date', date.today().isoformat())
+        self.unit_of_work.add_daily_record(record)
+
+        # 同じ日の記録は置き換え（INSERT OR REPLACE と同じ）
+        self.recent_records = [r for r in self.recent_records if r.get('date') != record['date']]
+        self.recent_records.append(record)
+        self.recent_records.sort(key=lambda r: r['date'], reverse=True)
+
+    def commit(self) -> bool:
+        """イベント中の書き込みをまとめてコミット"""
+        success = self.unit_of_work.commit()
+        if success and self._pending_state is not None:
+            # ユーザー行の作成後に反映されるよう、コミットが成功してからストアに渡す
+            self.state_store.set(self.user_id, self._pending_state)
+            self._pending_state = None
+        return success
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Webhook受信キュー
+署名検証済みのWebhookをキューに積み、ワーカースレッドで非同期に処理する
+"""
+
+import json
+import queue
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+
+
+def source_key(body: str) -> str:
+    """
+    Webhookの送信元（ユーザー・グループ・トークルーム）のキーを取得
+
+    1回のWebhookに複数のイベントが含まれる場合は最初のイベントの送信元を使う。
+
+    Args:
+        body (str): リクエストボディ
+
+    Returns:
+        str: 送信元のID（取得できない場合は空文字）
+    """
+    try:
+        events = json.loads(body).get('events') or []
+        source = events[0].get('source') or {}
+    except (ValueError, AttributeError, IndexError):
+        return ''
+    return source.get('userId') or source.get('groupId') or source.get('roomId') or ''
+
+
+class MemoryQueueBackend:
+    """プロセス内のみで保持するキューバックエンド（再起動で消える）"""
+
+    def __init__(self):
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def save(self, body: str, signature: str) -> int:
+        """
+        受信したWebhookを保存
+
+        Returns:
+            int: 保存したアイテムのID
+        """
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
+
+    def ack(self, item_id: int):
+        """処理が完了したアイテムを削除"""
+        pass
+
+    def pending(self) -> list:
+        """未処理のアイテムを取得（起動時の再投入用）"""
+        return []
+
+
+class SQLiteQueueBackend:
+    """SQLiteに保存するキューバックエンド（再起動後も未処理分を再投入できる）"""
+
+    def __init__(self, db_path='webhook_queue.db'):
+        self.db_path = db_path
+        self._local = threading.local()
+
+        conn = self._get_connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS webhook_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                body TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                received_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+
+    def _get_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def save(self, body: str, signature: str) -> int:
+        conn = self._get_connection()
+        cursor = conn.execute(
+            'INSERT INTO webhook_queue (body, signature) VALUES (?, ?)',
+            (body, signature)
+        )
+        conn.commit()
+        return cursor.lastrowid
+
+    def ack(self, item_id: int):
+        conn = self._get_connection()
+        conn.execute('DELETE FROM webhook_queue WHERE id = ?', (item_id,))
+        conn.commit()
+
+    def pending(self) -> list:
+        conn = self._get_connection()
+        rows = conn.execute(
+            'SELECT id, body, signature FROM webhook_queue ORDER BY id ASC'
+        ).fetchall()
+        return [tuple(row) for row in rows]
+
+
+class WebhookQueue:
+    """
+    有界キューとワーカープールでWebhookを非同期処理するクラス
+
+    ワーカーごとにキューを持ち、送信元のユーザーIDから振り分け先を決める。
+    同じユーザーのWebhookは常に同じワーカーが受信順に処理するので、
+    続けて届いたメッセージが同時に処理されたり順番が入れ替わったりしない。
+    """
+
+    def __init__(self, process_func, maxsize=1000, workers=4, backend=None):
+        """
+        初期化
+
+        Args:
+            process_func (callable): process_func(body, signature) で1件を処理する関数
+            maxsize (int): キューの最大長（ワーカーごとのキューに等分する）
+            workers (int): ワーカースレッド数
+            backend: 永続化バックエンド（省略時はメモリのみ）
+        """
+        self.process_func = process_func
+        self.workers = workers
+        self.backend = backend or MemoryQueueBackend()
+        shard_size = max(1, maxsize // workers)
+        self._queues = [queue.Queue(maxsize=shard_size) for _ in range(workers)]
+        self._threads = []
+        self.processed_count = 0
+        self.failed_count = 0
+        self._stats_lock = threading.Lock()
+
+    def start(self):
+        """ワーカーを起動し、未処理分があれば再投入する"""
+        for i, shard in enumerate(self._queues):
+            thread = threading.Thread(
+                target=self._worker,
+                args=(shard,),
+                name=f'webhook-worker-{i}',
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+        # ワーカー起動後に積むので、maxsizeを超えていてもブロックし続けない
+        for item_id, body, signature in self.backend.pending():
+            self._shard(body).put((item_id, body, signature))
+
+        print(f"✅ Webhookキュー起動: ワーカー{self.workers}個")
+
+    def submit(self, body: str, signature: str, timeout: float = 0) -> bool:
+        """
+        Webhookをキューに積む
+
+        Args:
+            body (str): リクエストボディ
+            signature (str): X-Line-Signature
+            timeout (float): キューが満杯の場合に空きを待つ秒数
+
+        Returns:
+            bool: キューに積めた場合True、待っても満杯の場合False
+        """
+        shard = self._shard(body)
+        item_id = self.backend.save(body, signature)
+        try:
+            if timeout > 0:
+                shard.put((item_id, body, signature), timeout=timeout)
+            else:
+                shard.put_nowait((item_id, body, signature))
+        except queue.Full:
+            self.backend.ack(item_id)
+            return False
+        return True
+
+    def stop(self, timeout=10):
+        """キューが空になるまで待ってからワーカーを止める"""
+        for shard in self._queues:
+            shard.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def qsize(self) -> int:
+        """現在キューに積まれている件数"""
+        return sum(shard.qsize() for shard in self._queues)
+
+    def _shard(self, body: str) -> queue.Queue:
+        """送信元のユーザーIDから振り分け先のキューを決める（同じユーザーは常に同じキュー）"""
+        key = source_key(body)
+        return self._queues[zlib.crc32(key.encode('utf-8')) % len(self._queues)]
+
+    def _worker(self, shard):
+        while True:
+            item = shard.get()
+            if item is None:
+                shard.task_done()
+                return
+
+            item_id, body, signature = item
+            try:
+                self.process_func(body, signature)
+                with self._stats_lock:
+                    self.processed_count += 1
+            except Exception as e:
+                with self._stats_lock:
+                    self.failed_count += 1
+                print(f"[{datetime.now()}] ⚠️ Webhook処理エラー: {e}")
+            finally:
+                # 失敗しても再試行はしない（メッセージの重複送信を防ぐ）
+                self.backend.ack(item_id)
+                shard.task_done()
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    # 同じユーザーのWebhookが同時に処理されず、受信順に処理されることを確認する
+    running = set()
+    processed = {}
+    problems = []
+    check_lock = threading.Lock()
+
+    def process(body, signature):
+        event = json.loads(body)['events'][0]
+        user_id = event['source']['userId']
+        with check_lock:
+            if user_id in running:
+                problems.append(f"{user_id} のWebhookが同時に処理されました")
+            running.add(user_id)
+        time.sleep(0.002)
+        with check_lock:
+            running.discard(user_id)
+            processed.setdefault(user_id, []).append(event['message']['text'])
+
+    webhook_queue = WebhookQueue(process, maxsize=1000, workers=4)
+    webhook_queue.start()
+    users = [f"U{i:032x}" for i in range(2)]
+    for n in range(20):
+        for user_id in users:
+            body = json.dumps({'events': [{
+                'type': 'message', 'source': {'type': 'user', 'userId': user_id},
+                'message': {'type': 'text', 'text': str(n)},
+            }]})
+            webhook_queue.submit(body, 'signature')
+    webhook_queue.stop()
+
+    for user_id in users:
+        if processed.get(user_id) != [str(n) for n in range(20)]:
+            problems.append(f"{user_id} のWebhookの処理順が受信順と異なります: {processed.get(user_id)}")
+    if problems:
+        for problem in problems[:20]:
+            print(f"⚠️ {problem}")
+        sys.exit(1)
+    print(f"✅ {len(users)}人のWebhookがユーザーごとに受信順で1件ずつ処理されました")
+
+    # 処理中に停止したプロセスの未完了分が、再起動後に再投入されて処理し直されることを確認する
+    import os
+    import tempfile
+    from types import SimpleNamespace
+
+    from database import Database
+    from event_dedup import EventDeduplicator
+
+    def webhook_body(event_id, text):
+        return json.dumps({'events': [{
+            'type': 'message', 'webhookEventId': event_id,
+            'source': {'type': 'user', 'userId': 'Urestart'},
+            'message': {'type': 'text', 'text': text},
+        }]})
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'diet_mentor.db')
+        queue_path = os.path.join(directory, 'webhook_queue.db')
+
+        # 停止前のプロセス: 1件目は処理済み、2件目はハンドラーの途中で停止（ackされずに残る）
+        before = EventDeduplicator(Database(db_path))
+        backend = SQLiteQueueBackend(queue_path)
+        before.claim('01RESTART00000000000000001')
+        before.finish('01RESTART00000000000000001')
+        backend.ack(backend.save(webhook_body('01RESTART00000000000000001', '処理済み'), 'signature'))
+        before.claim('01RESTART00000000000000002')
+        backend.save(webhook_body('01RESTART00000000000000002', '処理中に停止'), 'signature')
+        # LINEの再送で、処理済みのイベントがもう一度届いて未処理のまま残っている
+        backend.save(webhook_body('01RESTART00000000000000001', '処理済み'), 'signature')
+        # 動いている別のプロセス（ここでは親プロセス）が処理中のイベントが再送されて残っている
+        before.db.claim_webhook_event('01RESTART00000000000000003', time.time(),
+                                      f"{before.hostname}:{os.getppid()}:running")
+        backend.save(webhook_body('01RESTART00000000000000003', '別プロセスで処理中'), 'signature')
+
+        # 再起動後のプロセス
+        after = EventDeduplicator(Database(db_path))
+        received = []
+
+        @after.once
+        def handle_message(event):
+            received.append(event.text)
+
+        def replay(body, signature):
+            event = json.loads(body)['events'][0]
+            handle_message(SimpleNamespace(webhook_event_id=event['webhookEventId'],
+                                           text=event['message']['text']))
+
+        restarted = WebhookQueue(replay, workers=2, backend=SQLiteQueueBackend(queue_path))
+        restarted.start()
+        restarted.stop()
+
+        if received != ['処理中に停止']:
+            print(f"⚠️ 再起動後の再投入の処理が想定と違います: {received}")
+            sys.exit(1)
+        if after.claim('01RESTART00000000000000002'):
+            print("⚠️ 再投入で処理済みになったイベントをもう一度処理しようとしました")
+            sys.exit(1)
+    print("✅ 処理中に停止したWebhookだけが再起動後に1回処理し直されました（動いているプロセスの処理中は引き継がない）")
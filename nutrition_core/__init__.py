@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+カロリーとPFCの計算（sekiguchi_bot・line_bot・diet-mentor-line-bot で共有）
+
+1件ずつの計算はこのパッケージから、配列でまとめて計算する場合は
+nutrition_core.arrays から使う（NumPyはそのときだけ読み込む）。
+
+    python -m nutrition_core.parity      # 旧実装との一致確認
+    python -m nutrition_core.benchmark   # 1件ずつと配列版の速度比較
+"""
+
+from .formulas import (
+    MALE,
+    BMR_COEFFICIENTS,
+    KCAL_PER_KG_FAT,
+    DAYS_PER_MONTH,
+    PFC_RATIOS,
+    KCAL_PER_GRAM,
+    calculate_bmr,
+    calculate_tdee,
+    deficit_target_calories,
+    ratio_target_calories,
+    pfc_grams,
+    pfc_percentage,
+    calculate_target_calories_and_pfc,
+)
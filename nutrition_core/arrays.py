@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+カロリーとPFCの計算式（NumPy配列でまとめて計算する版）
+formulas.py と同じ係数・同じ演算順序で計算するため、1件ずつの結果と一致する
+"""
+
+import numpy as np
+
+from .formulas import (
+    BMR_COEFFICIENTS, MALE, KCAL_PER_KG_FAT, DAYS_PER_MONTH,
+    LIGHT_REDUCTION_RATE, LIGHT_CALORIE_CUT, HARD_CALORIE_CUT,
+    PFC_RATIOS, KCAL_PER_GRAM,
+)
+
+
+# 行: 0=男性, 1=女性 / 列: 体重, 身長, 年齢, 定数
+_BMR_TABLE = np.array([BMR_COEFFICIENTS[MALE], BMR_COEFFICIENTS["女性"]])
+
+
+def is_male(genders):
+    """性別の並びを「男性ならTrue」の配列にする"""
+    genders = list(genders)
+    return np.fromiter((gender == MALE for gender in genders), dtype=bool, count=len(genders))
+
+
+def bmr(male, weight, height, age):
+    """
+    基礎代謝量（BMR）
+
+    Args:
+        male (np.ndarray): 男性ならTrue（is_male() で作る）
+        weight, height, age (np.ndarray): 体重（kg）・身長（cm）・年齢
+
+    Returns:
+        np.ndarray: 基礎代謝量（kcal/日）
+    """
+    coefficients = _BMR_TABLE[np.where(male, 0, 1)]
+    return (coefficients[:, 0] * weight) + (coefficients[:, 1] * height) \
+        + (coefficients[:, 2] * age) + coefficients[:, 3]
+
+
+def tdee(bmr_values, activity_coefficient):
+    """総消費カロリー（TDEE）"""
+    return bmr_values * activity_coefficient
+
+
+def deficit_target_calories(tdee_values, weight, reduction_rate):
+    """減量ペースから逆算した目標カロリー（関口式）"""
+    return tdee_values - weight * reduction_rate / DAYS_PER_MONTH * KCAL_PER_KG_FAT
+
+
+def ratio_target_calories(tdee_values, reduction_rate):
+    """TDEEから一定割合を引いた目標カロリー"""
+    cut = np.where(np.asarray(reduction_rate) == LIGHT_REDUCTION_RATE, LIGHT_CALORIE_CUT, HARD_CALORIE_CUT)
+    return tdee_values * (1 - cut)
+
+
+def pfc_grams(target_calories, ratios=PFC_RATIOS):
+    """
+    目標カロリーをPFCのグラム数に分ける
+
+    Returns:
+        tuple: (タンパク質, 脂質, 炭水化物) の配列
+    """
+    return (
+        (target_calories * ratios[0]) / KCAL_PER_GRAM[0],
+        (target_calories * ratios[1]) / KCAL_PER_GRAM[1],
+        (target_calories * ratios[2]) / KCAL_PER_GRAM[2],
+    )
+
+
+def pfc_percentage(protein_grams, fat_grams, carbs_grams):
+    """
+    PFCのグラム数からカロリー比率（%）
+
+    Returns:
+        tuple: (タンパク質, 脂質, 炭水化物) の配列。合計0kcalの要素は0
+    """
+    protein_kcal = np.asarray(protein_grams, dtype=float) * KCAL_PER_GRAM[0]
+    fat_kcal = np.asarray(fat_grams, dtype=float) * KCAL_PER_GRAM[1]
+    carbs_kcal = np.asarray(carbs_grams, dtype=float) * KCAL_PER_GRAM[2]
+    total_calories = protein_kcal + fat_kcal + carbs_kcal
+
+    nonzero = total_calories != 0
+    divisor = np.where(nonzero, total_calories, 1.0)
+    return tuple(
+        np.where(nonzero, (kcal / divisor) * 100, 0.0)
+        for kcal in (protein_kcal, fat_kcal, carbs_kcal)
+    )
+
+
+def targets(male, weight, height, age, activity_coefficient, reduction_rate):
+    """
+    BMR・TDEE・目標カロリー・PFCをまとめて計算（関口式）
+
+    Args:
+        male (np.ndarray): 男性ならTrue
+        weight, height, age (np.ndarray): 体重（kg）・身長（cm）・年齢
+        activity_coefficient (np.ndarray): 活動レベル係数
+        reduction_rate (np.ndarray): 月の減量ペース（0.02 or 0.04）
+
+    Returns:
+        dict: bmr, tdee, target_calories, protein, fat, carbs の配列
+    """
+    bmr_values = bmr(male, weight, height, age)
+    tdee_values = tdee(bmr_values, activity_coefficient)
+    target_calories = deficit_target_calories(tdee_values, weight, reduction_rate)
+    protein, fat, carbs = pfc_grams(target_calories)
+
+    return {
+        "bmr": bmr_values,
+        "tdee": tdee_values,
+        "target_calories": target_calories,
+        "protein": protein,
+        "fat": fat,
+        "carbs": carbs,
+    }
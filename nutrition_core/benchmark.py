@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+計算のマイクロベンチマーク
+1件ずつの計算を繰り返した場合と、配列版でまとめて計算した場合の1件あたりの時間を比べる
+
+    python -m nutrition_core.benchmark
+    python -m nutrition_core.benchmark --users 100000 --repeat 5
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from . import arrays, formulas
+from .parity import random_profiles
+
+
+def _best_of(func, repeat):
+    """repeat 回実行して最短の時間（秒）を返す"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmarks(user_count, repeat=5):
+    """
+    各計算を1件ずつ・配列版で計測
+
+    Args:
+        user_count (int): プロフィールの数
+        repeat (int): 繰り返し回数（最短の時間を採用）
+
+    Returns:
+        list[tuple]: [(名前, 1件ずつの秒数, 配列版の秒数), ...]
+    """
+    profiles = random_profiles(user_count)
+    genders = [profile["gender"] for profile in profiles]
+    columns = {key: np.array([profile[key] for profile in profiles], dtype=float)
+               for key in ("age", "height", "current_weight", "activity_coefficient", "reduction_rate")}
+    male = arrays.is_male(genders)
+    tdee_values = arrays.tdee(
+        arrays.bmr(male, columns["current_weight"], columns["height"], columns["age"]),
+        columns["activity_coefficient"]
+    )
+    tdee_list = tdee_values.tolist()
+    rates = [profile["reduction_rate"] for profile in profiles]
+
+    cases = [
+        (
+            "BMR",
+            lambda: [formulas.calculate_bmr(p["gender"], p["current_weight"], p["height"], p["age"])
+                     for p in profiles],
+            lambda: arrays.bmr(male, columns["current_weight"], columns["height"], columns["age"]),
+        ),
+        (
+            "目標カロリー・PFC（関口式）",
+            lambda: [formulas.calculate_target_calories_and_pfc(p) for p in profiles],
+            lambda: arrays.targets(male, columns["current_weight"], columns["height"], columns["age"],
+                                   columns["activity_coefficient"], columns["reduction_rate"]),
+        ),
+        (
+            "目標カロリー（一定割合）",
+            lambda: [formulas.ratio_target_calories(t, r) for t, r in zip(tdee_list, rates)],
+            lambda: arrays.ratio_target_calories(tdee_values, columns["reduction_rate"]),
+        ),
+        (
+            "PFC比率",
+            lambda: [formulas.pfc_percentage(p["height"], p["current_weight"], p["age"]) for p in profiles],
+            lambda: arrays.pfc_percentage(columns["height"], columns["current_weight"], columns["age"]),
+        ),
+    ]
+
+    return [
+        (name, _best_of(scalar, repeat), _best_of(vectorized, repeat))
+        for name, scalar, vectorized in cases
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='計算のマイクロベンチマーク')
+    parser.add_argument('--users', type=int, default=100000, help='プロフィールの数')
+    parser.add_argument('--repeat', type=int, default=5, help='繰り返し回数（最短の時間を採用）')
+    args = parser.parse_args()
+
+    print(f"📊 {args.users}件（{args.repeat}回中の最短、1件あたり）")
+    for name, scalar, vectorized in run_benchmarks(args.users, args.repeat):
+        per_scalar = scalar / args.users * 1e9
+        per_vectorized = vectorized / args.users * 1e9
+        speedup = scalar / vectorized if vectorized > 0 else float('inf')
+        print(f"   {name}: 1件ずつ {per_scalar:.0f}ns / 配列版 {per_vectorized:.1f}ns（{speedup:.0f}倍）")
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+カロリーとPFCの計算式（1件ずつ計算する版）
+係数はこのモジュールの定数にまとめ、配列版（arrays.py）も同じ定数を使う
+"""
+
+
+MALE = "男性"
+
+# ハリス・ベネディクト方式（改良版）の係数: (体重, 身長, 年齢, 定数)
+# 男性: (13.397×体重kg)+(4.799×身長cm)-(5.677×年齢)+88.362
+# 女性: (9.247×体重kg)+(3.098×身長cm)-(4.330×年齢)+447.593
+BMR_COEFFICIENTS = {
+    "男性": (13.397, 4.799, -5.677, 88.362),
+    "女性": (9.247, 3.098, -4.330, 447.593),
+}
+
+# 脂肪1kg = 約7200kcal
+KCAL_PER_KG_FAT = 7200
+DAYS_PER_MONTH = 30
+
+# TDEEから一定割合を引く方式の削減率（減量ペース → TDEEから減らす割合）
+# 月2%（ライトモード）: TDEEの15%減 / それ以外（ハードモード 月4%）: TDEEの25%減
+LIGHT_REDUCTION_RATE = 0.02
+LIGHT_CALORIE_CUT = 0.15
+HARD_CALORIE_CUT = 0.25
+
+# PFCバランス（P:30%, F:20%, C:50%）と1gあたりのカロリー（P:4kcal/g, F:9kcal/g, C:4kcal/g）
+PFC_RATIOS = (0.30, 0.20, 0.50)
+KCAL_PER_GRAM = (4, 9, 4)
+
+
+def calculate_bmr(gender, weight, height, age):
+    """
+    ハリス・ベネディクト方式（改良版）で基礎代謝量（BMR）を計算
+
+    Args:
+        gender (str): 性別（"男性" または "女性"）
+        weight (float): 体重（kg）
+        height (float): 身長（cm）
+        age (int): 年齢
+
+    Returns:
+        float: 基礎代謝量（kcal/日）
+    """
+    weight_c, height_c, age_c, constant = BMR_COEFFICIENTS[MALE if gender == MALE else "女性"]
+    return (weight_c * weight) + (height_c * height) + (age_c * age) + constant
+
+
+def calculate_tdee(bmr, activity_coefficient):
+    """
+    総消費カロリー（TDEE）を計算
+
+    Args:
+        bmr (float): 基礎代謝量（kcal/日）
+        activity_coefficient (float): 活動レベル係数
+
+    Returns:
+        float: 総消費カロリー（kcal/日）
+    """
+    return bmr * activity_coefficient
+
+
+def deficit_target_calories(tdee, weight, reduction_rate):
+    """
+    減量ペースから逆算した目標カロリー（関口式）
+
+    月に体重の reduction_rate を減らすための1日あたりのカロリー不足をTDEEから引く。
+
+    Args:
+        tdee (float): 総消費カロリー（kcal/日）
+        weight (float): 現在の体重（kg）
+        reduction_rate (float): 月の減量ペース（0.02 or 0.04）
+
+    Returns:
+        float: 目標カロリー（kcal/日）
+    """
+    calorie_deficit_per_day = weight * reduction_rate / DAYS_PER_MONTH * KCAL_PER_KG_FAT
+    return tdee - calorie_deficit_per_day
+
+
+def ratio_target_calories(tdee, reduction_rate):
+    """
+    TDEEから一定割合を引いた目標カロリー
+
+    Args:
+        tdee (float): 総消費カロリー（kcal/日）
+        reduction_rate (float): 月の減量ペース（0.02 or 0.04）
+
+    Returns:
+        float: 目標カロリー（kcal/日）
+    """
+    cut = LIGHT_CALORIE_CUT if reduction_rate == LIGHT_REDUCTION_RATE else HARD_CALORIE_CUT
+    return tdee * (1 - cut)
+
+
+def pfc_grams(target_calories, ratios=PFC_RATIOS):
+    """
+    目標カロリーをPFCのグラム数に分ける
+
+    Args:
+        target_calories (float): 目標カロリー（kcal/日）
+        ratios (tuple): (タンパク質, 脂質, 炭水化物) のカロリー割合
+
+    Returns:
+        tuple: (タンパク質, 脂質, 炭水化物) のグラム数
+    """
+    return (
+        (target_calories * ratios[0]) / KCAL_PER_GRAM[0],
+        (target_calories * ratios[1]) / KCAL_PER_GRAM[1],
+        (target_calories * ratios[2]) / KCAL_PER_GRAM[2],
+    )
+
+
+def pfc_percentage(protein_grams, fat_grams, carbs_grams):
+    """
+    PFCのグラム数からカロリー比率（%）を計算
+
+    Args:
+        protein_grams (float): タンパク質（g）
+        fat_grams (float): 脂質（g）
+        carbs_grams (float): 炭水化物（g）
+
+    Returns:
+        tuple: (タンパク質, 脂質, 炭水化物) の割合（%）。合計0kcalなら全て0
+    """
+    protein_kcal = protein_grams * KCAL_PER_GRAM[0]
+    fat_kcal = fat_grams * KCAL_PER_GRAM[1]
+    carbs_kcal = carbs_grams * KCAL_PER_GRAM[2]
+    total_calories = protein_kcal + fat_kcal + carbs_kcal
+
+    if total_calories == 0:
+        return (0, 0, 0)
+
+    return (
+        (protein_kcal / total_calories) * 100,
+        (fat_kcal / total_calories) * 100,
+        (carbs_kcal / total_calories) * 100,
+    )
+
+
+def calculate_target_calories_and_pfc(profile):
+    """
+    目標カロリーとPFCバランスを計算（関口式）
+
+    Args:
+        profile (dict): プロフィール情報（gender, current_weight, height, age,
+                        activity_coefficient, reduction_rate）
+
+    Returns:
+        dict: bmr, tdee, 目標カロリー、P/F/C（g）
+    """
+    bmr = calculate_bmr(
+        profile["gender"],
+        profile["current_weight"],
+        profile["height"],
+        profile["age"]
+    )
+    tdee = calculate_tdee(bmr, profile["activity_coefficient"])
+    target_calories = deficit_target_calories(tdee, profile["current_weight"], profile["reduction_rate"])
+    protein, fat, carbs = pfc_grams(target_calories)
+
+    return {
+        "bmr": bmr,
+        "tdee": tdee,
+        "target_calories": target_calories,
+        "protein": protein,
+        "fat": fat,
+        "carbs": carbs
+    }
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+旧実装との一致確認
+共有化する前の sekiguchi_bot/main.py と diet-mentor-line-bot/app/utils/calculations.py の
+計算式をそのまま残しておき、ランダムなプロフィールで nutrition_core（1件ずつ・配列版）の
+結果と完全に一致するかを確認する（一致しなければ終了コード1）
+
+    python -m nutrition_core.parity
+    python -m nutrition_core.parity --samples 100000
+"""
+
+import argparse
+import random
+import sys
+
+from . import formulas
+
+
+# ===== 旧実装（共有化する前のコードをそのまま残したもの。変更しないこと） =====
+
+def _legacy_calculate_bmr(gender, weight, height, age):
+    # sekiguchi_bot/main.py・diet-mentor-line-bot/app/utils/calculations.py 共通
+    if gender == "男性":
+        bmr = (13.397 * weight) + (4.799 * height) - (5.677 * age) + 88.362
+    else:
+        bmr = (9.247 * weight) + (3.098 * height) - (4.330 * age) + 447.593
+    return bmr
+
+
+def _legacy_calculate_tdee(bmr, activity_coefficient):
+    return bmr * activity_coefficient
+
+
+def _legacy_sekiguchi_targets(profile):
+    # sekiguchi_bot/main.py の calculate_target_calories_and_pfc
+    bmr = _legacy_calculate_bmr(profile["gender"], profile["current_weight"], profile["height"], profile["age"])
+    tdee = _legacy_calculate_tdee(bmr, profile["activity_coefficient"])
+    weight_loss_per_month = profile["current_weight"] * profile["reduction_rate"]
+    weight_loss_per_day = weight_loss_per_month / 30
+    calorie_deficit_per_day = weight_loss_per_day * 7200
+    target_calories = tdee - calorie_deficit_per_day
+    protein_calories = target_calories * 0.30
+    fat_calories = target_calories * 0.20
+    carbs_calories = target_calories * 0.50
+    return {
+        "bmr": bmr,
+        "tdee": tdee,
+        "target_calories": target_calories,
+        "protein": protein_calories / 4,
+        "fat": fat_calories / 9,
+        "carbs": carbs_calories / 4,
+    }
+
+
+def _legacy_diet_mentor_target_calories(tdee, reduction_rate):
+    # diet-mentor-line-bot/app/utils/calculations.py の calculate_target_calories
+    if reduction_rate == 0.02:
+        calorie_reduction_rate = 0.15
+    else:
+        calorie_reduction_rate = 0.25
+    target_calories = tdee * (1 - calorie_reduction_rate)
+    return round(target_calories, 2)
+
+
+def _legacy_diet_mentor_pfc_targets(target_calories, protein_ratio=0.30, fat_ratio=0.20, carb_ratio=0.50):
+    # diet-mentor-line-bot/app/utils/calculations.py の calculate_pfc_targets
+    protein_grams = (target_calories * protein_ratio) / 4
+    fat_grams = (target_calories * fat_ratio) / 9
+    carbs_grams = (target_calories * carb_ratio) / 4
+    return {
+        'protein': round(protein_grams, 1),
+        'fat': round(fat_grams, 1),
+        'carbs': round(carbs_grams, 1)
+    }
+
+
+def _legacy_diet_mentor_pfc_percentage(protein_grams, fat_grams, carbs_grams):
+    # diet-mentor-line-bot/app/utils/calculations.py の calculate_pfc_percentage
+    total_calories = (protein_grams * 4) + (fat_grams * 9) + (carbs_grams * 4)
+    if total_calories == 0:
+        return {'protein_percent': 0, 'fat_percent': 0, 'carb_percent': 0}
+    protein_percent = (protein_grams * 4 / total_calories) * 100
+    fat_percent = (fat_grams * 9 / total_calories) * 100
+    carb_percent = (carbs_grams * 4 / total_calories) * 100
+    return {
+        'protein_percent': round(protein_percent),
+        'fat_percent': round(fat_percent),
+        'carb_percent': round(carb_percent)
+    }
+
+
+# ===== 確認 =====
+
+def random_profiles(count, seed=0):
+    """
+    ランダムなプロフィールを作る（整数・小数の入力を両方含める）
+
+    Args:
+        count (int): 件数
+        seed (int): 乱数のシード
+
+    Returns:
+        list[dict]: gender, age, height, current_weight, activity_coefficient, reduction_rate
+    """
+    rng = random.Random(seed)
+    profiles = []
+    for _ in range(count):
+        profiles.append({
+            "gender": rng.choice(["男性", "女性"]),
+            "age": rng.randint(15, 90),
+            "height": rng.choice([rng.randint(140, 200), round(rng.uniform(140, 200), 1)]),
+            "current_weight": rng.choice([rng.randint(40, 150), round(rng.uniform(40, 150), 1)]),
+            "activity_coefficient": rng.choice([1.2, 1.375, 1.4, 1.55, 1.725, 1.9]),
+            "reduction_rate": rng.choice([0.02, 0.04]),
+        })
+    return profiles
+
+
+def check_scalar(profiles):
+    """1件ずつの計算を旧実装と比べる（不一致の説明のリストを返す）"""
+    problems = []
+    for i, profile in enumerate(profiles):
+        expected = _legacy_sekiguchi_targets(profile)
+        actual = formulas.calculate_target_calories_and_pfc(profile)
+        if actual != expected:
+            problems.append(f"関口式 #{i}: {profile} → {actual} / 旧実装 {expected}")
+
+        tdee = expected["tdee"]
+        target = formulas.ratio_target_calories(tdee, profile["reduction_rate"])
+        if round(target, 2) != _legacy_diet_mentor_target_calories(tdee, profile["reduction_rate"]):
+            problems.append(f"一定割合の目標カロリー #{i}: {profile}")
+
+        pfc = tuple(round(value, 1) for value in formulas.pfc_grams(target))
+        legacy_pfc = _legacy_diet_mentor_pfc_targets(target)
+        if pfc != (legacy_pfc['protein'], legacy_pfc['fat'], legacy_pfc['carbs']):
+            problems.append(f"PFC目標 #{i}: {pfc} / 旧実装 {legacy_pfc}")
+
+        grams = (profile["height"] / 10, profile["current_weight"] / 3, profile["age"] * 2)
+        percent = tuple(round(value) for value in formulas.pfc_percentage(*grams))
+        legacy_percent = _legacy_diet_mentor_pfc_percentage(*grams)
+        if percent != (legacy_percent['protein_percent'], legacy_percent['fat_percent'],
+                       legacy_percent['carb_percent']):
+            problems.append(f"PFC比率 #{i}: {percent} / 旧実装 {legacy_percent}")
+
+    if formulas.pfc_percentage(0, 0, 0) != (0, 0, 0):
+        problems.append("PFC比率: 0kcalのとき0にならない")
+    return problems
+
+
+def check_arrays(profiles):
+    """配列版の計算を1件ずつの計算と比べる（不一致の説明のリストを返す）"""
+    import numpy as np
+    from . import arrays
+
+    columns = {key: np.array([profile[key] for profile in profiles], dtype=float)
+               for key in ("age", "height", "current_weight", "activity_coefficient", "reduction_rate")}
+    male = arrays.is_male(profile["gender"] for profile in profiles)
+
+    result = arrays.targets(male, columns["current_weight"], columns["height"], columns["age"],
+                            columns["activity_coefficient"], columns["reduction_rate"])
+    ratio_targets = arrays.ratio_target_calories(result["tdee"], columns["reduction_rate"])
+    percent = arrays.pfc_percentage(columns["height"] / 10, columns["current_weight"] / 3, columns["age"] * 2)
+
+    problems = []
+    for i, profile in enumerate(profiles):
+        expected = formulas.calculate_target_calories_and_pfc(profile)
+        actual = {key: float(values[i]) for key, values in result.items()}
+        if actual != expected:
+            problems.append(f"配列版 #{i}: {profile} → {actual} / 1件ずつ {expected}")
+        if float(ratio_targets[i]) != formulas.ratio_target_calories(expected["tdee"], profile["reduction_rate"]):
+            problems.append(f"配列版の一定割合の目標カロリー #{i}: {profile}")
+        grams = (profile["height"] / 10, profile["current_weight"] / 3, profile["age"] * 2)
+        if tuple(float(values[i]) for values in percent) != formulas.pfc_percentage(*grams):
+            problems.append(f"配列版のPFC比率 #{i}: {profile}")
+
+    zero = arrays.pfc_percentage(np.zeros(1), np.zeros(1), np.zeros(1))
+    if any(values[0] != 0 for values in zero):
+        problems.append("配列版のPFC比率: 0kcalのとき0にならない")
+    return problems
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='旧実装との一致確認')
+    parser.add_argument('--samples', type=int, default=10000, help='確認するプロフィールの数')
+    parser.add_argument('--seed', type=int, default=0, help='乱数のシード')
+    args = parser.parse_args()
+
+    profiles = random_profiles(args.samples, args.seed)
+    problems = check_scalar(profiles)
+    try:
+        problems += check_arrays(profiles)
+        checked = "1件ずつ・配列版"
+    except ImportError:
+        checked = "1件ずつ（NumPyがないため配列版は未確認）"
+
+    if problems:
+        print(f"⚠️ 旧実装と一致しない結果が{len(problems)}件あります:")
+        for problem in problems[:20]:
+            print(f"  - {problem}")
+        sys.exit(1)
+    print(f"✅ {len(profiles)}件のプロフィールで旧実装と一致しました（{checked}）")
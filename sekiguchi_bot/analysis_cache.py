@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+食事画像解析結果のキャッシュ
+画像のSHA-256と知覚ハッシュ（dHash）をキーに、Gemini APIの解析結果を保存する
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from PIL import Image
+
+
+# デフォルト設定（環境変数で上書き可能）
+DEFAULT_CACHE_PATH = os.environ.get("FOOD_CACHE_PATH", "food_analysis_cache.db")
+DEFAULT_TTL_SECONDS = int(os.environ.get("FOOD_CACHE_TTL", 30 * 24 * 60 * 60))  # 30日
+DEFAULT_MAX_ENTRIES = int(os.environ.get("FOOD_CACHE_MAX_ENTRIES", 5000))
+# 知覚ハッシュのハミング距離がこれ以下なら同じ食事とみなす
+DEFAULT_PHASH_THRESHOLD = int(os.environ.get("FOOD_CACHE_PHASH_THRESHOLD", 4))
+
+# 類似検索用に64bitの知覚ハッシュを8bitずつ8個の列に分けて索引をつける。
+# ハミング距離が7以下の2つのハッシュは、鳩の巣原理で少なくとも1つの列が完全に一致するので、
+# どれかの列が一致する行だけを候補にすれば見落としがない
+PHASH_BANDS = 8
+PHASH_BAND_BITS = 8
+_BAND_COLUMNS = tuple(f"phash_band{i}" for i in range(PHASH_BANDS))
+
+
+def sha256_of_file(image_path):
+    """
+    画像ファイルのSHA-256を計算
+
+    Args:
+        image_path (str): 画像のパス
+
+    Returns:
+        str: 16進数のハッシュ値
+    """
+    digest = hashlib.sha256()
+    with open(image_path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def perceptual_hash(img, hash_size=8):
+    """
+    差分ハッシュ（dHash）を計算
+
+    縮小したグレースケール画像で隣り合う画素の明暗を比較するため、
+    再圧縮やリサイズ程度の違いでは値がほとんど変わらない。
+
+    Args:
+        img (PIL.Image.Image): 画像
+        hash_size (int): ハッシュの一辺（8なら64bit）
+
+    Returns:
+        int: ハッシュ値
+    """
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a, b):
+    """2つのハッシュ値のハミング距離"""
+    return bin(a ^ b).count("1")
+
+
+def phash_bands(phash):
+    """
+    知覚ハッシュを索引用の列の値に分割
+
+    Args:
+        phash (int): 64bitの知覚ハッシュ
+
+    Returns:
+        tuple[int]: 上位の桁から PHASH_BAND_BITS ずつ区切った値（PHASH_BANDS 個）
+    """
+    mask = (1 << PHASH_BAND_BITS) - 1
+    return tuple(
+        (phash >> (PHASH_BAND_BITS * (PHASH_BANDS - 1 - i))) & mask
+        for i in range(PHASH_BANDS)
+    )
+
+
+class FoodAnalysisCache:
+    """TTLとLRUで上限を管理する、SQLite永続化の解析結果キャッシュ"""
+
+    def __init__(self, db_path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_entries=DEFAULT_MAX_ENTRIES, phash_threshold=DEFAULT_PHASH_THRESHOLD):
+        """
+        初期化
+
+        Args:
+            db_path (str): キャッシュファイルのパス
+            ttl_seconds (int): 有効期限（秒）
+            max_entries (int): 最大保存件数（超えたら最後に使われたのが古い順に削除）
+            phash_threshold (int): 類似画像とみなすハミング距離
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.phash_threshold = phash_threshold
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS food_analysis_cache (
+                sha256 TEXT PRIMARY KEY,
+                phash TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_food_cache_last_used ON food_analysis_cache (last_used)"
+        )
+        self._add_band_columns()
+        self._conn.commit()
+
+    def _add_band_columns(self):
+        """類似検索用の列と索引を作成（列がない古いキャッシュには追加して値を埋める）"""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(food_analysis_cache)")}
+        missing = [column for column in _BAND_COLUMNS if column not in columns]
+        for column in missing:
+            self._conn.execute(f"ALTER TABLE food_analysis_cache ADD COLUMN {column} INTEGER")
+        if missing:
+            rows = self._conn.execute("SELECT sha256, phash FROM food_analysis_cache").fetchall()
+            self._conn.executemany(
+                f"UPDATE food_analysis_cache SET {', '.join(f'{c} = ?' for c in _BAND_COLUMNS)} "
+                "WHERE sha256 = ?",
+                [phash_bands(int(phash, 16)) + (key,) for key, phash in rows]
+            )
+        for column in _BAND_COLUMNS:
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_food_cache_{column} ON food_analysis_cache ({column})"
+            )
+
+    def get(self, sha256, phash):
+        """
+        キャッシュから解析結果を取得
+
+        SHA-256が一致するものを優先し、なければ知覚ハッシュが近いものを探す。
+
+        Args:
+            sha256 (str): 画像のSHA-256
+            phash (int): 画像の知覚ハッシュ
+
+        Returns:
+            dict or None: 解析結果（見つからない場合はNone）
+        """
+        now = time.time()
+        expire_before = now - self.ttl_seconds
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256, result FROM food_analysis_cache WHERE sha256 = ? AND created_at >= ?",
+                (sha256, expire_before)
+            ).fetchone()
+
+            if row is None and self.phash_threshold >= 0:
+                best = None
+                for key, stored_phash, result in self._similar_candidates(phash, expire_before):
+                    distance = hamming_distance(phash, int(stored_phash, 16))
+                    if distance <= self.phash_threshold and (best is None or distance < best[0]):
+                        best = (distance, key, result)
+                if best is not None:
+                    row = (best[1], best[2])
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE food_analysis_cache SET last_used = ? WHERE sha256 = ?",
+                (now, row[0])
+            )
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[1])
+
+    def _similar_candidates(self, phash, expire_before):
+        """
+        知覚ハッシュが近い可能性のある行を取得（ロック内で呼ぶ）
+
+        しきい値が PHASH_BANDS 未満なら、どれかの列が一致する行だけを索引で取り出す。
+        """
+        if self.phash_threshold >= PHASH_BANDS:
+            return self._conn.execute(
+                "SELECT sha256, phash, result FROM food_analysis_cache WHERE created_at >= ?",
+                (expire_before,)
+            )
+        return self._conn.execute(
+            "SELECT sha256, phash, result FROM food_analysis_cache WHERE created_at >= ? AND ("
+            + " OR ".join(f"{column} = ?" for column in _BAND_COLUMNS) + ")",
+            (expire_before,) + phash_bands(phash)
+        )
+
+    def put(self, sha256, phash, result):
+        """
+        解析結果を保存し、期限切れ・上限超過分を削除
+
+        Args:
+            sha256 (str): 画像のSHA-256
+            phash (int): 画像の知覚ハッシュ
+            result (dict): 解析結果
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO food_analysis_cache "
+                f"(sha256, phash, result, created_at, last_used, {', '.join(_BAND_COLUMNS)}) "
+                f"VALUES (?, ?, ?, ?, ?, {', '.join('?' * PHASH_BANDS)})",
+                (sha256, format(phash, "016x"), json.dumps(result, ensure_ascii=False), now, now)
+                + phash_bands(phash)
+            )
+            self._conn.execute(
+                "DELETE FROM food_analysis_cache WHERE created_at < ?",
+                (now - self.ttl_seconds,)
+            )
+            self._conn.execute("""
+                DELETE FROM food_analysis_cache WHERE sha256 IN (
+                    SELECT sha256 FROM food_analysis_cache
+                    ORDER BY last_used DESC
+                    LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._conn.commit()
+
+    def stats(self):
+        """
+        キャッシュの統計情報
+
+        Returns:
+            dict: hits, misses, entries
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM food_analysis_cache").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+グラフ描画サービス
+pyplotのグローバル状態を使わず、Aggバックエンドで直接PNGを描画する。
+レイアウト済みのFigureをプロセスごとに使い回し、棒の高さやラベルだけを更新する。
+matplotlibは最初の描画時に読み込む（起動時間を短くするため）。
+"""
+
+import atexit
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+ACTUAL_COLOR = '#FF6B6B'
+TARGET_COLOR = '#4ECDC4'
+BAR_WIDTH = 0.35
+GRAPH_DPI = 150
+
+# プロセス内で使い回すFigure（チャート種類ごとに1つ）
+_figure_pool = {}
+
+
+def _new_figure(figsize):
+    """Aggキャンバスつきの新しいFigureを作成（matplotlibはここで初めて読み込む）"""
+    import matplotlib
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    # 日本語フォント設定
+    matplotlib.rcParams['font.family'] = 'DejaVu Sans'
+
+    fig = Figure(figsize=figsize)
+    return fig, FigureCanvasAgg(fig)
+
+
+def _new_bar_axes_layout(ax, labels, ylabel, title):
+    """実績・目標の棒グラフを高さ0で配置し、更新用のオブジェクトを返す"""
+    x = range(len(labels))
+    zeros = [0] * len(labels)
+    actual_bars = ax.bar([i - BAR_WIDTH / 2 for i in x], zeros, BAR_WIDTH,
+                         label='Actual', color=ACTUAL_COLOR, alpha=0.8)
+    target_bars = ax.bar([i + BAR_WIDTH / 2 for i in x], zeros, BAR_WIDTH,
+                         label='Target', color=TARGET_COLOR, alpha=0.8)
+
+    ax.set_ylabel(ylabel, fontsize=12)
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    ax.set_xticks(list(x))
+    ax.set_xticklabels(labels)
+    ax.legend()
+    ax.grid(axis='y', alpha=0.3)
+
+    # 値のラベル（バーの上に表示）
+    bars = list(actual_bars) + list(target_bars)
+    texts = [
+        ax.text(bar.get_x() + bar.get_width() / 2., 0, '', ha='center', va='bottom', fontsize=10)
+        for bar in bars
+    ]
+    return {"ax": ax, "bars": bars, "texts": texts}
+
+
+def _get_nutrition_figure():
+    """カロリー・PFC比較グラフ用のFigureを取得（初回のみ作成）"""
+    entry = _figure_pool.get("nutrition")
+    if entry is None:
+        fig, canvas = _new_figure((14, 6))
+        ax1, ax2 = fig.subplots(1, 2)
+        entry = {
+            "fig": fig,
+            "canvas": canvas,
+            "calories": _new_bar_axes_layout(ax1, ['Calories'], 'kcal', 'Calorie Comparison'),
+            "pfc": _new_bar_axes_layout(ax2, ['Protein (g)', 'Fat (g)', 'Carbs (g)'], 'grams', 'PFC Comparison'),
+        }
+        fig.tight_layout()
+        _figure_pool["nutrition"] = entry
+    return entry
+
+
+def _get_weight_figure():
+    """体重推移グラフ用のFigureを取得（初回のみ作成）"""
+    entry = _figure_pool.get("weight")
+    if entry is None:
+        fig, canvas = _new_figure((10, 6))
+        ax = fig.subplots()
+        line, = ax.plot([], [], marker='o', linewidth=2, markersize=8, color=TARGET_COLOR)
+        ax.set_xlabel('Day', fontsize=12)
+        ax.set_ylabel('kg', fontsize=12)
+        ax.set_title('Weight History', fontsize=14, fontweight='bold')
+        ax.grid(alpha=0.3)
+        fig.tight_layout()
+        entry = {"fig": fig, "canvas": canvas, "ax": ax, "line": line}
+        _figure_pool["weight"] = entry
+    return entry
+
+
+def _update_bars(layout, actual_values, target_values, label_format):
+    """棒の高さと値ラベルを更新"""
+    values = list(actual_values) + list(target_values)
+    for bar, text, value in zip(layout["bars"], layout["texts"], values):
+        bar.set_height(value)
+        text.set_position((bar.get_x() + bar.get_width() / 2., value))
+        text.set_text(label_format(value))
+    top = max(values) if values else 0
+    layout["ax"].set_ylim(0, top * 1.1 if top > 0 else 1)
+
+
+def _to_png(entry):
+    buffer = io.BytesIO()
+    entry["fig"].savefig(buffer, format="png", dpi=GRAPH_DPI)
+    return buffer.getvalue()
+
+
+def render_nutrition_chart(actual_calories, target_calories, actual_protein, target_protein,
+                           actual_fat, target_fat, actual_carbs, target_carbs):
+    """
+    カロリーとPFCの比較グラフをPNGで描画
+
+    Args:
+        actual_calories (float): 実際のカロリー
+        target_calories (float): 目標カロリー
+        actual_protein (float): 実際のタンパク質（Noneの場合はPFCグラフを表示しない）
+        target_protein (float): 目標タンパク質
+        actual_fat (float): 実際の脂質
+        target_fat (float): 目標脂質
+        actual_carbs (float): 実際の炭水化物
+        target_carbs (float): 目標炭水化物
+
+    Returns:
+        bytes: PNG画像
+    """
+    entry = _get_nutrition_figure()
+
+    _update_bars(entry["calories"], [actual_calories], [target_calories],
+                 lambda value: f'{int(value)}')
+
+    has_pfc = actual_protein is not None and actual_fat is not None and actual_carbs is not None
+    pfc_layout = entry["pfc"]
+    pfc_layout["ax"].set_visible(has_pfc)
+    if has_pfc:
+        _update_bars(pfc_layout, [actual_protein, actual_fat, actual_carbs],
+                     [target_protein, target_fat, target_carbs],
+                     lambda value: f'{value:.1f}')
+
+    return _to_png(entry)
+
+
+def render_weight_chart(weights):
+    """
+    体重推移グラフをPNGで描画
+
+    Args:
+        weights (list[float]): 体重の履歴（古い順）
+
+    Returns:
+        bytes: PNG画像
+    """
+    entry = _get_weight_figure()
+    days = list(range(1, len(weights) + 1))
+    entry["line"].set_data(days, weights)
+
+    ax = entry["ax"]
+    if weights:
+        low, high = min(weights), max(weights)
+        margin = max((high - low) * 0.1, 0.5)
+        ax.set_xlim(0.5, len(weights) + 0.5)
+        ax.set_ylim(low - margin, high + margin)
+
+    return _to_png(entry)
+
+
+@contextlib.contextmanager
+def _worker_main_module():
+    """
+    spawn する子プロセスの __main__ をこのモジュールにする
+
+    multiprocessing は子プロセスの起動時に sys.modules['__main__'] の __spec__ か __file__ を見て、
+    子プロセスでそのモジュールを __mp_main__ として実行する。
+    プロセス全体に見える差し替えなので、ChartRenderService.start() でプールを作るときだけ使う。
+    """
+    main_module = sys.modules['__main__']
+    sys.modules['__main__'] = sys.modules[__name__]
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main_module
+
+
+def _wait_for_pool(barrier, timeout):
+    """描画プロセスの初期化処理: プールの全プロセスが起動するまで待つ"""
+    barrier.wait(timeout)
+
+
+def _worker_ready():
+    """起動確認用の空のタスク"""
+    return None
+
+
+class ChartRenderService:
+    """
+    グラフ描画をプロセスプールで行うサービス（Flaskのワーカーをブロックしない）
+
+    描画プロセスは spawn で起動する。Webhookのワーカーなど多数のスレッドが動くプロセスを
+    fork すると、他のスレッドが持っていたロックが解放されないまま子プロセスに引き継がれるため。
+
+    spawn した子プロセスは親の __main__（app.py）を読み込み直すので、start() で全プロセスを
+    まとめて起動し、その間だけ __main__ をこのモジュールに差し替えて、子プロセスではこのモジュールだけを
+    読み込ませる。他のスレッドに差し替えが見えないよう、app.py ではバックグラウンド処理の開始前に start() を呼ぶ。
+    """
+
+    def __init__(self, max_workers=None, timeout=30):
+        """
+        初期化
+
+        Args:
+            max_workers (int, optional): 描画プロセス数（省略時は環境変数CHART_WORKERSまたは2）
+            timeout (float): 描画結果を待つ最大秒数
+        """
+        self.max_workers = max_workers or int(os.environ.get("CHART_WORKERS", 2))
+        self.timeout = timeout
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def start(self):
+        """
+        プロセスプールを作り、描画プロセスを max_workers 個すべて起動する（起動済みなら何もしない）
+
+        ProcessPoolExecutor は空いているプロセスがないときに submit の中で1つずつプロセスを起動する。
+        各プロセスは初期化処理で全プロセスがそろうまで待つので、空のタスクを max_workers 個送れば
+        その submit の中ですべて起動し終わり、以後の submit では新しいプロセスを起動しない。
+        """
+        # 同時に呼ばれてもプールは1つだけ作る
+        with self._executor_lock:
+            if self._executor is not None:
+                return self._executor
+            context = multiprocessing.get_context('spawn')
+            executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=_wait_for_pool,
+                initargs=(context.Barrier(self.max_workers), self.timeout)
+            )
+            with _worker_main_module():
+                futures = [executor.submit(_worker_ready) for _ in range(self.max_workers)]
+            try:
+                for future in futures:
+                    future.result(timeout=self.timeout)
+            except Exception:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+            self._executor = executor
+            atexit.register(self.shutdown)
+            return executor
+
+    def _submit(self, func, *args):
+        return self.start().submit(func, *args)
+
+    def submit_nutrition_chart(self, *args):
+        """
+        カロリー・PFC比較グラフの描画を依頼
+
+        Args:
+            *args: render_nutrition_chart() と同じ引数
+
+        Returns:
+            concurrent.futures.Future: 結果はPNGのバイト列
+        """
+        return self._submit(render_nutrition_chart, *args)
+
+    def submit_weight_chart(self, weights):
+        """
+        体重推移グラフの描画を依頼
+
+        Args:
+            weights (list[float]): 体重の履歴（古い順）
+
+        Returns:
+            concurrent.futures.Future: 結果はPNGのバイト列
+        """
+        return self._submit(render_weight_chart, list(weights))
+
+    def render_nutrition_chart(self, *args):
+        """カロリー・PFC比較グラフを描画してPNGを返す（別プロセスで描画）"""
+        return self.submit_nutrition_chart(*args).result(timeout=self.timeout)
+
+    def render_weight_chart(self, weights):
+        """体重推移グラフを描画してPNGを返す（別プロセスで描画）"""
+        return self.submit_weight_chart(weights).result(timeout=self.timeout)
+
+    def shutdown(self):
+        """描画プロセスを終了"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+            atexit.unregister(self.shutdown)
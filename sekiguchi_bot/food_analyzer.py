@@ -5,10 +5,72 @@
 Google Gemini APIを使用して食事画像からカロリー・PFCバランスを自動計算
 """
 
-import google.generativeai as genai
 from PIL import Image
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+from analysis_cache import FoodAnalysisCache, sha256_of_file, perceptual_hash
+from image_preprocessor import preprocess_image
+
+
+# 食事画像解析用のプロンプト
+FOOD_ANALYSIS_PROMPT = """
+この画像に写っている食事を分析して、以下の情報をJSON形式で返してください。
+可能な限り正確に推定してください。
+
+返すJSON形式（日本語で返してください）:
+{
+    "meal_description": "食事の説明（例: 鶏胸肉のソテー、ブロッコリー、玄米）",
+    "total_calories": 総カロリー（kcal、数値のみ）,
+    "protein": タンパク質（g、数値のみ）,
+    "fat": 脂質（g、数値のみ）,
+    "carbs": 炭水化物（g、数値のみ）
+}
+
+注意点:
+- 数値は小数点第1位まで
+- 食材の量を推測して計算してください
+- 複数の料理がある場合は合計を出してください
+- 不明な場合は一般的な値を使用してください
+"""
+
+# 複数画像をまとめて解析する用のプロンプト
+FOOD_BATCH_ANALYSIS_PROMPT = """
+以下の{count}枚の画像は、それぞれ別々の食事です。
+画像ごとに食事を分析して、画像の順番どおりにJSON配列で返してください。
+可能な限り正確に推定してください。
+
+返すJSON形式（日本語で返してください。配列の要素数は必ず{count}個）:
+[
+    {{
+        "meal_description": "食事の説明（例: 鶏胸肉のソテー、ブロッコリー、玄米）",
+        "total_calories": 総カロリー（kcal、数値のみ）,
+        "protein": タンパク質（g、数値のみ）,
+        "fat": 脂質（g、数値のみ）,
+        "carbs": 炭水化物（g、数値のみ）
+    }}
+]
+
+注意点:
+- 数値は小数点第1位まで
+- 食材の量を推測して計算してください
+- 1枚の画像に複数の料理がある場合は、その画像の合計を出してください
+- 不明な場合は一般的な値を使用してください
+"""
+
+REQUIRED_RESULT_KEYS = ["meal_description", "total_calories", "protein", "fat", "carbs"]
+
+# 1回のリクエストにまとめる画像データの上限（超えたら1枚ずつ並列に解析）
+BATCH_MAX_PAYLOAD_BYTES = int(os.environ.get("FOOD_BATCH_MAX_BYTES", 15 * 1024 * 1024))
+BATCH_FALLBACK_WORKERS = 4
+
+# プロセス内で使い回すGeminiモデル（APIキーが変わったときだけ作り直す）
+_model = None
+_configured_api_key = None
+
+# 解析結果キャッシュ（初回利用時に作成）
+_analysis_cache = None
 
 
 def setup_gemini_api(api_key=None):
@@ -22,6 +84,8 @@ def setup_gemini_api(api_key=None):
     Returns:
         bool: セットアップが成功した場合True、失敗した場合False
     """
+    global _configured_api_key
+
     if api_key is None:
         api_key = os.environ.get("GEMINI_API_KEY")
 
@@ -35,98 +99,323 @@ def setup_gemini_api(api_key=None):
         print("   方法2: プログラム起動時に入力")
         return False
 
+    # 同じキーで設定済みなら何もしない
+    if api_key == _configured_api_key:
+        return True
+
     try:
+        # Geminiクライアントは重いので初回のセットアップ時に読み込む
+        import google.generativeai as genai
         genai.configure(api_key=api_key)
+        _configured_api_key = api_key
         return True
     except Exception as e:
         print(f"⚠️ APIのセットアップに失敗しました: {e}")
         return False
 
 
-def analyze_food_image(image_path, api_key=None):
+def get_gemini_model(api_key=None):
+    """
+    Geminiモデルを取得（プロセス内で1度だけ作成して使い回す）
+
+    Args:
+        api_key (str, optional): Google Gemini APIキー
+
+    Returns:
+        GenerativeModel or None: モデル（セットアップに失敗した場合はNone）
+    """
+    global _model
+
+    previous_key = _configured_api_key
+    if not setup_gemini_api(api_key):
+        return None
+
+    if _model is None or _configured_api_key != previous_key:
+        import google.generativeai as genai
+        _model = genai.GenerativeModel('gemini-1.5-flash')
+    return _model
+
+
+def get_analysis_cache():
+    """
+    解析結果キャッシュを取得（環境変数FOOD_CACHE_DISABLED=1で無効化）
+
+    Returns:
+        FoodAnalysisCache or None: キャッシュ
+    """
+    global _analysis_cache
+
+    if os.environ.get("FOOD_CACHE_DISABLED") == "1":
+        return None
+
+    if _analysis_cache is None:
+        try:
+            _analysis_cache = FoodAnalysisCache()
+        except Exception as e:
+            print(f"⚠️ 解析キャッシュを開けませんでした: {e}")
+            return None
+    return _analysis_cache
+
+
+def _lookup_cache(cache, image_path, img):
+    """
+    解析結果キャッシュを確認する（キャッシュのエラーはキャッシュにないものとして扱う）
+
+    Args:
+        cache (FoodAnalysisCache): キャッシュ
+        image_path (str): 画像のパス
+        img (PIL.Image.Image): 読み込んだ画像
+
+    Returns:
+        tuple: (sha256, 知覚ハッシュ, キャッシュした解析結果)
+               キャッシュにない場合は解析結果がNone、確認できなかった場合はすべてNone
+    """
+    try:
+        image_sha256 = sha256_of_file(image_path)
+        image_phash = perceptual_hash(img)
+        return image_sha256, image_phash, cache.get(image_sha256, image_phash)
+    except Exception as e:
+        print(f"⚠️ 解析キャッシュを確認できませんでした: {e}")
+        return None, None, None
+
+
+def _store_cache(cache, image_sha256, image_phash, result):
+    """解析結果をキャッシュに保存する（保存できなくても解析結果はそのまま使う）"""
+    if cache is None or image_sha256 is None or result is None:
+        return
+    try:
+        cache.put(image_sha256, image_phash, result)
+    except Exception as e:
+        print(f"⚠️ 解析結果をキャッシュに保存できませんでした: {e}")
+
+
+def extract_json_text(response_text):
+    """
+    Geminiの応答からJSON部分を抽出（```json ... ``` のような形式に対応）
+
+    Args:
+        response_text (str): 応答テキスト
+
+    Returns:
+        str: JSON文字列
+    """
+    if "```json" in response_text:
+        json_start = response_text.find("```json") + 7
+        json_end = response_text.find("```", json_start)
+        return response_text[json_start:json_end].strip()
+    elif "```" in response_text:
+        json_start = response_text.find("```") + 3
+        json_end = response_text.find("```", json_start)
+        return response_text[json_start:json_end].strip()
+    return response_text
+
+
+def analyze_food_image(image_path, api_key=None, use_cache=True):
     """
     食事画像を解析し、カロリーとPFCバランスを推定する
 
+    同じ画像・ほぼ同じ画像の解析結果はキャッシュから返し、APIを呼ばない。
+
     Args:
         image_path (str): 食事画像のパス
         api_key (str, optional): Google Gemini APIキー
+        use_cache (bool): 解析結果キャッシュを使うかどうか
 
     Returns:
         dict or None: 解析結果（カロリー、タンパク質、脂質、炭水化物、食事内容）
                      失敗した場合はNone
     """
-    # APIのセットアップ
-    if not setup_gemini_api(api_key):
-        return None
-
     # 画像が存在するか確認
     if not os.path.exists(image_path):
         print(f"⚠️ 画像ファイルが見つかりません: {image_path}")
         return None
 
+    cache = get_analysis_cache() if use_cache else None
+    image_sha256 = image_phash = None
     try:
         # 画像を読み込む
-        img = Image.open(image_path)
+        with Image.open(image_path) as img:
+            # キャッシュを確認
+            if cache is not None:
+                image_sha256, image_phash, cached = _lookup_cache(cache, image_path, img)
+                if cached is not None:
+                    print("✅ 解析が完了しました！（キャッシュ）")
+                    return cached
+
+            # アップロード前に縮小・再エンコードしてサイズを減らす
+            prepared = preprocess_image(img, original_bytes=os.path.getsize(image_path))
+        print(f"🗜️ 画像サイズ: {prepared['original_bytes'] / 1024:.0f}KB → "
+              f"{prepared['processed_bytes'] / 1024:.0f}KB "
+              f"（{prepared['bytes_saved'] / 1024:.0f}KB削減）")
 
-        # Gemini Pro Visionモデルを使用
-        model = genai.GenerativeModel('gemini-1.5-flash')
+    except FileNotFoundError:
+        print(f"⚠️ 画像ファイルが見つかりません: {image_path}")
+        return None
+    except Exception as e:
+        print(f"⚠️ 画像解析中にエラーが発生しました: {e}")
+        return None
 
-        # プロンプトを作成
-        prompt = """
-この画像に写っている食事を分析して、以下の情報をJSON形式で返してください。
-可能な限り正確に推定してください。
+    result = _analyze_prepared_image(prepared, api_key)
+    _store_cache(cache, image_sha256, image_phash, result)
+    return result
 
-返すJSON形式（日本語で返してください）:
-{
-    "meal_description": "食事の説明（例: 鶏胸肉のソテー、ブロッコリー、玄米）",
-    "total_calories": 総カロリー（kcal、数値のみ）,
-    "protein": タンパク質（g、数値のみ）,
-    "fat": 脂質（g、数値のみ）,
-    "carbs": 炭水化物（g、数値のみ）
-}
 
-注意点:
-- 数値は小数点第1位まで
-- 食材の量を推測して計算してください
-- 複数の料理がある場合は合計を出してください
-- 不明な場合は一般的な値を使用してください
-"""
+def _analyze_prepared_image(prepared, api_key=None):
+    """
+    前処理済みの1枚の画像を解析する（キャッシュは確認しない）
 
+    Args:
+        prepared (dict): preprocess_image() の返り値
+        api_key (str, optional): Google Gemini APIキー
+
+    Returns:
+        dict or None: 解析結果（失敗した場合はNone）
+    """
+    # Gemini Pro Visionモデルを使用
+    model = get_gemini_model(api_key)
+    if model is None:
+        return None
+
+    response_text = ""
+    try:
         # 画像を解析
         print("🔍 画像を解析中...")
-        response = model.generate_content([prompt, img])
+        response = model.generate_content([
+            FOOD_ANALYSIS_PROMPT,
+            {"mime_type": prepared["mime_type"], "data": prepared["data"]}
+        ])
 
         # レスポンステキストを取得
         response_text = response.text.strip()
 
-        # JSONとして解析
-        # レスポンスからJSON部分を抽出（```json ... ``` のような形式の場合）
-        if "```json" in response_text:
-            json_start = response_text.find("```json") + 7
-            json_end = response_text.find("```", json_start)
-            json_text = response_text[json_start:json_end].strip()
-        elif "```" in response_text:
-            json_start = response_text.find("```") + 3
-            json_end = response_text.find("```", json_start)
-            json_text = response_text[json_start:json_end].strip()
-        else:
-            json_text = response_text
-
         # JSONをパース
-        result = json.loads(json_text)
+        result = json.loads(extract_json_text(response_text))
 
         # 必要なキーが含まれているか確認
-        required_keys = ["meal_description", "total_calories", "protein", "fat", "carbs"]
-        if not all(key in result for key in required_keys):
+        if not all(key in result for key in REQUIRED_RESULT_KEYS):
             print("⚠️ APIからの応答が不完全です")
             return None
 
         print("✅ 解析が完了しました！")
         return result
 
-    except FileNotFoundError:
-        print(f"⚠️ 画像ファイルが見つかりません: {image_path}")
+    except json.JSONDecodeError as e:
+        print(f"⚠️ 解析結果のJSON解析に失敗しました: {e}")
+        print(f"レスポンス: {response_text}")
         return None
+    except Exception as e:
+        print(f"⚠️ 画像解析中にエラーが発生しました: {e}")
+        return None
+
+
+def analyze_food_images(image_paths, api_key=None, use_cache=True):
+    """
+    複数の食事画像（朝・昼・夜など）をまとめて解析する
+
+    キャッシュにない画像だけを1回のリクエストにまとめて送る。
+    画像データの合計が BATCH_MAX_PAYLOAD_BYTES を超える場合や、
+    まとめた解析に失敗した場合は1枚ずつ並列に解析する。
+
+    Args:
+        image_paths (list[str]): 食事画像のパスのリスト
+        api_key (str, optional): Google Gemini APIキー
+        use_cache (bool): 解析結果キャッシュを使うかどうか
+
+    Returns:
+        dict: {
+            "results": 画像ごとの解析結果のリスト（失敗した画像はNone）,
+            "daily_total": 解析できた画像の合計（total_calories, protein, fat, carbs）
+        }
+    """
+    results = [None] * len(image_paths)
+    cache = get_analysis_cache() if use_cache else None
+
+    # キャッシュにない画像を前処理して集める
+    pending = []  # (index, prepared, sha256, phash)
+    for i, image_path in enumerate(image_paths):
+        if not os.path.exists(image_path):
+            print(f"⚠️ 画像ファイルが見つかりません: {image_path}")
+            continue
+        try:
+            with Image.open(image_path) as img:
+                image_sha256 = image_phash = None
+                if cache is not None:
+                    image_sha256, image_phash, cached = _lookup_cache(cache, image_path, img)
+                    if cached is not None:
+                        results[i] = cached
+                        continue
+                prepared = preprocess_image(img, original_bytes=os.path.getsize(image_path))
+            pending.append((i, prepared, image_sha256, image_phash))
+        except Exception as e:
+            print(f"⚠️ 画像の読み込みに失敗しました ({image_path}): {e}")
+
+    if len(pending) == 1:
+        # 1枚だけなら前処理済みのデータをそのまま1枚用のリクエストで送る
+        i, prepared, image_sha256, image_phash = pending[0]
+        results[i] = _analyze_prepared_image(prepared, api_key)
+        _store_cache(cache, image_sha256, image_phash, results[i])
+    elif pending:
+        payload_bytes = sum(item[1]["processed_bytes"] for item in pending)
+        batch_results = None
+        if payload_bytes <= BATCH_MAX_PAYLOAD_BYTES:
+            batch_results = _analyze_prepared_batch([item[1] for item in pending], api_key)
+
+        if batch_results is not None:
+            for (i, _, image_sha256, image_phash), result in zip(pending, batch_results):
+                results[i] = result
+                _store_cache(cache, image_sha256, image_phash, result)
+        else:
+            # まとめて送れない場合は前処理済みのデータを1枚ずつ並列に解析
+            with ThreadPoolExecutor(max_workers=BATCH_FALLBACK_WORKERS) as executor:
+                futures = {
+                    i: (executor.submit(_analyze_prepared_image, prepared, api_key), image_sha256, image_phash)
+                    for i, prepared, image_sha256, image_phash in pending
+                }
+                for i, (future, image_sha256, image_phash) in futures.items():
+                    results[i] = future.result()
+                    _store_cache(cache, image_sha256, image_phash, results[i])
+
+    daily_total = {"total_calories": 0, "protein": 0, "fat": 0, "carbs": 0}
+    for result in results:
+        if result is None:
+            continue
+        for key in daily_total:
+            try:
+                daily_total[key] += float(result.get(key) or 0)
+            except (TypeError, ValueError):
+                pass
+
+    return {
+        "results": results,
+        "daily_total": daily_total
+    }
+
+
+def _analyze_prepared_batch(prepared_images, api_key=None):
+    """
+    前処理済みの複数画像を1回のリクエストで解析する
+
+    Args:
+        prepared_images (list[dict]): preprocess_image() の返り値のリスト
+        api_key (str, optional): Google Gemini APIキー
+
+    Returns:
+        list[dict] or None: 画像ごとの解析結果（リクエスト自体に失敗した場合はNone）
+    """
+    model = get_gemini_model(api_key)
+    if model is None:
+        return None
+
+    contents = [FOOD_BATCH_ANALYSIS_PROMPT.format(count=len(prepared_images))]
+    for prepared in prepared_images:
+        contents.append({"mime_type": prepared["mime_type"], "data": prepared["data"]})
+
+    response_text = ""
+    try:
+        print(f"🔍 {len(prepared_images)}枚の画像をまとめて解析中...")
+        response = model.generate_content(contents)
+        response_text = response.text.strip()
+        parsed = json.loads(extract_json_text(response_text))
     except json.JSONDecodeError as e:
         print(f"⚠️ 解析結果のJSON解析に失敗しました: {e}")
         print(f"レスポンス: {response_text}")
@@ -135,6 +424,16 @@ def analyze_food_image(image_path, api_key=None):
         print(f"⚠️ 画像解析中にエラーが発生しました: {e}")
         return None
 
+    if not isinstance(parsed, list) or len(parsed) != len(prepared_images):
+        print("⚠️ APIからの応答の件数が画像の枚数と一致しません")
+        return None
+
+    print("✅ 解析が完了しました！")
+    return [
+        result if isinstance(result, dict) and all(key in result for key in REQUIRED_RESULT_KEYS) else None
+        for result in parsed
+    ]
+
 
 def get_image_path_from_user():
     """
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+食事画像の前処理モジュール
+Gemini APIへのアップロード前に、向きの補正・縮小・再エンコード・メタデータ削除を行う
+"""
+
+import io
+import os
+
+from PIL import Image, ImageOps
+
+
+# デフォルト設定（環境変数で上書き可能）
+DEFAULT_MAX_EDGE = int(os.environ.get("FOOD_IMAGE_MAX_EDGE", 1024))
+DEFAULT_QUALITY = int(os.environ.get("FOOD_IMAGE_QUALITY", 85))
+DEFAULT_FORMAT = os.environ.get("FOOD_IMAGE_FORMAT", "JPEG").upper()
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+
+def preprocess_image(img, original_bytes=None, max_edge=DEFAULT_MAX_EDGE,
+                     quality=DEFAULT_QUALITY, image_format=DEFAULT_FORMAT):
+    """
+    画像をアップロード用に前処理する
+
+    1. EXIFの回転情報を反映（スマホ写真の横倒れを防ぐ）
+    2. 長辺が max_edge を超える場合は縮小
+    3. JPEG/WebPで再エンコード（EXIFなどのメタデータは書き出さない）
+
+    Args:
+        img (PIL.Image.Image): 元画像
+        original_bytes (int, optional): 元ファイルのサイズ（削減量の計算用）
+        max_edge (int): 長辺の最大ピクセル数
+        quality (int): エンコード品質（1〜100）
+        image_format (str): "JPEG" または "WEBP"
+
+    Returns:
+        dict: {
+            "data": エンコード済みのバイト列,
+            "mime_type": MIMEタイプ,
+            "size": (幅, 高さ),
+            "original_bytes": 元のバイト数,
+            "processed_bytes": 処理後のバイト数,
+            "bytes_saved": 削減できたバイト数
+        }
+    """
+    if image_format not in MIME_TYPES:
+        raise ValueError(f"未対応の画像形式です: {image_format}")
+
+    processed = ImageOps.exif_transpose(img)
+
+    # 透過やパレット画像はJPEGで保存できないのでRGBに変換
+    if processed.mode not in ("RGB", "L"):
+        processed = processed.convert("RGB")
+
+    if max(processed.size) > max_edge:
+        processed = processed.copy()
+        processed.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    # exif を渡さないので、位置情報などのメタデータは含まれない
+    processed.save(buffer, format=image_format, quality=quality, optimize=True)
+    data = buffer.getvalue()
+
+    if original_bytes is None:
+        original_bytes = len(data)
+
+    return {
+        "data": data,
+        "mime_type": MIME_TYPES[image_format],
+        "size": processed.size,
+        "original_bytes": original_bytes,
+        "processed_bytes": len(data),
+        "bytes_saved": max(original_bytes - len(data), 0),
+    }
+
+
+def preprocess_image_file(image_path, **kwargs):
+    """
+    画像ファイルを読み込んで前処理する
+
+    Args:
+        image_path (str): 画像のパス
+        **kwargs: preprocess_image() に渡すオプション
+
+    Returns:
+        dict: preprocess_image() の返り値
+    """
+    with Image.open(image_path) as img:
+        return preprocess_image(img, original_bytes=os.path.getsize(image_path), **kwargs)
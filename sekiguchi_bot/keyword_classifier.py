@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+キーワード分類器
+Aho-Corasick法で全キーワードを1回の走査で検出し、カテゴリごとにスコアを集計する
+（重なり合う一致は左から最長のものだけを数える）
+"""
+
+from collections import deque
+
+
+class KeywordClassifier:
+    """複数パターン照合によるカテゴリ分類クラス"""
+
+    def __init__(self, keywords_by_category, default_category, min_confidence=0.7, min_score=2):
+        """
+        キーワード表からオートマトンを構築する（初期化時の1回のみ）
+
+        Args:
+            keywords_by_category (dict): {カテゴリ名: [キーワード, ...]}
+                キーワードは文字列、または (キーワード, 重み) のタプル。
+                重みを省略した場合はキーワードの文字数（長いほど具体的）
+            default_category (str): どのキーワードにも該当しない場合のカテゴリ
+            min_confidence (float): 分類を確定するのに必要な信頼度（0〜1）
+            min_score (float): 分類を確定するのに必要な最低スコア
+        """
+        self.default_category = default_category
+        self.min_confidence = min_confidence
+        self.min_score = min_score
+        self.categories = list(keywords_by_category.keys())
+
+        # トライ木: ノードごとの遷移・失敗リンク・出力（キーワードの文字数, カテゴリ番号, 重み）
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for category_index, words in enumerate(keywords_by_category.values()):
+            for word in words:
+                if isinstance(word, tuple):
+                    word, weight = word
+                else:
+                    weight = len(word)
+                self._add_keyword(word.lower(), category_index, weight)
+
+        self._build_failure_links()
+
+    def _add_keyword(self, word, category_index, weight):
+        node = 0
+        for char in word:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append((len(word), category_index, weight))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def scores(self, text):
+        """
+        テキスト中のキーワードを検出し、カテゴリごとのスコアを返す
+
+        「食べた」の中の「食べ」のように、重なり合う一致は左から最長のものだけを数える
+        （同じ語が複数のカテゴリにある場合は、それぞれのカテゴリに加算する）。
+
+        Args:
+            text (str): 判定するテキスト
+
+        Returns:
+            list[float]: カテゴリ順のスコア
+        """
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        totals = [0.0] * len(self.categories)
+
+        # 一致した範囲 (開始位置, 終了位置) ごとの（カテゴリ番号, 重み）
+        matches = {}
+        node = 0
+        for end, char in enumerate(text.lower(), 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for length, category_index, weight in output[node]:
+                matches.setdefault((end - length, end), []).append((category_index, weight))
+
+        # 開始位置が早い順・長い順に、前に採用した一致と重ならないものだけを採用
+        covered_until = 0
+        for start, end in sorted(matches, key=lambda span: (span[0], -span[1])):
+            if start < covered_until:
+                continue
+            covered_until = end
+            for category_index, weight in matches[(start, end)]:
+                totals[category_index] += weight
+
+        return totals
+
+    def classify(self, text):
+        """
+        テキストを分類する
+
+        Args:
+            text (str): 判定するテキスト
+
+        Returns:
+            tuple: (カテゴリ名, 信頼度)
+                信頼度は最高スコアが全スコアに占める割合。該当なしの場合は (default_category, 0.0)
+        """
+        totals = self.scores(text)
+        total = sum(totals)
+        if total == 0:
+            return self.default_category, 0.0
+
+        # 同点の場合はキーワード表で先に定義されたカテゴリを優先
+        best_index = max(range(len(totals)), key=lambda i: (totals[i], -i))
+        if totals[best_index] < self.min_score:
+            # 1文字のキーワードだけなど、根拠が弱い場合は確定させない
+            return self.categories[best_index], 0.0
+        return self.categories[best_index], totals[best_index] / total
+
+    def is_confident(self, confidence):
+        """信頼度がしきい値以上かどうか"""
+        return confidence >= self.min_confidence
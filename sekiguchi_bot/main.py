@@ -7,11 +7,16 @@
 
 import random
 import os
-from food_analyzer import analyze_food_image, get_image_path_from_user
-import matplotlib.pyplot as plt
-import matplotlib
-# 日本語フォント設定
-matplotlib.rcParams['font.family'] = 'DejaVu Sans'
+import sys
+from functools import lru_cache
+from chart_renderer import render_nutrition_chart
+
+# 共有の計算パッケージ（リポジトリ直下の nutrition_core）をインポートできるようにする
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# BMR・TDEE・目標カロリー/PFCの計算式は line_bot・diet-mentor-line-bot と共有
+from nutrition_core import calculate_bmr, calculate_tdee, calculate_target_calories_and_pfc
+from meal_catalog import MealCatalog, MEALS_PER_DAY
 
 
 def print_header():
@@ -218,6 +223,17 @@ def get_meal_examples():
     }
 
 
+@lru_cache(maxsize=1)
+def get_meal_catalog():
+    """
+    メニュー例の検索用カタログ（初回に1回だけ組み立てて使い回す）
+
+    Returns:
+        MealCatalog: get_meal_examples() のメニューのカタログ
+    """
+    return MealCatalog.from_examples(get_meal_examples())
+
+
 def suggest_meal_examples(target_calories, target_protein, target_fat, target_carbs, name):
     """
     ユーザーの目標カロリー・PFCに合わせたメニュー例を提案
@@ -229,23 +245,26 @@ def suggest_meal_examples(target_calories, target_protein, target_fat, target_ca
         target_carbs (float): 目標炭水化物
         name (str): ユーザー名
     """
-    meals = get_meal_examples()
+    catalog = get_meal_catalog()
+
+    # 1食あたりの目標（1日の目標を3食に分ける）に、カロリー・PFCが近い順に選ぶ
+    per_meal = (
+        target_calories / MEALS_PER_DAY,
+        target_protein / MEALS_PER_DAY,
+        target_fat / MEALS_PER_DAY,
+        target_carbs / MEALS_PER_DAY,
+    )
 
-    # カロリー範囲（±100kcal）でフィルタリング
-    suitable_convenience = [
-        meal for meal in meals["convenience"]
-        if abs(meal["calories"] - target_calories) <= 150
-    ]
-    suitable_homemade = [
-        meal for meal in meals["homemade"]
-        if abs(meal["calories"] - target_calories) <= 150
-    ]
+    def suitable(category):
+        # まず1食の目標±150kcalの中から選び、少ない場合はカロリー差の制限なしで選ぶ
+        meals = catalog.nearest(*per_meal, k=5, category=category, max_calorie_gap=150)
+        if len(meals) < 3:
+            meals = catalog.nearest(*per_meal, k=5, category=category)
+        return meals
 
-    # フィルタリング結果が少ない場合は全て表示
-    if len(suitable_convenience) < 3:
-        suitable_convenience = meals["convenience"][:5]
-    if len(suitable_homemade) < 3:
-        suitable_homemade = meals["homemade"][:5]
+    suitable_convenience = suitable("convenience")
+    suitable_homemade = suitable("homemade")
+    day_plans = catalog.day_plans(target_calories, target_protein, target_fat, target_carbs, k=2)
 
     print("\n" + "=" * 60)
     print("🍱 関口からのメニュー提案")
@@ -257,20 +276,31 @@ def suggest_meal_examples(target_calories, target_protein, target_fat, target_ca
     # コンビニ飯
     print("【🏪 コンビニで揃えられるメニュー】")
     print("-" * 60)
-    for i, meal in enumerate(suitable_convenience[:5], 1):
-        print(f"\n{i}. {meal['name']}")
-        print(f"   📊 {meal['calories']}kcal | P{meal['protein']}g F{meal['fat']}g C{meal['carbs']}g")
-        print(f"   💡 {meal['description']}")
+    for i, meal in enumerate(suitable_convenience, 1):
+        print(f"\n{i}. {meal.name}")
+        print(f"   📊 {meal.calories}kcal | P{meal.protein}g F{meal.fat}g C{meal.carbs}g")
+        print(f"   💡 {meal.description}")
 
     print("\n")
 
     # 自炊
     print("【🍳 自炊で作れるメニュー】")
     print("-" * 60)
-    for i, meal in enumerate(suitable_homemade[:5], 1):
-        print(f"\n{i}. {meal['name']}")
-        print(f"   📊 {meal['calories']}kcal | P{meal['protein']}g F{meal['fat']}g C{meal['carbs']}g")
-        print(f"   💡 {meal['description']}")
+    for i, meal in enumerate(suitable_homemade, 1):
+        print(f"\n{i}. {meal.name}")
+        print(f"   📊 {meal.calories}kcal | P{meal.protein}g F{meal.fat}g C{meal.carbs}g")
+        print(f"   💡 {meal.description}")
+
+    if day_plans:
+        print("\n")
+
+        # 1日3食の組み合わせ
+        print("【📅 1日3食の組み合わせ例】")
+        print("-" * 60)
+        for i, plan in enumerate(day_plans, 1):
+            print(f"\n{i}. 合計 {plan.calories}kcal | P{plan.protein}g F{plan.fat}g C{plan.carbs}g")
+            for label, meal in zip(("朝", "昼", "夜"), plan.meals):
+                print(f"   {label}: {meal.name}")
 
     print("\n" + "=" * 60)
     print("💡 ポイント")
@@ -440,44 +470,6 @@ def provide_special_support(risk_info, profile):
     print()
 
 
-
-def calculate_bmr(gender, weight, height, age):
-    """
-    ハリス・ベネディクト方式（改良版）で基礎代謝量（BMR）を計算
-
-    Args:
-        gender (str): 性別（"男性" または "女性"）
-        weight (float): 体重（kg）
-        height (float): 身長（cm）
-        age (int): 年齢
-
-    Returns:
-        float: 基礎代謝量（kcal/日）
-    """
-    if gender == "男性":
-        # 男性: (13.397×体重kg)+(4.799×身長cm)-(5.677×年齢)+88.362
-        bmr = (13.397 * weight) + (4.799 * height) - (5.677 * age) + 88.362
-    else:  # 女性
-        # 女性: (9.247×体重kg)+(3.098×身長cm)-(4.330×年齢)+447.593
-        bmr = (9.247 * weight) + (3.098 * height) - (4.330 * age) + 447.593
-
-    return bmr
-
-
-def calculate_tdee(bmr, activity_coefficient):
-    """
-    総消費カロリー（TDEE）を計算
-
-    Args:
-        bmr (float): 基礎代謝量（kcal/日）
-        activity_coefficient (float): 活動レベル係数
-
-    Returns:
-        float: 総消費カロリー（kcal/日）
-    """
-    return bmr * activity_coefficient
-
-
 def create_nutrition_graphs(name, actual_calories, target_calories, actual_protein, target_protein,
                            actual_fat, target_fat, actual_carbs, target_carbs):
     """
@@ -497,78 +489,19 @@ def create_nutrition_graphs(name, actual_calories, target_calories, actual_prote
     Returns:
         str: グラフファイルのパス
     """
-    # 2つのサブプロットを作成（左：カロリー、右：PFC）
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
-
-    # === 左側：カロリー比較グラフ ===
-    categories = ['Calories']
-    actual_values = [actual_calories]
-    target_values = [target_calories]
-
-    x = range(len(categories))
-    width = 0.35
-
-    bars1 = ax1.bar([i - width/2 for i in x], actual_values, width, label='Actual', color='#FF6B6B', alpha=0.8)
-    bars2 = ax1.bar([i + width/2 for i in x], target_values, width, label='Target', color='#4ECDC4', alpha=0.8)
-
-    ax1.set_ylabel('kcal', fontsize=12)
-    ax1.set_title('Calorie Comparison', fontsize=14, fontweight='bold')
-    ax1.set_xticks(x)
-    ax1.set_xticklabels(categories)
-    ax1.legend()
-    ax1.grid(axis='y', alpha=0.3)
-
-    # 値をバーの上に表示
-    for bar in bars1:
-        height = bar.get_height()
-        ax1.text(bar.get_x() + bar.get_width()/2., height,
-                f'{int(height)}',
-                ha='center', va='bottom', fontsize=10)
-    for bar in bars2:
-        height = bar.get_height()
-        ax1.text(bar.get_x() + bar.get_width()/2., height,
-                f'{int(height)}',
-                ha='center', va='bottom', fontsize=10)
-
-    # === 右側：PFC比較グラフ ===
-    if actual_protein is not None and actual_fat is not None and actual_carbs is not None:
-        pfc_categories = ['Protein (g)', 'Fat (g)', 'Carbs (g)']
-        actual_pfc = [actual_protein, actual_fat, actual_carbs]
-        target_pfc = [target_protein, target_fat, target_carbs]
-
-        x2 = range(len(pfc_categories))
-
-        bars3 = ax2.bar([i - width/2 for i in x2], actual_pfc, width, label='Actual', color='#FF6B6B', alpha=0.8)
-        bars4 = ax2.bar([i + width/2 for i in x2], target_pfc, width, label='Target', color='#4ECDC4', alpha=0.8)
-
-        ax2.set_ylabel('grams', fontsize=12)
-        ax2.set_title('PFC Comparison', fontsize=14, fontweight='bold')
-        ax2.set_xticks(x2)
-        ax2.set_xticklabels(pfc_categories)
-        ax2.legend()
-        ax2.grid(axis='y', alpha=0.3)
-
-        # 値をバーの上に表示
-        for bar in bars3:
-            height = bar.get_height()
-            ax2.text(bar.get_x() + bar.get_width()/2., height,
-                    f'{height:.1f}',
-                    ha='center', va='bottom', fontsize=10)
-        for bar in bars4:
-            height = bar.get_height()
-            ax2.text(bar.get_x() + bar.get_width()/2., height,
-                    f'{height:.1f}',
-                    ha='center', va='bottom', fontsize=10)
-
-    plt.tight_layout()
+    # 左：カロリー、右：PFC の比較グラフを描画（pyplotを使わずPNGを直接生成）
+    png_bytes = render_nutrition_chart(
+        actual_calories, target_calories, actual_protein, target_protein,
+        actual_fat, target_fat, actual_carbs, target_carbs
+    )
 
     # ファイル名を生成
     filename = f"nutrition_comparison_{name}.png"
     filepath = os.path.join(os.getcwd(), filename)
 
     # グラフを保存
-    plt.savefig(filepath, dpi=150, bbox_inches='tight')
-    plt.close()
+    with open(filepath, "wb") as f:
+        f.write(png_bytes)
 
     return filepath
 
@@ -1347,57 +1280,6 @@ def print_comparison_table(actual_calories, target_calories, actual_protein, tar
     print()
 
 
-def calculate_target_calories_and_pfc(profile):
-    """
-    目標カロリーとPFCバランスを計算
-
-    Args:
-        profile (dict): プロフィール情報
-
-    Returns:
-        dict: 目標カロリー、P/F/C（g）
-    """
-    # 基礎代謝量を計算
-    bmr = calculate_bmr(
-        profile["gender"],
-        profile["current_weight"],
-        profile["height"],
-        profile["age"]
-    )
-
-    # 総消費カロリー（TDEE）を計算
-    tdee = calculate_tdee(bmr, profile["activity_coefficient"])
-
-    # ダイエットモードに応じたカロリー調整
-    # 月に体重の2%（ライトモード）または4%（ハードモード）を減らすための1日あたりのカロリー不足を計算
-    # 脂肪1kg = 約7200kcal
-    weight_loss_per_month = profile["current_weight"] * profile["reduction_rate"]
-    weight_loss_per_day = weight_loss_per_month / 30
-    calorie_deficit_per_day = weight_loss_per_day * 7200
-
-    # 目標カロリー = TDEE - カロリー不足
-    target_calories = tdee - calorie_deficit_per_day
-
-    # PFCバランスを計算（P:30%, F:20%, C:50%）
-    protein_calories = target_calories * 0.30
-    fat_calories = target_calories * 0.20
-    carbs_calories = target_calories * 0.50
-
-    # カロリーをグラムに変換（P:4kcal/g, F:9kcal/g, C:4kcal/g）
-    protein_grams = protein_calories / 4
-    fat_grams = fat_calories / 9
-    carbs_grams = carbs_calories / 4
-
-    return {
-        "bmr": bmr,
-        "tdee": tdee,
-        "target_calories": target_calories,
-        "protein": protein_grams,
-        "fat": fat_grams,
-        "carbs": carbs_grams
-    }
-
-
 def select_plan():
     """
     プランを選択する（現在は990円プランのみ）
@@ -1681,6 +1563,9 @@ def show_profile_summary(profile):
     while True:
 
         if choice == "1":
+            # 画像解析モジュール（Gemini・PIL）は使うときだけ読み込む
+            from food_analyzer import analyze_food_image, get_image_path_from_user
+
             # 画像アップロード
             image_path = get_image_path_from_user()
 
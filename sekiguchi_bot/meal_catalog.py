@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+メニュー例の索引
+メニュー表を1回だけ変更不可のカタログに組み立て、カロリー順の配列による範囲検索、
+(カロリー, P, F, C) 空間での近いメニューの検索、1日3食の組み合わせ検索を行う
+
+コンビニ商品など数千件のカタログでも1回の提案が数ミリ秒で済むことを確認できる:
+    python meal_catalog.py --benchmark 5000
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import namedtuple
+from functools import lru_cache
+from itertools import combinations
+
+import numpy as np
+
+# 共有の計算パッケージ（リポジトリ直下の nutrition_core）をインポートできるようにする
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nutrition_core import KCAL_PER_GRAM
+
+
+Meal = namedtuple('Meal', 'name calories protein fat carbs description category')
+
+# 1日の組み合わせ: meals（Mealのタプル）, 合計のカロリー・PFC, distance（目標との距離）
+DayPlan = namedtuple('DayPlan', 'meals calories protein fat carbs distance')
+
+MEALS_PER_DAY = 3
+
+
+def _features(nutrients):
+    """
+    (カロリー, P, F, C) を距離計算用の特徴量にする
+
+    PFCはグラム数のままだと脂質の差が小さく見えるため、カロリーに換算して単位をそろえる。
+    """
+    return nutrients * np.array([1.0, KCAL_PER_GRAM[0], KCAL_PER_GRAM[1], KCAL_PER_GRAM[2]])
+
+
+@lru_cache(maxsize=None)
+def _combination_indices(size, count):
+    """size 件から count 件を選ぶ組み合わせの添字（読み取り専用の配列、使い回す）"""
+    indices = np.array(list(combinations(range(size), count)), dtype=np.intp).reshape(-1, count)
+    indices.setflags(write=False)
+    return indices
+
+
+class MealCatalog:
+    """変更不可のメニューカタログと検索用の索引"""
+
+    def __init__(self, meals):
+        """
+        カタログと索引を組み立てる（初期化時の1回のみ）
+
+        Args:
+            meals (iterable): Meal の並び
+        """
+        self.meals = tuple(meals)
+        self.categories = tuple(sorted({meal.category for meal in self.meals}))
+
+        nutrients = np.array(
+            [(meal.calories, meal.protein, meal.fat, meal.carbs) for meal in self.meals],
+            dtype=float
+        ).reshape(-1, 4)
+        self._features = _features(nutrients)
+        self._features.setflags(write=False)
+
+        # カテゴリごと（None は全件）にカロリー順の添字と、その順に並べたカロリー
+        self._by_calories = {}
+        category_of = np.array([meal.category for meal in self.meals], dtype=object)
+        for category in (None,) + self.categories:
+            if category is None:
+                members = np.arange(len(self.meals))
+            else:
+                members = np.flatnonzero(category_of == category)
+            order = members[np.argsort(nutrients[members, 0], kind='stable')]
+            sorted_calories = nutrients[order, 0]
+            order.setflags(write=False)
+            sorted_calories.setflags(write=False)
+            self._by_calories[category] = (order, sorted_calories)
+
+    @classmethod
+    def from_examples(cls, examples):
+        """
+        get_meal_examples() 形式の辞書からカタログを作る
+
+        Args:
+            examples (dict): {カテゴリ名: [{name, calories, protein, fat, carbs, description}, ...]}
+
+        Returns:
+            MealCatalog: カタログ
+        """
+        return cls(
+            Meal(item['name'], item['calories'], item['protein'], item['fat'], item['carbs'],
+                 item.get('description', ''), category)
+            for category, items in examples.items()
+            for item in items
+        )
+
+    def __len__(self):
+        return len(self.meals)
+
+    def _calorie_index(self, category):
+        """カテゴリのカロリー順の添字とカロリー（存在しないカテゴリは ValueError）"""
+        try:
+            return self._by_calories[category]
+        except KeyError:
+            raise ValueError(
+                f"不明なカテゴリです: {category!r}（{', '.join(self.categories)} のいずれか、または None）"
+            ) from None
+
+    def _calorie_range_indices(self, low, high, category=None):
+        """カロリーが low 以上 high 以下のメニューの添字（カロリー順）"""
+        order, sorted_calories = self._calorie_index(category)
+        start = np.searchsorted(sorted_calories, low, side='left')
+        end = np.searchsorted(sorted_calories, high, side='right')
+        return order[start:end]
+
+    def in_calorie_range(self, low, high, category=None):
+        """
+        カロリーの範囲でメニューを検索
+
+        Args:
+            low (float): 下限（kcal、含む）
+            high (float): 上限（kcal、含む）
+            category (str, optional): カテゴリ（省略時は全カテゴリ）
+
+        Returns:
+            list[Meal]: カロリーの低い順
+
+        Raises:
+            ValueError: category がカタログにないカテゴリの場合
+        """
+        return [self.meals[i] for i in self._calorie_range_indices(low, high, category)]
+
+    def _nearest_indices(self, target, k, category=None, max_calorie_gap=None):
+        """目標の特徴量に近い順の添字と距離"""
+        if max_calorie_gap is None:
+            candidates = self._calorie_index(category)[0]
+        else:
+            candidates = self._calorie_range_indices(
+                target[0] - max_calorie_gap, target[0] + max_calorie_gap, category
+            )
+        if len(candidates) == 0 or k <= 0:
+            return candidates[:0], np.empty(0)
+
+        diff = self._features[candidates] - target
+        distances = np.einsum('ij,ij->i', diff, diff)
+        if k < len(candidates):
+            nearest = np.argpartition(distances, k - 1)[:k]
+        else:
+            nearest = np.arange(len(candidates))
+        nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+        return candidates[nearest], np.sqrt(distances[nearest])
+
+    def nearest(self, calories, protein, fat, carbs, k=5, category=None, max_calorie_gap=None):
+        """
+        目標のカロリー・PFCに近いメニューを検索（k近傍）
+
+        Args:
+            calories, protein, fat, carbs (float): 1食の目標（kcal・g）
+            k (int): 返す件数
+            category (str, optional): カテゴリ（省略時は全カテゴリ）
+            max_calorie_gap (float, optional): 目標カロリーとの差の上限（kcal）
+
+        Returns:
+            list[Meal]: 近い順
+
+        Raises:
+            ValueError: category がカタログにないカテゴリの場合
+        """
+        target = _features(np.array([calories, protein, fat, carbs], dtype=float))
+        indices, _ = self._nearest_indices(target, k, category, max_calorie_gap)
+        return [self.meals[i] for i in indices]
+
+    def day_plans(self, calories, protein, fat, carbs, k=3, candidates=30, category=None):
+        """
+        1日の目標に合う3食の組み合わせを検索
+
+        1食分の目標（1日の目標の1/3）に近い candidates 件に絞り、
+        その中の全ての組み合わせの合計を配列でまとめて目標と比べる。
+
+        Args:
+            calories, protein, fat, carbs (float): 1日の目標（kcal・g）
+            k (int): 返す組み合わせの数
+            candidates (int): 組み合わせを作るメニューの数
+            category (str, optional): カテゴリ（省略時は全カテゴリから組み合わせる）
+
+        Returns:
+            list[DayPlan]: 目標に近い順
+
+        Raises:
+            ValueError: category がカタログにないカテゴリの場合
+        """
+        daily = _features(np.array([calories, protein, fat, carbs], dtype=float))
+        pool, _ = self._nearest_indices(daily / MEALS_PER_DAY, candidates, category)
+        if len(pool) < MEALS_PER_DAY:
+            return []
+
+        combos = pool[_combination_indices(len(pool), MEALS_PER_DAY)]
+        totals = self._features[combos].sum(axis=1)
+        diff = totals - daily
+        distances = np.einsum('ij,ij->i', diff, diff)
+        k = min(k, len(combos))
+        best = np.argpartition(distances, k - 1)[:k]
+        best = best[np.argsort(distances[best], kind='stable')]
+
+        plans = []
+        for i in best:
+            meals = tuple(self.meals[j] for j in combos[i])
+            plans.append(DayPlan(
+                meals,
+                sum(meal.calories for meal in meals),
+                sum(meal.protein for meal in meals),
+                sum(meal.fat for meal in meals),
+                sum(meal.carbs for meal in meals),
+                float(np.sqrt(distances[i])),
+            ))
+        return plans
+
+
+def synthetic_catalog(count, seed=0):
+    """
+    ベンチマーク用の合成カタログ（コンビニ商品を想定した件数・値の幅）
+
+    Args:
+        count (int): メニューの数
+        seed (int): 乱数のシード
+
+    Returns:
+        MealCatalog: カタログ
+    """
+    rng = np.random.default_rng(seed)
+    protein = rng.uniform(5, 50, count).round()
+    fat = rng.uniform(2, 30, count).round()
+    carbs = rng.uniform(10, 100, count).round()
+    calories = (protein * KCAL_PER_GRAM[0] + fat * KCAL_PER_GRAM[1] + carbs * KCAL_PER_GRAM[2]).round()
+    category = rng.choice(['convenience', 'homemade'], count)
+    return MealCatalog(
+        Meal(f"メニュー{i}", calories[i], protein[i], fat[i], carbs[i], '', category[i])
+        for i in range(count)
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='メニュー検索のベンチマーク')
+    parser.add_argument('--benchmark', type=int, default=5000, help='合成カタログのメニュー数')
+    parser.add_argument('--queries', type=int, default=200, help='検索の回数')
+    parser.add_argument('--budget-ms', type=float, default=5.0, help='1回の提案にかけてよい時間（ミリ秒）')
+    args = parser.parse_args()
+
+    catalog = synthetic_catalog(args.benchmark)
+    rng = np.random.default_rng(1)
+    timings = []
+    for _ in range(args.queries):
+        daily = rng.uniform(1200, 2600)
+        protein, fat, carbs = daily * 0.30 / 4, daily * 0.20 / 9, daily * 0.50 / 4
+        start = time.perf_counter()
+        # suggest_meal_examples と同じ検索（カテゴリごとの近傍5件 + 1日の組み合わせ）
+        for category in catalog.categories:
+            catalog.nearest(daily / MEALS_PER_DAY, protein / MEALS_PER_DAY, fat / MEALS_PER_DAY,
+                            carbs / MEALS_PER_DAY, k=5, category=category, max_calorie_gap=150)
+        catalog.day_plans(daily, protein, fat, carbs)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    p50 = timings[len(timings) // 2]
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"📊 カタログ{len(catalog)}件・検索{args.queries}回: 中央値 {p50:.2f}ms / 95% {p95:.2f}ms"
+          f"（予算 {args.budget_ms:.1f}ms）")
+    if p95 > args.budget_ms:
+        print("⚠️ 提案の時間が予算を超えています")
+        sys.exit(1)
+    print("✅ 提案の時間は予算内です")
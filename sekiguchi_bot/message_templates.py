@@ -628,3 +628,25 @@ ADVICE_BY_CATEGORY = {
     "睡眠・休息": ADVICE_SLEEP,
     "一般的な励まし": ADVICE_GENERAL
 }
+
+# ===================================================================
+# カテゴリ分類用キーワード
+# （「一般的な励まし」はどれにも該当しない場合のカテゴリ）
+# ===================================================================
+CATEGORY_KEYWORDS = {
+    "食事・栄養": ["食事", "栄養", "カロリー", "タンパク質", "脂質", "炭水化物",
+                  "PFC", "食べ", "食べる", "食べた", "食べて", "間食", "おやつ",
+                  "朝食", "昼食", "夕食", "夜食", "飲み", "飲む"],
+    "運動・トレーニング": ["運動", "トレーニング", "筋トレ", "有酸素", "ジョギング",
+                         "ウォーキング", "ジム", "筋肉", "スクワット", "腕立て",
+                         "プランク", "ストレッチ", "走る", "歩く"],
+    "モチベーション・メンタル": ["モチベーション", "やる気", "続かない", "挫折",
+                               "辛い", "つらい", "難しい", "できない", "無理",
+                               "心", "メンタル", "気持ち", "不安", "心配"],
+    "停滞期": ["停滞", "減らない", "変わらない", "痩せない", "体重が", "変化"],
+    "体重増加・リバウンド": ["増えた", "太った", "リバウンド", "戻った", "増加"],
+    "時間管理": ["時間", "忙しい", "できない", "余裕", "仕事", "予定"],
+    "付き合い・外食": ["外食", "飲み会", "付き合い", "誘われ", "断れ", "会食",
+                     "デート", "友達", "家族"],
+    "睡眠・休息": ["睡眠", "眠", "寝", "疲れ", "休息", "休み", "疲労"],
+}
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+質問分類結果のキャッシュ
+表記ゆれを正規化した質問文をキーに、分類結果をLRU＋TTLで保持する
+"""
+
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+# カタカナ（ァ〜ヶ）をひらがなに変換するテーブル
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord("ァ"), ord("ヶ") + 1)}
+
+
+def normalize_question(question):
+    """
+    質問文を正規化する
+
+    - NFKC正規化（全角英数・半角カナなどを統一）
+    - 小文字化
+    - カタカナをひらがなに変換
+    - 空白・句読点・記号を除去
+
+    例: 「停滞期、どうしたらいい？」と「停滞期どうしたらいい?」は同じキーになる
+
+    Args:
+        question (str): 質問文
+
+    Returns:
+        str: 正規化した文字列
+    """
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = text.translate(_KATAKANA_TO_HIRAGANA)
+    return "".join(
+        char for char in text
+        if unicodedata.category(char)[0] not in ("Z", "P", "S", "C")
+    )
+
+
+class ClassificationCache:
+    """件数上限（LRU）と有効期限（TTL）つきの分類結果キャッシュ"""
+
+    def __init__(self, max_entries=10000, ttl_seconds=24 * 60 * 60):
+        """
+        初期化
+
+        Args:
+            max_entries (int): 最大件数（超えたら最も古く使われたものから削除）
+            ttl_seconds (float): 有効期限（秒）
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, question):
+        """
+        分類結果を取得
+
+        Args:
+            question (str): 質問文（正規化前）
+
+        Returns:
+            str or None: カテゴリ名（キャッシュにない場合はNone）
+        """
+        key = normalize_question(question)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, question, category, ttl_seconds=None):
+        """
+        分類結果を保存
+
+        Args:
+            question (str): 質問文（正規化前）
+            category (str): カテゴリ名
+            ttl_seconds (float, optional): この結果の有効期限（秒、省略時は ttl_seconds）
+        """
+        key = normalize_question(question)
+        if ttl_seconds is None:
+            ttl_seconds = self.ttl_seconds
+        with self._lock:
+            self._entries[key] = (category, time.monotonic() + ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """
+        キャッシュの統計情報
+
+        Returns:
+            dict: hits, misses, hit_rate, entries
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+            }
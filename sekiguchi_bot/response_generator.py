@@ -7,29 +7,67 @@
 
 import random
 import os
-import google.generativeai as genai
+import sys
 from message_templates import (
     CATEGORIES,
     GREETINGS,
     EMPATHY,
     ADVICE_BY_CATEGORY,
     ENCOURAGEMENT,
-    CLOSINGS
+    CLOSINGS,
+    CATEGORY_KEYWORDS
 )
+from keyword_classifier import KeywordClassifier
+from question_cache import ClassificationCache
+
+
+# キーワード分類器（モジュール読み込み時に1度だけ構築）
+KEYWORD_CLASSIFIER = KeywordClassifier(CATEGORY_KEYWORDS, default_category="一般的な励まし")
+
+
+def _compile_fragments(fragments):
+    """テンプレートのパーツをintern済みの文字列タプルに変換"""
+    return tuple(sys.intern(fragment) for fragment in fragments)
+
+
+# 返信組み立て用のテーブル（モジュール読み込み時に1度だけ構築）
+GREETING_TABLE = _compile_fragments(GREETINGS)
+EMPATHY_TABLE = _compile_fragments(EMPATHY)
+ENCOURAGEMENT_TABLE = _compile_fragments(ENCOURAGEMENT)
+CLOSING_TABLE = _compile_fragments(CLOSINGS)
+ADVICE_TABLE = {
+    category: _compile_fragments(ADVICE_BY_CATEGORY[category])
+    for category in CATEGORIES
+}
+
+# カテゴリごとの組み合わせパターン数
+PATTERN_COUNTS = {
+    category: (len(GREETING_TABLE) * len(EMPATHY_TABLE) * len(ADVICE_TABLE[category]) *
+               len(ENCOURAGEMENT_TABLE) * len(CLOSING_TABLE))
+    for category in CATEGORIES
+}
+PATTERN_COUNTS_WITH_TOTAL = dict(PATTERN_COUNTS, 合計=sum(PATTERN_COUNTS.values()))
 
 
 class ResponseGenerator:
     """自動返信メッセージ生成クラス"""
 
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, cache_size=10000, cache_ttl=24 * 60 * 60, fallback_cache_ttl=60):
         """
         初期化
 
         Args:
             api_key (str, optional): Google Gemini APIキー
+            cache_size (int): 分類結果キャッシュの最大件数
+            cache_ttl (float): 分類結果キャッシュの有効期限（秒）
+            fallback_cache_ttl (float): AI分類に失敗してキーワードで分類した結果の有効期限（秒）
         """
+        self.classification_cache = ClassificationCache(cache_size, cache_ttl)
+        self.fallback_cache_ttl = fallback_cache_ttl
         self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
         if self.api_key:
+            # Geminiクライアントは重いので、APIキーがあるときだけ読み込む
+            import google.generativeai as genai
             genai.configure(api_key=self.api_key)
             self.model = genai.GenerativeModel('gemini-1.5-flash')
         else:
@@ -38,7 +76,12 @@ class ResponseGenerator:
 
     def classify_question(self, question):
         """
-        質問をカテゴリに分類する（AI使用）
+        質問をカテゴリに分類する
+
+        キーワードで確信度の高い分類ができればそれを返し、
+        判断が難しい質問だけAIで分類する。
+        表記ゆれだけが違う質問は、キャッシュした分類結果を返す。
+        AIの呼び出しに失敗したときのキーワード分類は、APIの復旧後にAIで分類し直せるよう短い期間だけキャッシュする。
 
         Args:
             question (str): ユーザーの質問・悩み
@@ -46,9 +89,36 @@ class ResponseGenerator:
         Returns:
             str: カテゴリ名
         """
-        if self.model is None:
-            # APIキーがない場合はキーワードマッチング
-            return self._classify_by_keyword(question)
+        category = self.classification_cache.get(question)
+        if category is None:
+            category, ai_failed = self._classify_uncached(question)
+            ttl = self.fallback_cache_ttl if ai_failed else None
+            self.classification_cache.put(question, category, ttl)
+        return category
+
+    def get_cache_stats(self):
+        """
+        分類結果キャッシュのヒット・ミス数を取得
+
+        Returns:
+            dict: hits, misses, hit_rate, entries
+        """
+        return self.classification_cache.stats()
+
+    def _classify_uncached(self, question):
+        """
+        キャッシュを使わずに質問を分類する
+
+        Args:
+            question (str): ユーザーの質問・悩み
+
+        Returns:
+            tuple: (カテゴリ名, AIの呼び出しに失敗してキーワードで分類したかどうか)
+        """
+        # まずはキーワードで分類し、確信度が高ければAIを呼ばない
+        category, confidence = KEYWORD_CLASSIFIER.classify(question)
+        if self.model is None or KEYWORD_CLASSIFIER.is_confident(confidence):
+            return category, False
 
         try:
             # AIで分類
@@ -78,15 +148,15 @@ class ResponseGenerator:
 
             # カテゴリが有効かチェック
             if category in CATEGORIES:
-                return category
+                return category, False
             else:
                 # 無効な場合はキーワードマッチング
-                return self._classify_by_keyword(question)
+                return self._classify_by_keyword(question), False
 
         except Exception as e:
             print(f"⚠️ AI分類に失敗しました: {e}")
             # エラー時はキーワードマッチング
-            return self._classify_by_keyword(question)
+            return self._classify_by_keyword(question), True
 
     def _classify_by_keyword(self, question):
         """
@@ -98,35 +168,8 @@ class ResponseGenerator:
         Returns:
             str: カテゴリ名
         """
-        question_lower = question.lower()
-
-        # キーワード定義
-        keywords = {
-            "食事・栄養": ["食事", "栄養", "カロリー", "タンパク質", "脂質", "炭水化物",
-                          "PFC", "食べ", "食べる", "食べた", "食べて", "間食", "おやつ",
-                          "朝食", "昼食", "夕食", "夜食", "飲み", "飲む"],
-            "運動・トレーニング": ["運動", "トレーニング", "筋トレ", "有酸素", "ジョギング",
-                                 "ウォーキング", "ジム", "筋肉", "スクワット", "腕立て",
-                                 "プランク", "ストレッチ", "走る", "歩く"],
-            "モチベーション・メンタル": ["モチベーション", "やる気", "続かない", "挫折",
-                                       "辛い", "つらい", "難しい", "できない", "無理",
-                                       "心", "メンタル", "気持ち", "不安", "心配"],
-            "停滞期": ["停滞", "減らない", "変わらない", "痩せない", "体重が", "変化"],
-            "体重増加・リバウンド": ["増えた", "太った", "リバウンド", "戻った", "増加"],
-            "時間管理": ["時間", "忙しい", "できない", "余裕", "仕事", "予定"],
-            "付き合い・外食": ["外食", "飲み会", "付き合い", "誘われ", "断れ", "会食",
-                             "デート", "友達", "家族"],
-            "睡眠・休息": ["睡眠", "眠", "寝", "疲れ", "休息", "休み", "疲労"],
-        }
-
-        # 各カテゴリのキーワードをチェック
-        for category, words in keywords.items():
-            for word in words:
-                if word in question_lower:
-                    return category
-
-        # どのカテゴリにも該当しない場合
-        return "一般的な励まし"
+        category, _ = KEYWORD_CLASSIFIER.classify(question)
+        return category
 
     def generate_response(self, question, user_name=None):
         """
@@ -143,31 +186,23 @@ class ResponseGenerator:
         category = self.classify_question(question)
 
         # 各パーツをランダムに選択
-        greeting = random.choice(GREETINGS)
-        empathy = random.choice(EMPATHY)
-        advice = random.choice(ADVICE_BY_CATEGORY[category])
-        encouragement = random.choice(ENCOURAGEMENT)
-        closing = random.choice(CLOSINGS)
-
-        # メッセージを組み立て
-        message_parts = []
+        greeting = random.choice(GREETING_TABLE)
+        empathy = random.choice(EMPATHY_TABLE)
+        advice = random.choice(ADVICE_TABLE[category])
+        encouragement = random.choice(ENCOURAGEMENT_TABLE)
+        closing = random.choice(CLOSING_TABLE)
 
         # 名前がある場合は挨拶に追加
         if user_name:
-            message_parts.append(f"{user_name}さん、{greeting}")
+            greeting_line = f"{user_name}さん、{greeting}"
         else:
-            message_parts.append(greeting)
-
-        message_parts.append(empathy)
-        message_parts.append(advice)
-        message_parts.append(encouragement)
-        message_parts.append(closing)
+            greeting_line = greeting
 
         # 改行で結合
-        message = "\n\n".join(message_parts)
+        message = "\n\n".join((greeting_line, empathy, advice, encouragement, closing))
 
-        # パターン数を計算
-        pattern_count = self._calculate_pattern_count(category)
+        # パターン数（事前計算済み）
+        pattern_count = PATTERN_COUNTS[category]
 
         return {
             "category": category,
@@ -180,9 +215,43 @@ class ResponseGenerator:
             "closing": closing
         }
 
+    def generate_responses(self, question, count, user_name=None, category=None):
+        """
+        同じ質問に対する返信メッセージをまとめて生成（負荷テスト・事前生成用）
+
+        分類は1回だけ行い、各パーツは random.choices でまとめて選ぶ。
+
+        Args:
+            question (str): ユーザーの質問・悩み
+            count (int): 生成する件数
+            user_name (str, optional): ユーザー名（あれば名前入り返信）
+            category (str, optional): カテゴリ（指定した場合は分類をスキップ）
+
+        Returns:
+            list[str]: 返信メッセージのリスト
+        """
+        if category is None:
+            category = self.classify_question(question)
+
+        greetings = random.choices(GREETING_TABLE, k=count)
+        if user_name:
+            prefix = f"{user_name}さん、"
+            greetings = [prefix + greeting for greeting in greetings]
+
+        return [
+            "\n\n".join(parts)
+            for parts in zip(
+                greetings,
+                random.choices(EMPATHY_TABLE, k=count),
+                random.choices(ADVICE_TABLE[category], k=count),
+                random.choices(ENCOURAGEMENT_TABLE, k=count),
+                random.choices(CLOSING_TABLE, k=count),
+            )
+        ]
+
     def _calculate_pattern_count(self, category):
         """
-        指定カテゴリの組み合わせパターン数を計算
+        指定カテゴリの組み合わせパターン数を取得
 
         Args:
             category (str): カテゴリ名
@@ -190,35 +259,16 @@ class ResponseGenerator:
         Returns:
             int: パターン数
         """
-        greeting_count = len(GREETINGS)
-        empathy_count = len(EMPATHY)
-        advice_count = len(ADVICE_BY_CATEGORY[category])
-        encouragement_count = len(ENCOURAGEMENT)
-        closing_count = len(CLOSINGS)
-
-        total = (greeting_count * empathy_count * advice_count *
-                 encouragement_count * closing_count)
-
-        return total
+        return PATTERN_COUNTS[category]
 
     def get_total_pattern_count(self):
         """
-        全カテゴリの合計パターン数を計算
+        全カテゴリの合計パターン数を取得
 
         Returns:
             dict: カテゴリごとのパターン数と合計
         """
-        result = {}
-        total = 0
-
-        for category in CATEGORIES:
-            count = self._calculate_pattern_count(category)
-            result[category] = count
-            total += count
-
-        result["合計"] = total
-
-        return result
+        return dict(PATTERN_COUNTS_WITH_TOTAL)
 
 
 def demo():